@@ -0,0 +1,48 @@
+import argparse
+import json
+from dataclasses import asdict
+from benchmarks.generators import SIZES
+from benchmarks.pipeline import BenchmarkOptions, format_results, run
+
+'''
+@docs
+Offline benchmarks for the extract and transform stages.
+
+    python -m benchmarks                                   # every stage on 1k orders
+    python -m benchmarks --size 100k --stage 'shopify.*'
+    python -m benchmarks --size 1m --stage '*.transform*' --alloc-pages 0
+    python -m benchmarks --size 100k --stage '*.extract*' --latency 0.05 --json
+'''
+
+
+def _count(value):
+    return SIZES[value.lower()] if value.lower() in SIZES else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Offline benchmarks for the extract and transform stages")
+    parser.add_argument("--size", dest="sizes", type=_count, action="append", help="1k, 100k, 1m or an order count, repeatable (default 1k)")
+    parser.add_argument("--stage", dest="stages", action="append", help="Stage name or glob, repeatable (default every stage)")
+    parser.add_argument("--max-line-items", type=int, default=10, help="Line items per order are drawn from 1..N")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--alloc-pages", type=int, default=20, help="Pages traced with tracemalloc per stage, 0 to skip")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake servers wait before each response")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    options = BenchmarkOptions(
+        seed=args.seed,
+        max_line_items=args.max_line_items,
+        alloc_pages=args.alloc_pages,
+        latency=args.latency,
+    )
+    results = run(args.stages or ["*"], args.sizes or [SIZES["1k"]], options)
+    if args.json:
+        for result in results:
+            print(json.dumps({**asdict(result), "orders_per_sec": result.orders_per_sec}))
+    else:
+        print(format_results(results))
+
+
+if __name__ == "__main__":
+    main()
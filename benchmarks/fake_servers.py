@@ -0,0 +1,231 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from benchmarks.generators import amazon_page, iter_shopify_pages, shopify_page
+
+'''
+@docs
+Local stand-ins for the Shopify Admin GraphQL API and the Amazon SP-API, served from a background
+thread with the standard library so extraction can be benchmarked without network access.
+
+    with FakeShopifyServer(order_count=100_000) as server:
+        client = ShopifyClient(..., base_url=server.graphql_url)
+
+    with FakeAmazonServer(order_count=100_000) as server:
+        request = AmazonOrderRequest(..., endpoint=server.url, token_url=server.token_url)
+
+Both servers answer with the same synthetic orders as benchmarks.generators, page by page, and
+can add a fixed latency per request to approximate a real round trip.
+'''
+
+SHOPIFY_GRAPHQL_PATH = "/admin/api/2025-01/graphql.json"
+SHOPIFY_BULK_OPERATION_ID = "gid://shopify/BulkOperation/1"
+AMAZON_RATE_LIMIT = "10000"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_not_found(self):
+        self._send_json({"errors": f"Unknown path {self.path}"}, status=404)
+
+    def _delay(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+
+class _FakeServer:
+
+    handler_class = _Handler
+
+    def __init__(self, order_count, seed=0, latency=0.0):
+        self.order_count = order_count
+        self.seed = seed
+        self.latency = latency
+        self.requests = 0
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class)
+        self._httpd.daemon_threads = True
+        # Handlers reach the server's settings through self.server
+        self._httpd.fake = self
+        self._httpd.latency = self.latency
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _ShopifyHandler(_Handler):
+
+    def do_POST(self):
+        if urlparse(self.path).path != SHOPIFY_GRAPHQL_PATH:
+            return self._send_not_found()
+        fake = self.server.fake
+        fake.requests += 1
+        self._delay()
+        query = json.loads(self._read_body() or b"{}").get("query", "")
+        if "bulkOperationRunQuery" in query:
+            data = {"bulkOperationRunQuery": {
+                "bulkOperation": {"id": SHOPIFY_BULK_OPERATION_ID, "status": "CREATED"},
+                "userErrors": [],
+            }}
+        elif "BulkOperation" in query:
+            data = {"node": {
+                "id": SHOPIFY_BULK_OPERATION_ID,
+                "status": "COMPLETED",
+                "errorCode": None,
+                "objectCount": str(fake.order_count),
+                "url": f"{fake.url}/bulk.jsonl",
+                "partialDataUrl": None,
+            }}
+        else:
+            data = {"orders": fake.orders_page(query)}
+        self._send_json({"data": data, "extensions": {"cost": fake.cost()}})
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/bulk.jsonl":
+            return self._send_not_found()
+        fake = self.server.fake
+        fake.requests += 1
+        self._delay()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/jsonl")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in fake.bulk_chunks():
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeShopifyServer(_FakeServer):
+    """
+    Serves cursor-paginated orders queries, a bulk operation that completes immediately, and
+    its JSONL export. Every response reports a full cost bucket so the client never throttles.
+    """
+
+    handler_class = _ShopifyHandler
+
+    def __init__(self, order_count, seed=0, latency=0.0, max_line_items=10):
+        super().__init__(order_count, seed=seed, latency=latency)
+        self.max_line_items = max_line_items
+
+    @property
+    def graphql_url(self):
+        return f"{self.url}{SHOPIFY_GRAPHQL_PATH}"
+
+    def cost(self):
+        return {
+            "requestedQueryCost": 100,
+            "actualQueryCost": 100,
+            "throttleStatus": {"maximumAvailable": 2000.0, "currentlyAvailable": 2000, "restoreRate": 100.0},
+        }
+
+    def orders_page(self, query):
+        first = int(re.search(r"first:\s*(\d+)", query).group(1))
+        after = re.search(r'after:\s*"([^"]*)"', query)
+        offset = int(after.group(1)) if after else 0
+        nodes = shopify_page(offset // first, first, self.order_count, self.seed, self.max_line_items)
+        end = offset + len(nodes)
+        return {
+            "nodes": nodes,
+            "pageInfo": {
+                "hasNextPage": end < self.order_count,
+                "endCursor": str(end),
+                "hasPreviousPage": offset > 0,
+                "startCursor": str(offset),
+            },
+        }
+
+    def bulk_chunks(self, page_size=250):
+        # Bulk exports flatten nested connections into lines that point at their parent
+        for page in iter_shopify_pages(self.order_count, page_size, self.seed, self.max_line_items):
+            lines = []
+            for order in page:
+                edges = order.pop("lineItems")["edges"]
+                lines.append(json.dumps(order))
+                lines.extend(json.dumps({**edge["node"], "__parentId": order["id"]}) for edge in edges)
+            yield ("\n".join(lines) + "\n").encode()
+
+
+class _AmazonHandler(_Handler):
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/auth/o2/token":
+            return self._send_not_found()
+        self._read_body()
+        self.server.fake.requests += 1
+        self._delay()
+        self._send_json({"access_token": "Atza|benchmark", "token_type": "bearer", "expires_in": 3600})
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path != "/orders/v0/orders":
+            return self._send_not_found()
+        fake = self.server.fake
+        fake.requests += 1
+        self._delay()
+        params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        # Advertise a rate high enough that the client's limiter never paces the benchmark
+        self._send_json({"payload": fake.orders_page(params)}, headers={"x-amzn-RateLimit-Limit": AMAZON_RATE_LIMIT})
+
+
+class FakeAmazonServer(_FakeServer):
+    """
+    Serves the LWA token endpoint and NextToken-paginated getOrders. getOrders does not return
+    OrderItems, so orders are generated without them.
+    """
+
+    handler_class = _AmazonHandler
+
+    @property
+    def token_url(self):
+        return f"{self.url}/auth/o2/token"
+
+    def orders_page(self, params):
+        page_size = int(params.get("MaxResultsPerPage") or 100)
+        page_index = int(params.get("NextToken") or 0)
+        orders = amazon_page(page_index, page_size, self.order_count, self.seed, max_line_items=0)
+        payload = {"Orders": orders, "CreatedBefore": "2025-03-02T00:00:00Z"}
+        if (page_index + 1) * page_size < self.order_count:
+            payload["NextToken"] = str(page_index + 1)
+        return payload
@@ -0,0 +1,165 @@
+import random
+from datetime import datetime, timedelta
+
+'''
+@docs
+Deterministic synthetic orders in the shapes the extractors return: Shopify GraphQL order nodes
+and SP-API getOrders orders. Pages are generated independently from (seed, page index), so a
+1M order run never holds more than one page in memory and the fake servers can serve any page
+on demand.
+'''
+
+SIZES = {
+    "1k": 1_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+}
+
+SHOPIFY_MONEY_FIELDS = [
+    "totalDiscountsSet", "totalPriceSet", "totalReceivedSet", "totalRefundedSet",
+    "totalShippingPriceSet", "totalTaxSet", "totalTipReceivedSet", "currentCartDiscountAmountSet",
+    "currentShippingPriceSet", "currentSubtotalPriceSet", "currentTotalDiscountsSet",
+    "currentTotalTaxSet", "currentTotalPriceSet", "netPaymentSet", "currentTotalDutiesSet",
+    "currentTotalAdditionalFeesSet",
+]
+
+AMAZON_FLAG_FIELDS = [
+    "IsPremiumOrder", "IsPrime", "IsBusinessOrder", "IsReplacementOrder", "IsGlobalExpressEnabled",
+    "HasRegulatedItems", "IsISPU", "IsAccessPointOrder", "IsSoldByAB",
+]
+
+_EPOCH = datetime(2025, 1, 1)
+
+
+def _timestamp(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _money(rng):
+    return {"shopMoney": {"amount": f"{rng.uniform(0, 500):.2f}"}}
+
+
+def _page_rng(seed, page_index):
+    return random.Random(seed * 1_000_003 + page_index)
+
+
+def shopify_order(i, rng, max_line_items=10):
+    """Build one Shopify order node with between 1 and max_line_items line items."""
+    created = _EPOCH + timedelta(seconds=rng.randint(0, 60 * 86400))
+    order = {
+        "id": f"gid://shopify/Order/{i}",
+        "name": f"#{1000 + i}",
+        "createdAt": _timestamp(created),
+        "updatedAt": _timestamp(created + timedelta(hours=rng.randint(0, 72))),
+        "cancelledAt": None,
+        "cancelReason": None,
+        "currencyCode": "USD",
+        "currentSubtotalLineItemsQuantity": rng.randint(1, 20),
+        "discountCode": rng.choice([None, "WELCOME10"]),
+        "displayFinancialStatus": "PAID",
+        "displayFulfillmentStatus": "FULFILLED",
+        "dutiesIncluded": False,
+        "fullyPaid": True,
+        "note": None,
+        "paymentGatewayNames": ["shopify_payments"],
+        "processedAt": _timestamp(created),
+        "tags": ["bench"],
+        "taxesIncluded": False,
+        "taxExempt": False,
+        "unpaid": False,
+        "test": False,
+        "lineItems": {"edges": [
+            {"node": {
+                "id": f"gid://shopify/LineItem/{i}{n}",
+                "name": "Item",
+                "sku": f"SKU-{n}",
+                "title": "Item",
+                "quantity": rng.randint(1, 3),
+                "currentQuantity": 1,
+                "variantTitle": None,
+                "originalTotalSet": _money(rng),
+                "originalUnitPriceSet": _money(rng),
+                "totalDiscountSet": _money(rng),
+                "discountedUnitPriceAfterAllDiscountsSet": _money(rng),
+            }}
+            for n in range(rng.randint(1, max_line_items))
+        ]},
+    }
+    for field in SHOPIFY_MONEY_FIELDS:
+        order[field] = _money(rng)
+    return order
+
+
+def shopify_orders(count, seed=0, max_line_items=10):
+    rng = random.Random(seed)
+    return [shopify_order(i, rng, max_line_items) for i in range(count)]
+
+
+def shopify_page(page_index, page_size, count, seed=0, max_line_items=10):
+    """Return the orders of page `page_index` out of `count` orders split into `page_size` pages."""
+    rng = _page_rng(seed, page_index)
+    start = page_index * page_size
+    return [shopify_order(i, rng, max_line_items) for i in range(start, min(start + page_size, count))]
+
+
+def iter_shopify_pages(count, page_size=250, seed=0, max_line_items=10):
+    for page_index in range((count + page_size - 1) // page_size):
+        yield shopify_page(page_index, page_size, count, seed, max_line_items)
+
+
+def amazon_order(i, rng, max_line_items=10):
+    """Build one SP-API getOrders order. OrderItems is only set when enrichment has run."""
+    purchased = _EPOCH + timedelta(seconds=rng.randint(0, 60 * 86400))
+    shipped = rng.randint(0, 5)
+    order = {
+        "AmazonOrderId": f"{100 + i % 900:03d}-{i:07d}-{rng.randint(0, 9999999):07d}",
+        "PurchaseDate": _timestamp(purchased),
+        "LastUpdateDate": _timestamp(purchased + timedelta(hours=rng.randint(0, 72))),
+        "OrderStatus": rng.choice(["Shipped", "Unshipped", "Pending", "Canceled"]),
+        "OrderType": "StandardOrder",
+        "FulfillmentChannel": rng.choice(["AFN", "MFN"]),
+        "SalesChannel": "Amazon.com",
+        "ShipServiceLevel": "Std US D2D Dom",
+        "ShipmentServiceLevelCategory": "Standard",
+        "EarliestShipDate": _timestamp(purchased + timedelta(days=1)),
+        "LatestShipDate": _timestamp(purchased + timedelta(days=3)),
+        "NumberOfItemsShipped": shipped,
+        "NumberOfItemsUnshipped": rng.randint(0, 5 - shipped),
+        "PaymentMethod": "Other",
+        "PaymentMethodDetails": ["Standard"],
+        "MarketplaceId": "ATVPDKIKX0DER",
+        "SellerOrderId": f"{i:07d}",
+        "OrderTotal": {"CurrencyCode": "USD", "Amount": f"{rng.uniform(0, 500):.2f}"},
+        "BuyerInfo": {"BuyerEmail": f"buyer{i}@marketplace.amazon.com"},
+        "ShippingAddress": {
+            "StateOrRegion": rng.choice(["CA", "NY", "TX", "WA"]),
+            "PostalCode": f"{rng.randint(10000, 99999)}",
+            "City": "Seattle",
+            "CountryCode": "US",
+        },
+    }
+    for field in AMAZON_FLAG_FIELDS:
+        order[field] = rng.random() < 0.1
+    if max_line_items:
+        order["OrderItems"] = [
+            {
+                "ASIN": f"B0{rng.randint(0, 99999999):08d}",
+                "SellerSKU": f"SKU-{n}",
+                "OrderItemId": f"{i:07d}{n:03d}",
+                "QuantityOrdered": rng.randint(1, 3),
+                "ItemPrice": {"CurrencyCode": "USD", "Amount": f"{rng.uniform(0, 200):.2f}"},
+            }
+            for n in range(rng.randint(1, max_line_items))
+        ]
+    return order
+
+
+def amazon_page(page_index, page_size, count, seed=0, max_line_items=10):
+    rng = _page_rng(seed, page_index)
+    start = page_index * page_size
+    return [amazon_order(i, rng, max_line_items) for i in range(start, min(start + page_size, count))]
+
+
+def iter_amazon_pages(count, page_size=100, seed=0, max_line_items=10):
+    for page_index in range((count + page_size - 1) // page_size):
+        yield amazon_page(page_index, page_size, count, seed, max_line_items)
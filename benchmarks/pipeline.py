@@ -0,0 +1,352 @@
+import asyncio
+import fnmatch
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from benchmarks.generators import iter_amazon_pages, iter_shopify_pages
+
+'''
+@docs
+Per-stage benchmarks for the extract and transform stages of both pipelines. Every stage runs in
+its own forked process so peak RSS belongs to that stage alone. A stage is run twice. The timed
+pass reports throughput. The traced pass runs under tracemalloc over the first pages and reports
+the allocation peak of a single call. Input preparation (generating orders, coercing them for the
+row transforms) happens outside the timed region.
+
+The extract stages page through the fake servers in benchmarks.fake_servers, so they measure the
+client's own overhead (HTTP, JSON decoding, pagination) rather than the network.
+'''
+
+CONNECTION_ID = "bench.myshopify.com"
+BATCHED_AT = datetime(2025, 1, 1).isoformat() + "+00:00"
+SHOPIFY_PAGE_SIZE = 250
+AMAZON_PAGE_SIZE = 100
+
+
+@dataclass
+class BenchmarkOptions:
+    seed: int = 0
+    max_line_items: int = 10
+    # Pages run under tracemalloc in the traced pass, 0 disables it
+    alloc_pages: int = 20
+    # Added to every fake server response
+    latency: float = 0.0
+
+
+@dataclass
+class StageResult:
+    stage: str
+    orders: int
+    seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+    rss_growth_mb: float = 0.0
+    # Largest tracemalloc peak above the starting heap of one measured call
+    alloc_peak_kb: Optional[float] = None
+    # Sum of those peaks divided by the orders they covered
+    alloc_kb_per_order: Optional[float] = None
+    skipped: Optional[str] = None
+
+    @property
+    def orders_per_sec(self) -> float:
+        return self.orders / self.seconds if self.seconds else 0.0
+
+
+class StageTimer:
+    """
+    Wrapped around the measured part of a stage. Accumulates wall time, and in the traced pass
+    records how far each call pushed the tracemalloc peak above the heap it started with.
+    """
+
+    def __init__(self, traced: bool = False):
+        self.traced = traced
+        self.seconds = 0.0
+        self.calls = 0
+        self.alloc_peak = 0
+        self.alloc_total = 0
+        self._start = 0.0
+        self._heap = 0
+
+    def __enter__(self):
+        if self.traced:
+            tracemalloc.reset_peak()
+            self._heap = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self._start
+        self.calls += 1
+        if self.traced:
+            peak = tracemalloc.get_traced_memory()[1] - self._heap
+            self.alloc_peak = max(self.alloc_peak, peak)
+            self.alloc_total += peak
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _page_stage(pages_of: Callable, run: Callable, prepare: Optional[Callable] = None) -> Callable:
+    """Build a stage that runs `run` once per generated page, timing only that call."""
+    def stage(count: int, options: BenchmarkOptions, timer: StageTimer, max_pages: Optional[int] = None) -> int:
+        orders = 0
+        for page_index, page in enumerate(pages_of(count, options)):
+            if max_pages is not None and page_index >= max_pages:
+                break
+            data = prepare(page) if prepare else page
+            with timer:
+                run(data)
+            orders += len(page)
+        return orders
+    return stage
+
+
+def _pool_stage(pages_of: Callable, fn: Callable, group_pages: int = 20) -> Callable:
+    """
+    Build a stage that sends groups of pages through the transform process pool, one shard per
+    page. Pool start-up is excluded, and the pool processes' memory is not in the stage's RSS.
+    With group_pages=1 every page is its own submit, as a sync's load batches are.
+    """
+    def stage(count: int, options: BenchmarkOptions, timer: StageTimer, max_pages: Optional[int] = None) -> int:
+        from temporal.activities.common.executor import run_transform, shutdown_transform_executor
+
+        # The stage runs in its own process, so this only turns the pool on for the stage
+        if os.environ.get("ETL_TRANSFORM_PROCESSES", "0") == "0":
+            os.environ["ETL_TRANSFORM_PROCESSES"] = str(os.cpu_count() or 1)
+        loop = asyncio.new_event_loop()
+        try:
+            # Start the pool and import the transform in its processes before timing
+            loop.run_until_complete(run_transform(fn, next(iter(pages_of(1, options))), CONNECTION_ID, BATCHED_AT))
+            orders = 0
+            group = []
+            pages = pages_of(count, options)
+            if max_pages is not None:
+                pages = (page for page_index, page in enumerate(pages) if page_index < max_pages)
+            for page in pages:
+                group.extend(page)
+                if len(group) >= group_pages * len(page) or orders + len(group) >= count:
+                    with timer:
+                        loop.run_until_complete(run_transform(fn, group, CONNECTION_ID, BATCHED_AT, shard_rows=len(page)))
+                    orders += len(group)
+                    group = []
+            if group:
+                with timer:
+                    loop.run_until_complete(run_transform(fn, group, CONNECTION_ID, BATCHED_AT))
+                orders += len(group)
+            return orders
+        finally:
+            shutdown_transform_executor()
+            loop.close()
+    return stage
+
+
+def _shopify_pages(count, options):
+    return iter_shopify_pages(count, SHOPIFY_PAGE_SIZE, options.seed, options.max_line_items)
+
+
+def _amazon_pages(count, options):
+    return iter_amazon_pages(count, AMAZON_PAGE_SIZE, options.seed, options.max_line_items)
+
+
+def _shopify_transform_stages() -> Dict[str, Callable]:
+    from temporal.activities.Shopify.src.transformation import (
+        coerce_order_data,
+        transform_for_clickhouse,
+        transform_orders_page,
+    )
+
+    def coerce(page):
+        return [coerce_order_data(order) for order in page]
+
+    return {
+        "shopify.coerce_order_data": _page_stage(_shopify_pages, coerce),
+        "shopify.transform_for_clickhouse": _page_stage(
+            _shopify_pages, lambda page: transform_for_clickhouse(page, CONNECTION_ID, BATCHED_AT), coerce),
+        "shopify.transform_orders_page": _page_stage(
+            _shopify_pages, lambda page: transform_orders_page(page, CONNECTION_ID, BATCHED_AT)),
+        "shopify.transform_orders_page_pool": _pool_stage(_shopify_pages, transform_orders_page),
+        "shopify.transform_orders_page_pool_per_page": _pool_stage(_shopify_pages, transform_orders_page, group_pages=1),
+    }
+
+
+def _amazon_transform_stages() -> Dict[str, Callable]:
+    from temporal.activities.Amazon.src.transformation import (
+        process_amazon_orders,
+        transform_amazon_for_clickhouse,
+        transform_amazon_for_clickhouse_columnar,
+    )
+
+    return {
+        "amazon.transform_amazon_for_clickhouse": _page_stage(
+            _amazon_pages, lambda page: transform_amazon_for_clickhouse(page, CONNECTION_ID, BATCHED_AT)),
+        "amazon.transform_amazon_for_clickhouse_columnar": _page_stage(
+            _amazon_pages, lambda page: transform_amazon_for_clickhouse_columnar(page, CONNECTION_ID, BATCHED_AT)),
+        "amazon.transform_amazon_for_clickhouse_columnar_pool": _pool_stage(_amazon_pages, transform_amazon_for_clickhouse_columnar),
+        "amazon.transform_amazon_for_clickhouse_columnar_pool_per_page": _pool_stage(
+            _amazon_pages, transform_amazon_for_clickhouse_columnar, group_pages=1),
+        "amazon.process_amazon_orders": _page_stage(
+            _amazon_pages, lambda payload: process_amazon_orders(payload, CONNECTION_ID),
+            lambda page: {"payload": {"Orders": page}}),
+    }
+
+
+def _extract_stage(fetch: Callable) -> Callable:
+    """Build a stage that drains one of the clients against a fake server as a single call."""
+    def stage(count: int, options: BenchmarkOptions, timer: StageTimer, max_pages: Optional[int] = None) -> int:
+        async def run():
+            from temporal.activities.common.http_client import close_http_client
+            try:
+                with timer:
+                    return await fetch(count, options)
+            finally:
+                await close_http_client()
+        return asyncio.run(run())
+    return stage
+
+
+async def _fetch_shopify(count, options, bulk=False):
+    from benchmarks.fake_servers import FakeShopifyServer
+    from temporal.activities.Shopify.src.extraction import ShopifyClient
+
+    orders = 0
+    with FakeShopifyServer(count, seed=options.seed, latency=options.latency, max_line_items=options.max_line_items) as server:
+        client = ShopifyClient(CONNECTION_ID, "benchmark", "backfill", datetime(2025, 1, 1), base_url=server.graphql_url)
+        if bulk:
+            client.bulk_poll_interval = 0
+            pages = client.iter_bulk_order_pages(first=SHOPIFY_PAGE_SIZE)
+        else:
+            pages = client.iter_order_pages(first=SHOPIFY_PAGE_SIZE)
+        async for page, _ in pages:
+            orders += len(page)
+    return orders
+
+
+async def _fetch_shopify_bulk(count, options):
+    return await _fetch_shopify(count, options, bulk=True)
+
+
+async def _fetch_amazon(count, options):
+    from benchmarks.fake_servers import FakeAmazonServer
+    from temporal.activities.Amazon.src.extraction import AmazonClient
+    from temporal.activities.Amazon.src.types import AmazonOrderRequest
+
+    with FakeAmazonServer(count, seed=options.seed, latency=options.latency) as server:
+        request = AmazonOrderRequest(
+            refresh_token="benchmark",
+            client_secret="benchmark",
+            region="US",
+            fill_type="backfill",
+            CreatedAfter=datetime(2025, 1, 1),
+            MaxResultsPerPage=AMAZON_PAGE_SIZE,
+            endpoint=server.url,
+            token_url=server.token_url,
+        )
+        orders = 0
+        async for page, _ in AmazonClient(request).iter_order_pages():
+            orders += len(page)
+    return orders
+
+
+def _extract_stages() -> Dict[str, Callable]:
+    return {
+        "shopify.extract": _extract_stage(_fetch_shopify),
+        "shopify.extract_bulk": _extract_stage(_fetch_shopify_bulk),
+        "amazon.extract": _extract_stage(_fetch_amazon),
+    }
+
+
+STAGE_GROUPS = [_shopify_transform_stages, _amazon_transform_stages, _extract_stages]
+
+
+def stage_names() -> List[str]:
+    names = []
+    for group in STAGE_GROUPS:
+        try:
+            names.extend(group())
+        except ImportError as e:
+            print(f"Skipping {group.__name__}: {e}", file=sys.stderr)
+    return names
+
+
+def _find_stage(name: str) -> Callable:
+    for group in STAGE_GROUPS:
+        try:
+            stages = group()
+        except ImportError:
+            continue
+        if name in stages:
+            return stages[name]
+    raise ValueError(f"Unknown stage: {name}")
+
+
+def _run_stage(name: str, count: int, options: BenchmarkOptions) -> StageResult:
+    result = StageResult(stage=name, orders=count)
+    try:
+        stage = _find_stage(name)
+        baseline_rss = _max_rss_mb()
+        timer = StageTimer()
+        result.orders = stage(count, options, timer)
+        result.seconds = timer.seconds
+        result.peak_rss_mb = _max_rss_mb()
+        result.rss_growth_mb = result.peak_rss_mb - baseline_rss
+        if options.alloc_pages:
+            traced = StageTimer(traced=True)
+            tracemalloc.start()
+            try:
+                traced_orders = stage(min(count, options.alloc_pages * SHOPIFY_PAGE_SIZE), options, traced, max_pages=options.alloc_pages)
+            finally:
+                tracemalloc.stop()
+            result.alloc_peak_kb = traced.alloc_peak / 1024
+            result.alloc_kb_per_order = traced.alloc_total / 1024 / traced_orders if traced_orders else 0.0
+    except ImportError as e:
+        result.skipped = f"missing dependency: {e.name}"
+    return result
+
+
+def _child(name, count, options, queue):
+    try:
+        queue.put(asdict(_run_stage(name, count, options)))
+    except Exception as e:
+        queue.put(asdict(StageResult(stage=name, orders=count, skipped=f"failed: {e!r}")))
+
+
+def run_stage(name: str, count: int, options: BenchmarkOptions) -> StageResult:
+    """Run one stage over `count` orders in a fresh process and return its measurements."""
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    context = multiprocessing.get_context(method)
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(name, count, options, queue))
+    process.start()
+    try:
+        return StageResult(**queue.get())
+    finally:
+        process.join()
+
+
+def run(patterns: List[str], counts: List[int], options: BenchmarkOptions) -> List[StageResult]:
+    names = [name for name in stage_names() if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+    return [run_stage(name, count, options) for count in counts for name in names]
+
+
+def format_results(results: List[StageResult]) -> str:
+    header = f"{'stage':<48} {'orders':>9} {'seconds':>9} {'orders/s':>11} {'peak RSS MB':>12} {'RSS +MB':>9} {'alloc peak KB':>14} {'alloc KB/order':>15}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        if r.skipped:
+            lines.append(f"{r.stage:<48} {r.orders:>9,} skipped: {r.skipped}")
+            continue
+        alloc_peak = f"{r.alloc_peak_kb:>14,.1f}" if r.alloc_peak_kb is not None else f"{'-':>14}"
+        alloc_per_order = f"{r.alloc_kb_per_order:>15,.2f}" if r.alloc_kb_per_order is not None else f"{'-':>15}"
+        lines.append(
+            f"{r.stage:<48} {r.orders:>9,} {r.seconds:>9.2f} {r.orders_per_sec:>11,.0f} "
+            f"{r.peak_rss_mb:>12,.1f} {r.rss_growth_mb:>9,.1f} {alloc_peak} {alloc_per_order}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,55 @@
+import argparse
+import time
+from datetime import datetime
+from benchmarks.generators import shopify_orders
+from temporal.activities.Shopify.src.transformation import (
+    coerce_order_data,
+    transform_for_clickhouse,
+    transform_orders_page,
+)
+
+'''
+@docs
+Compares orders/sec of the Shopify transformation paths on synthetic GraphQL order nodes.
+
+    python -m benchmarks.shopify_transform --orders 100000
+'''
+
+def run(orders, page_size, batchedAt):
+    pages = [orders[i:i + page_size] for i in range(0, len(orders), page_size)]
+
+    def rows_path(page):
+        return transform_for_clickhouse([coerce_order_data(order) for order in page], "bench.myshopify.com", batchedAt)
+
+    def page_path(page):
+        return transform_orders_page(page, "bench.myshopify.com", batchedAt)
+
+    results = {}
+    for name, fn in [("coerce + rows", rows_path), ("transform_orders_page", page_path)]:
+        start = time.perf_counter()
+        for page in pages:
+            fn(page)
+        elapsed = time.perf_counter() - start
+        results[name] = len(orders) / elapsed
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare orders/sec of the Shopify transformation paths")
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--page-size", type=int, default=250)
+    args = parser.parse_args()
+
+    orders = shopify_orders(args.orders)
+    batchedAt = datetime(2025, 1, 1).isoformat() + "+00:00"
+    # The page transformer must produce the same rows as the existing path
+    expected, _, _ = transform_for_clickhouse([coerce_order_data(order) for order in orders[:100]], "bench.myshopify.com", batchedAt)
+    columns, _, _ = transform_orders_page(orders[:100], "bench.myshopify.com", batchedAt)
+    assert [list(row) for row in zip(*columns)] == expected, "transform_orders_page output differs from transform_for_clickhouse"
+
+    for name, rate in run(orders, args.page_size, batchedAt).items():
+        print(f"{name:<24} {rate:>12,.0f} orders/sec")
+
+
+if __name__ == "__main__":
+    main()
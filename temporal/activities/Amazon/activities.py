@@ -20,6 +20,8 @@ class AccountPayload:
     connected_name: Union[str, List[str], Any]
     platform: Union[str, List[str], Any]
     manager_id: Union[str, List[str], Any]
+    # Deprecated and unused: SP-API access tokens come from refresh_token through the LWA token cache.
+    # Kept so payloads from existing callers still deserialize
     access_token: Union[str, List[str], Any]
     refresh_token: Union[str, List[str], Any]
     timezone: Union[str, List[str], Any]
@@ -31,6 +33,69 @@ class AccountPayload:
     last_run_ts: Union[datetime, List[datetime], Any]
     client_secret: str
     region: str
+    # Set by the workflow from plan_sync, so the activity extracts the window the sync was routed for
+    fill_type: Optional[str] = None
+    start_time: Optional[str] = None
+    # Backfill chunks the fan-out runs at once. Keep it within the workers' TENANT_MAX_CONCURRENT_ACTIVITIES,
+    # chunks over the tenant cap would wait while holding backfill slots
+    max_parallel_chunks: int = 2
+
+@dataclass
+class ChunkPayload:
+    account: AccountPayload
+    start_time: str
+    end_time: str
+    batchedAt: str
+
+@dataclass
+class ReconcilePayload:
+    connected_id: str
+    batchedAt: str
+    rows: int
+    # Merged LoadReceipt of the chunks, None for fan-outs started before receipts
+    receipt: Optional[dict] = None
+
+AMAZON_ORDERS_TABLE = "aa_master_amazon_orders"
+
+async def _load_order_pages(pages, advance, committed, heartbeat_details, shop_name, clickhouse_client, receipt=None, digests=None, client=None):
+    """
+    Load order pages into the Amazon orders table with the shared page loader, in batches of
+    AMAZON_LOAD_BATCH_ROWS orders, filling OrderItems of the changed orders on the way.
+
+    Args:
+        pages: Async iterator of (orders, page_info) tuples
+        advance: Callback that moves a position dict past the given page_info
+        committed: Position the pages start from
+        heartbeat_details: Extra values to include in every heartbeat
+        shop_name: Connection id the rows are loaded for
+        clickhouse_client: Client used for the inserts
+        receipt: Receipt of the batches loaded by previous attempts, as a dict
+        digests: DigestIndex whose unchanged orders are skipped before enrichment and the transform
+        client: AmazonClient whose getOrderItems fills OrderItems, None to skip enrichment
+
+    Returns:
+        LoadReceipt of every batch loaded for the sync
+    """
+    # Import non-deterministic libraries only within the activity
+    from .src.transformation import transform_amazon_for_clickhouse_columnar
+    from .src.loading import insert_batch, resolve_table, batch_dedup_token
+    from .src.enrichment import iter_enriched_pages
+    from temporal.activities.common.page_loading import load_order_pages
+    import os
+
+    return await load_order_pages(
+        pages, advance, committed, heartbeat_details, shop_name, clickhouse_client,
+        table_name=await resolve_table(clickhouse_client, AMAZON_ORDERS_TABLE),
+        transform=transform_amazon_for_clickhouse_columnar,
+        insert_batch=insert_batch,
+        batch_dedup_token=batch_dedup_token,
+        batch_rows=int(os.environ.get("AMAZON_LOAD_BATCH_ROWS", "500")),
+        receipt=receipt,
+        digests=digests,
+        # Items of one page are fetched while the next page is requested and this one is loaded
+        enrich=(lambda pages: iter_enriched_pages(client, pages)) if client is not None else None,
+    )
+
 
 @activity.defn
 async def amazon(request: AccountPayload):
@@ -51,40 +116,94 @@ async def amazon(request: AccountPayload):
         '''
         # Import non-deterministic libraries only within the activity
         from .src.extraction import AmazonClient
-        from .src.transformation import coerce_order_data, transform_for_clickhouse
-        from .src.loading import main
+        from .src.loading import get_client, confirm_load, resolve_table
         from .src.types import AmazonOrderRequest
+        from temporal.activities.common.watermarks import parse_watermark, resolve_start
+        from temporal.activities.common.digests import DigestIndex, change_detection_enabled
+        from .src.enrichment import enrichment_enabled
+        from datetime import timedelta, timezone
         import json
+        import os
 
-        last_run_ts = request.last_run_ts
-        fill_type = None
-        if last_run_ts is None:
-            fill_type = "backfill"
-            last_run_ts = datetime(datetime.now().year, datetime.now().month - 1, 1)
-        else:
-            fill_type = "incremental"
-            last_run_ts = last_run_ts
-            print(last_run_ts)
-            # Convert last_run_ts to datetime object - 2025-04-06 18:27:10
-            last_run_ts = datetime.strptime(last_run_ts, "%Y-%m-%d %H:%M:%S")
         shop_name = request.connected_id
-        access_token = request.access_token
-        start_time = last_run_ts
+        # A retried attempt resumes after the last page that was committed to ClickHouse
+        checkpoint = activity.info().heartbeat_details
+        checkpoint = checkpoint[0] if checkpoint else {}
+        if checkpoint.get("start_time"):
+            # NextTokens are only valid for the filter they were issued for, so keep the original window
+            fill_type, start_time = checkpoint["fill_type"], parse_watermark(checkpoint["start_time"])
+        elif request.fill_type:
+            # The workflow chose the task queue from this plan, so extract exactly that window
+            fill_type, start_time = request.fill_type, parse_watermark(request.start_time)
+        else:
+            # The committed watermark decides between a backfill and an overlapping incremental fetch
+            fill_type, start_time = await resolve_start(shop_name, request.last_run_ts)
+        # Backfills are split into this many CreatedAfter/CreatedBefore slices fetched concurrently
+        slices = int(os.environ.get("AMAZON_BACKFILL_SLICES", "1"))
+        use_slices = fill_type == "backfill" and slices > 1
+        committed = {
+            "next_token": checkpoint.get("next_token"),
+            "slice_tokens": checkpoint.get("slice_tokens", {}),
+            "completed_slices": checkpoint.get("completed_slices", []),
+        }
+        # Slices are planned from a fixed window end so a retry reuses the same slices and tokens.
+        # SP-API requires CreatedBefore to be at least two minutes in the past.
+        window_end = checkpoint.get("window_end") or (datetime.now(timezone.utc) - timedelta(minutes=3)).replace(microsecond=0).isoformat()
+        batchedAt = checkpoint.get("batchedAt") or datetime.now(timezone.utc).isoformat()
+        if checkpoint:
+            activity.logger.info(f"Resuming account {shop_name} from {committed} with {checkpoint.get('receipt')} already loaded")
         # Extraction.py utilization
         activity.logger.info(f"Data extracted for account {shop_name} with fill type {fill_type} and start time {start_time}")
-        client = AmazonClient(request=AmazonOrderRequest(refresh_token=request.refresh_token,client_secret=request.client_secret,region=request.region,fill_type=fill_type,CreatedAfter=start_time,LastUpdatedAfter=None,MaxResultsPerPage=100))
-        orders = await client.get_orders() 
-        activity.logger.info(f"Orders extracted for account {shop_name}")
-        activity.logger.info(f"Orders: {len(orders)}")
-        # Transformation Utilization
-        master_orders = []
-        for order in orders:
-            master_orders.append(coerce_order_data(order))
-        activity.logger.info(f"Master orders: {len(master_orders)}")
-        if len(master_orders) > 0:
-            ordered_data, column_names, batchedAt = transform_for_clickhouse(master_orders, shop_name)
-        # Loading.py utilization
-            result = await main(table_name="aa_master_shopify_orders", data=ordered_data, column_names=column_names, connection_id=shop_name, batchedAt=batchedAt)
+        client = AmazonClient(request=AmazonOrderRequest(
+            refresh_token=request.refresh_token,
+            client_secret=request.client_secret,
+            region=request.region,
+            fill_type=fill_type,
+            CreatedAfter=start_time if fill_type == "backfill" else None,
+            LastUpdatedAfter=start_time if fill_type == "incremental" else None,
+            MaxResultsPerPage=100
+        ))
+        clickhouse_client = await get_client()
+        # Incremental syncs mostly re-read orders the previous sync already loaded unchanged
+        digests = None
+        if fill_type == "incremental" and change_detection_enabled():
+            digests = await DigestIndex.load(shop_name, id_key="AmazonOrderId", version_key="LastUpdateDate")
+        if use_slices:
+            pages = client.iter_sliced_order_pages(
+                slices,
+                end_time=parse_watermark(window_end),
+                slice_tokens=committed["slice_tokens"],
+                completed_slices=committed["completed_slices"],
+            )
+        else:
+            pages = client.iter_order_pages(nextToken=committed["next_token"])
+
+        def advance(position, page_info):
+            if use_slices:
+                if page_info.get("NextToken"):
+                    position["slice_tokens"][page_info["slice"]] = page_info["NextToken"]
+                else:
+                    position["completed_slices"].append(page_info["slice"])
+            else:
+                position["next_token"] = page_info.get("NextToken")
+
+        receipt = await _load_order_pages(
+            pages, advance, committed,
+            heartbeat_details={"batchedAt": batchedAt, "window_end": window_end, "fill_type": fill_type, "start_time": start_time.isoformat()},
+            shop_name=shop_name,
+            clickhouse_client=clickhouse_client,
+            receipt=checkpoint.get("receipt"),
+            digests=digests,
+            client=client if enrichment_enabled(fill_type) else None,
+        )
+
+        activity.logger.info(f"Orders: {receipt.rows}")
+        if receipt.rows > 0:
+            result = await confirm_load(clickhouse_client, await resolve_table(clickhouse_client, AMAZON_ORDERS_TABLE), shop_name, batchedAt, receipt=receipt)
+            # Only orders confirmed in ClickHouse may be skipped by the next sync, and not while
+            # they lack the buyer and address fields of the Restricted Data Token
+            if result and digests is not None and not client.restricted_data_missing:
+                await digests.commit()
             activity.logger.info(f"Data loaded for account {shop_name}")
             return result
         else:
@@ -93,5 +212,67 @@ async def amazon(request: AccountPayload):
             return None
     except Exception as e:
         activity.logger.error(f"Error in activities.py: {e}")
-        return None
-    
+        # Re-raise so Temporal retries the activity from the last heartbeated NextToken
+        raise
+
+@activity.defn
+async def amazon_chunk(request: ChunkPayload) -> dict:
+    """
+    Extract and load the orders created in one [start_time, end_time) chunk of a fanned-out backfill.
+    Returns the chunk's load receipt as a dict.
+    """
+    try:
+        # Import non-deterministic libraries only within the activity
+        from .src.extraction import AmazonClient
+        from .src.loading import get_client
+        from .src.types import AmazonOrderRequest
+        from .src.enrichment import enrichment_enabled
+
+        shop_name = request.account.connected_id
+        checkpoint = activity.info().heartbeat_details
+        checkpoint = checkpoint[0] if checkpoint else {}
+        start_time = datetime.fromisoformat(request.start_time)
+        end_time = datetime.fromisoformat(request.end_time)
+        activity.logger.info(f"Chunk {request.start_time} - {request.end_time} started for account {shop_name}")
+        client = AmazonClient(request=AmazonOrderRequest(
+            refresh_token=request.account.refresh_token,
+            client_secret=request.account.client_secret,
+            region=request.account.region,
+            fill_type="backfill",
+            CreatedAfter=start_time,
+            LastUpdatedAfter=None,
+            MaxResultsPerPage=100
+        ))
+        clickhouse_client = await get_client()
+
+        def advance(position, page_info):
+            position["next_token"] = page_info.get("NextToken")
+
+        committed = {"next_token": checkpoint.get("next_token")}
+        receipt = await _load_order_pages(
+            client.iter_order_pages(nextToken=committed["next_token"], created_after=start_time, created_before=end_time), advance, committed,
+            heartbeat_details={"batchedAt": request.batchedAt},
+            shop_name=shop_name,
+            clickhouse_client=clickhouse_client,
+            receipt=checkpoint.get("receipt"),
+            client=client if enrichment_enabled("backfill") else None,
+        )
+        activity.logger.info(f"Chunk {request.start_time} - {request.end_time} loaded {receipt.rows} rows for account {shop_name}")
+        return receipt.to_dict()
+    except Exception as e:
+        activity.logger.error(f"Error in activities.py: {e}")
+        raise
+
+@activity.defn
+async def amazon_reconcile(request: ReconcilePayload):
+    """Confirm a fanned-out backfill landed in ClickHouse and advance the connection's watermark."""
+    # Import non-deterministic libraries only within the activity
+    from .src.loading import get_client, confirm_load, resolve_table
+    from temporal.activities.common.receipts import LoadReceipt
+
+    clickhouse_client = await get_client()
+    table_name = await resolve_table(clickhouse_client, AMAZON_ORDERS_TABLE)
+    receipt = LoadReceipt.from_dict(request.receipt) if request.receipt else None
+    result = await confirm_load(clickhouse_client, table_name, request.connected_id, request.batchedAt, receipt=receipt)
+    activity.logger.info(f"Reconciled {request.rows} rows for account {request.connected_id}: {result}")
+    return result
@@ -0,0 +1,215 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+from temporal.activities.common.http_client import get_http_client
+
+'''
+@docs
+Login with Amazon access tokens - https://developer-docs.amazon.com/sp-api/docs/connecting-to-the-selling-partner-api
+Restricted Data Tokens - https://developer-docs.amazon.com/sp-api/docs/tokens-api-use-case-guide
+
+An access token is valid for expires_in seconds (an hour) and can be used by any number of
+requests of the seller. The cache below keeps one token per (client id, refresh token) for the
+whole worker process, so syncs start without a round trip to api.amazon.com. Once a token is
+within LWA_REFRESH_AHEAD_SECONDS of expiring, the next caller starts a refresh in the background
+and keeps using the current token. Only a missing or expired token makes the caller wait, and
+concurrent callers for one seller then share a single in-flight refresh.
+
+getOrders and getOrderItems only return BuyerInfo and ShippingAddress when called with a
+Restricted Data Token instead of the access token. With AMAZON_RESTRICTED_DATA=true one token
+is requested for the generic paths of RESTRICTED_RESOURCES, so it covers every order of the
+seller, and it is cached the same way until it expires. If the application is not allowed to
+request one (400, 401 or 403), orders are fetched with the access token and the request is
+retried after RESTRICTED_DATA_RETRY_SECONDS. Throttling and server errors are raised instead, so
+the request that needed the token is retried rather than sent without it.
+'''
+
+DEFAULT_TOKEN_URL = "https://api.amazon.com/auth/o2/token"
+RESTRICTED_DATA_TOKEN_PATH = "/tokens/2021-03-01/restrictedDataToken"
+# Generic paths, so a single token covers the orders, items and addresses of every order
+RESTRICTED_RESOURCES: List[Dict[str, Any]] = [
+    {"method": "GET", "path": "/orders/v0/orders", "dataElements": ["buyerInfo", "shippingAddress"]},
+    {"method": "GET", "path": "/orders/v0/orders/{orderId}/orderItems", "dataElements": ["buyerInfo"]},
+    {"method": "GET", "path": "/orders/v0/orders/{orderId}/address"},
+]
+# createRestrictedDataToken responses that mean the application may not get a token for the seller
+RESTRICTED_DATA_DENIED_STATUS_CODES = (400, 401, 403)
+# Treat tokens as expired slightly early so a request never leaves with a token that dies in flight
+EXPIRY_MARGIN_SECONDS = 60
+
+
+def _refresh_ahead() -> float:
+    return float(os.environ.get("LWA_REFRESH_AHEAD_SECONDS", "300"))
+
+
+def restricted_data_enabled() -> bool:
+    return os.environ.get("AMAZON_RESTRICTED_DATA", "false").lower() == "true"
+
+
+class RestrictedDataTokenError(Exception):
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _CachedToken:
+
+    def __init__(self):
+        self.token: Optional[str] = None
+        self.expires_at = 0.0
+        self.refresh: Optional[asyncio.Task] = None
+
+
+class TokenCache:
+    """Expiring tokens by key, refreshed ahead of expiry in the background and single-flight when missing."""
+
+    def __init__(self):
+        self._tokens: Dict[Hashable, _CachedToken] = {}
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Tuple[str, float]]]) -> str:
+        """
+        Return a valid token for the key, refreshing it only when needed.
+
+        Args:
+            key: Identifies the token, e.g. (client id, refresh token)
+            fetch: Requests a new token, returning it with its lifetime in seconds
+
+        Returns:
+            A token valid for at least EXPIRY_MARGIN_SECONDS
+        """
+        entry = self._tokens.setdefault(key, _CachedToken())
+        now = time.monotonic()
+        if entry.token is not None and now < entry.expires_at:
+            if now >= entry.expires_at - _refresh_ahead():
+                # Still valid, renew it without making this request wait
+                self._start_refresh(entry, fetch)
+            return entry.token
+        await asyncio.shield(self._start_refresh(entry, fetch))
+        return entry.token
+
+    def invalidate(self, key: Hashable, token: Optional[str]):
+        """
+        Drop a token the API rejected. Only the given token is dropped, so requests that fail
+        with a token another caller already replaced do not force another refresh.
+        """
+        entry = self._tokens.get(key)
+        if entry is not None and entry.token == token:
+            entry.token = None
+            entry.expires_at = 0.0
+
+    def _start_refresh(self, entry: _CachedToken, fetch: Callable[[], Awaitable[Tuple[str, float]]]) -> asyncio.Task:
+        if entry.refresh is None or entry.refresh.done():
+            entry.refresh = asyncio.create_task(self._refresh(entry, fetch))
+        return entry.refresh
+
+    async def _refresh(self, entry: _CachedToken, fetch: Callable[[], Awaitable[Tuple[str, float]]]):
+        started = time.monotonic()
+        try:
+            token, expires_in = await fetch()
+        except Exception as e:
+            if entry.token is not None and time.monotonic() < entry.expires_at:
+                # A failed background refresh is retried by the next caller while the token lasts
+                logging.warning(f"Background token refresh failed: {e}")
+                return
+            raise
+        entry.token = token
+        entry.expires_at = started + expires_in - EXPIRY_MARGIN_SECONDS
+
+
+async def request_access_token(token_url: str, client_id: str, client_secret: str, refresh_token: str) -> Tuple[str, float]:
+    """Exchange the refresh token for an access token, returning it with its lifetime in seconds."""
+    http_client = await get_http_client()
+    response = await http_client.post(
+        token_url,
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        data={"grant_type": "refresh_token", "refresh_token": refresh_token, "client_id": client_id, "client_secret": client_secret}
+    )
+    if response.status_code != 200:
+        raise Exception(f"Failed to get access token: {response.json()}")
+    result = response.json()
+    return result["access_token"], float(result.get("expires_in", 3600))
+
+
+async def request_restricted_data_token(endpoint: str, access_token: str) -> Tuple[str, float]:
+    """Call createRestrictedDataToken for RESTRICTED_RESOURCES, returning the token with its lifetime in seconds."""
+    http_client = await get_http_client()
+    response = await http_client.post(
+        f"{endpoint}{RESTRICTED_DATA_TOKEN_PATH}",
+        headers={"x-amz-access-token": access_token, "Content-Type": "application/json"},
+        json={"restrictedResources": RESTRICTED_RESOURCES}
+    )
+    if response.status_code != 200:
+        raise RestrictedDataTokenError(response.status_code, f"Failed to get restricted data token: {response.status_code} {response.text}")
+    result = response.json()
+    return result["restrictedDataToken"], float(result.get("expiresIn", 3600))
+
+
+_access_tokens = TokenCache()
+_restricted_tokens = TokenCache()
+# Sellers whose createRestrictedDataToken failed, until when to use the access token instead
+_restricted_unavailable: Dict[Hashable, float] = {}
+
+
+def _restricted_retry_seconds() -> float:
+    return float(os.environ.get("RESTRICTED_DATA_RETRY_SECONDS", "900"))
+
+
+async def get_access_token(token_url: str, client_id: str, client_secret: str, refresh_token: str) -> str:
+    """Return the seller's access token from the process-wide cache."""
+    return await _access_tokens.get(
+        (client_id, refresh_token),
+        lambda: request_access_token(token_url, client_id, client_secret, refresh_token)
+    )
+
+
+def invalidate_access_token(client_id: str, refresh_token: str, access_token: Optional[str]):
+    _access_tokens.invalidate((client_id, refresh_token), access_token)
+
+
+async def get_restricted_data_token(
+    client_id: str,
+    refresh_token: str,
+    endpoint: str,
+    access_token: str,
+    before_request: Optional[Callable[[], Awaitable[Any]]] = None
+) -> Optional[str]:
+    """
+    Return the seller's Restricted Data Token for the endpoint from the process-wide cache.
+
+    Args:
+        client_id: LWA client id of the application
+        refresh_token: The seller's refresh token
+        endpoint: SP-API host of the seller's region
+        access_token: Current access token, used to request the RDT
+        before_request: Awaited before createRestrictedDataToken is called, e.g. its rate limiter
+
+    Returns:
+        The token, or None while the application cannot get one for the seller
+
+    Raises:
+        RestrictedDataTokenError: createRestrictedDataToken was throttled or failed server side
+    """
+    key = (client_id, refresh_token, endpoint)
+    if time.monotonic() < _restricted_unavailable.get(key, 0.0):
+        return None
+
+    async def fetch():
+        if before_request is not None:
+            await before_request()
+        return await request_restricted_data_token(endpoint, access_token)
+
+    try:
+        return await _restricted_tokens.get(key, fetch)
+    except RestrictedDataTokenError as e:
+        if e.status_code not in RESTRICTED_DATA_DENIED_STATUS_CODES:
+            raise
+        logging.warning(f"Restricted data token unavailable, fetching orders without buyer and address fields: {e}")
+        _restricted_unavailable[key] = time.monotonic() + _restricted_retry_seconds()
+        return None
+
+
+def invalidate_restricted_data_token(client_id: str, refresh_token: str, endpoint: str, token: Optional[str]):
+    _restricted_tokens.invalidate((client_id, refresh_token, endpoint), token)
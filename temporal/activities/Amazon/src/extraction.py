@@ -1,9 +1,22 @@
-import requests
-from typing import List,Dict, Any, Optional
-from datetime import datetime
+from typing import AsyncGenerator, List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 from .types import AmazonOrderRequest
-import os
 import asyncio
+import logging
+from temporal.activities.common.http_client import get_http_client
+from temporal.activities.common.windows import split_time_window
+from .rate_limit import RATE_LIMIT_HEADER, SPAPITokenBucket, get_bucket
+from .auth import (
+    DEFAULT_TOKEN_URL, get_access_token, get_restricted_data_token, invalidate_access_token,
+    invalidate_restricted_data_token, restricted_data_enabled
+)
+
+def _format_datetime(dt: datetime) -> str:
+    """ISO 8601 in UTC as SP-API expects it. Naive datetimes are taken to be UTC."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
 class AmazonClient:
     def __init__(self, request: AmazonOrderRequest):
         self.refresh_token = request.refresh_token
@@ -11,35 +24,64 @@ class AmazonClient:
         self.CreatedAfter = request.CreatedAfter
         self.LastUpdatedAfter = request.LastUpdatedAfter
         self.MaxResultsPerPage = request.MaxResultsPerPage
+        self.endpoint = request.endpoint
+        self.token_url = request.token_url or DEFAULT_TOKEN_URL
         self.client_id = "amzn1.application-oa2-client.144c0aac9aa04fe89ef2efdcc8b16018"
         self.client_secret = request.client_secret
-        self.access_token = self._get_access_token()
+        # Tokens are taken from the process-wide caches for every request and never kept on the
+        # client, which concurrent getOrderItems calls share
+        # Set once a restricted request was sent without the enabled Restricted Data Token
+        self.restricted_data_missing = False
         self.marketplace_ids = self._get_marketplace_ids(self.region)
         #TODO: Update this to run with doppler for the backend stuff
-        self.current_status_code = 0
         self.fill_type = request.fill_type
-        self.master_orders = []
     
-    def _get_access_token(self) -> str:
-        response = requests.post(
-            "https://api.amazon.com/auth/o2/token",
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            data={"grant_type": "refresh_token", "refresh_token": self.refresh_token, "client_id": self.client_id, "client_secret": self.client_secret}
-        )
-        if response.status_code != 200:
-            raise Exception(f"Failed to get access token: {response.json()}")   
-        return response.json()["access_token"]
+    async def _get_access_token(self) -> str:
+        return await get_access_token(self.token_url, self.client_id, self.client_secret, self.refresh_token)
     
-    async def _enforce_rate_limit(self):
-        if self.current_status_code == 429:
-            print("Rate limit hit - waiting 60 seconds before retrying...")
-            await asyncio.sleep(60)
-        elif self.current_status_code == 403:
-            print("Access token expired - refreshing token...")
-            self.access_token = self._get_access_token()
-        elif self.current_status_code >= 500:
-            print("Server error - waiting 30 seconds before retrying...")
-            await asyncio.sleep(30)
+    async def _enforce_rate_limit(self, operation: str = "getOrders", restricted: bool = False) -> Tuple[SPAPITokenBucket, Dict[str, str]]:
+        """
+        Wait for the operation's token bucket of this seller and region, with a current
+        access token.
+
+        Args:
+            operation: SP-API operation the request is for
+            restricted: Send the Restricted Data Token, if enabled, instead of the access token
+
+        Returns:
+            The bucket, to be updated from the response, and the headers of this request
+        """
+        access_token = await self._get_access_token()
+        restricted_token = None
+        if restricted and restricted_data_enabled():
+            restricted_token = await get_restricted_data_token(
+                self.client_id, self.refresh_token, self._get_api_host(self.region), access_token,
+                before_request=get_bucket(self.refresh_token, self.region, "createRestrictedDataToken").acquire
+            )
+            if restricted_token is None:
+                self.restricted_data_missing = True
+        bucket = get_bucket(self.refresh_token, self.region, operation)
+        await bucket.acquire()
+        return bucket, self._get_headers(access_token, restricted_token)
+
+    async def _handle_throttle(self, bucket: SPAPITokenBucket, response, retry_count: int, headers: Dict[str, str]):
+        """
+        Adjust the bucket after a response, and back off briefly after a server error. After
+        a 403 the token the request was sent with is dropped from its cache, and only that
+        token, so a token another request already refreshed stays in use.
+        """
+        bucket.update(response.headers.get(RATE_LIMIT_HEADER))
+        if response.status_code == 403:
+            logging.warning("Access token rejected - refreshing token...")
+            token = headers["x-amz-access-token"]
+            # TokenCache only drops the entry still holding this token, so either cache may hold it
+            invalidate_access_token(self.client_id, self.refresh_token, token)
+            invalidate_restricted_data_token(self.client_id, self.refresh_token, self._get_api_host(self.region), token)
+        elif response.status_code == 429:
+            logging.warning("Rate limit hit - waiting for the operation's bucket to restore...")
+            bucket.throttled()
+        elif response.status_code >= 500:
+            await asyncio.sleep(2 ** retry_count)
     
     def _interval_constructer(self) -> str:
         # Define timezone offsets for each region
@@ -64,7 +106,7 @@ class AmazonClient:
         start_date = self.CreatedAfter.strftime("%Y-%m-%d")
         
         # Get today's date for end date
-        end_date = datetime.now().strftime("%Y-%m-%d")
+        end_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
         
         # Construct the interval string
         interval = f"{start_date}T00:00:00{tz_offset}--{end_date}T00:00:00{tz_offset}"
@@ -72,6 +114,8 @@ class AmazonClient:
         return interval
 
     def _get_base_url_sales(self, region: str) -> str:
+        if self.endpoint:
+            return f"{self.endpoint}/sales/v1/orderMetrics"
         # North America regions
         if region in ['US', 'CA', 'MX', 'BR']:
             return "https://sellingpartnerapi-na.amazon.com/sales/v1/orderMetrics"
@@ -87,7 +131,21 @@ class AmazonClient:
         
         else:
             raise ValueError(f"Unsupported region: {region}")
+    def _get_api_host(self, region: str) -> str:
+        if self.endpoint:
+            return self.endpoint
+        if region in ['US', 'CA', 'MX', 'BR']:
+            return "https://sellingpartnerapi-na.amazon.com"
+        elif region in ['ES', 'UK', 'FR', 'BE', 'NL', 'DE', 'IT', 'SE', 'ZA',
+                       'PL', 'EG', 'TR', 'SA', 'AE', 'IN']:
+            return "https://sellingpartnerapi-eu.amazon.com"
+        elif region in ['SG', 'AU', 'JP']:
+            return "https://sellingpartnerapi-fe.amazon.com"
+        else:
+            raise ValueError(f"Unsupported region: {region}")
     def _get_base_url_orders(self, region: str) -> str:
+        if self.endpoint:
+            return f"{self.endpoint}/orders/v0/orders"
         # North America regions
         if region in ['US', 'CA', 'MX', 'BR']:
             return "https://sellingpartnerapi-na.amazon.com/orders/v0/orders"
@@ -136,9 +194,10 @@ class AmazonClient:
         }
         return marketplace_mapping.get(region,None)
     
-    def _get_headers(self) -> Dict[str,str]:
+    def _get_headers(self, access_token: str, restricted_token: Optional[str] = None) -> Dict[str,str]:
+        # The Restricted Data Token replaces the access token for the paths it was issued for
         return {
-            "x-amz-access-token": self.access_token
+            "x-amz-access-token": restricted_token or access_token
         }
     
     async def get_sales(self):
@@ -147,9 +206,8 @@ class AmazonClient:
         retry_count = 0
         while retry_count < max_retries:
             try:
-                await self._enforce_rate_limit()
+                bucket, headers = await self._enforce_rate_limit("getOrderMetrics")
                 base_url = self._get_base_url_sales(self.region)
-                headers = self._get_headers()
                 
                 params = {
                     "marketplaceIds": self.marketplace_ids,
@@ -157,93 +215,272 @@ class AmazonClient:
                     'granularity': 'Day'
                 }
                 
-                response = requests.get(base_url, headers=headers, params=params)
-                self.current_status_code = response.status_code
+                http_client = await get_http_client()
+                response = await http_client.get(base_url, headers=headers, params=params)
                 
                 if response.status_code == 200:
+                    bucket.update(response.headers.get(RATE_LIMIT_HEADER))
                     # Return the JSON data instead of the response object
                     return response.json()
                 
                 elif response.status_code in [429, 403, 500, 502, 503, 504]:
-                    print(f"Received status code {response.status_code}, attempt {retry_count + 1} of {max_retries}")
+                    logging.warning(f"Received status code {response.status_code}, attempt {retry_count + 1} of {max_retries}")
                     retry_count += 1
                     if retry_count == max_retries:
                         raise Exception(f"Max retries reached. Last status code: {response.status_code}")
+                    await self._handle_throttle(bucket, response, retry_count, headers)
                     continue
                 
                 else:
                     raise Exception(f"Unexpected status code: {response.status_code}")
 
             except Exception as e:
-                print(f"Error fetching orders: {e}")
+                logging.warning(f"Error fetching orders: {e}")
                 retry_count += 1
                 if retry_count == max_retries:
                     raise
                 await asyncio.sleep(5 * retry_count)  # Progressive backoff
 
-    async def get_orders(self, nextToken: Optional[str] = None):
-        master_orders = []
+    def _order_params(
+        self,
+        current_token: Optional[str],
+        created_after: Optional[datetime],
+        created_before: Optional[datetime]
+    ) -> Dict[str, Any]:
+        params = {
+            "MarketplaceIds": self.marketplace_ids,
+            "MaxResultsPerPage": self.MaxResultsPerPage
+        }
+        if current_token is not None:
+            params["NextToken"] = current_token
+        elif created_after is not None:
+            params["CreatedAfter"] = _format_datetime(created_after)
+            if created_before is not None:
+                params["CreatedBefore"] = _format_datetime(created_before)
+        elif self.fill_type == "backfill":
+            params["CreatedAfter"] = _format_datetime(self.CreatedAfter)
+        elif self.fill_type == "incremental":
+            # Full timestamp so only the delta since the watermark (minus its overlap) is fetched
+            params["LastUpdatedAfter"] = _format_datetime(self.LastUpdatedAfter)
+        return params
+
+    async def iter_order_pages(
+        self,
+        nextToken: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None
+    ) -> AsyncGenerator[Tuple[List[Dict[str, Any]], Dict[str, Any]], None]:
+        """
+        Yield orders one page at a time so callers can transform and load each page before
+        the next one is requested, and checkpoint the NextToken of the pages they committed.
+
+        Args:
+            nextToken: NextToken to resume from. If SP-API rejects it as expired, the
+                window is fetched again from its start
+            created_after: Start of a CreatedAfter window instead of the client's filter
+            created_before: End of the CreatedAfter window
+
+        Yields:
+            Tuple of (orders, page_info) where page_info["NextToken"] is the token of the
+            following page, or None after the last page
+        """
         current_token = nextToken
         max_retries = 3
-        
+
         while True:
             retry_count = 0
+            last_status_code = None
             while retry_count < max_retries:
                 try:
-                    await self._enforce_rate_limit()
+                    bucket, headers = await self._enforce_rate_limit("getOrders", restricted=True)
                     base_url = self._get_base_url_orders(self.region)
-                    headers = self._get_headers()
-                    
-                    params = {
-                        "MarketplaceIds": self.marketplace_ids,
-                        "MaxResultsPerPage": self.MaxResultsPerPage
-                    }
-                    
-                    if current_token is not None:
-                        params["NextToken"] = current_token
-                    elif self.fill_type == "backfill":
-                        params["CreatedAfter"] = self.CreatedAfter.strftime("%Y-%m-%d")
-                    elif self.fill_type == "incremental":
-                        params["LastUpdatedAfter"] = self.LastUpdatedAfter.strftime("%Y-%m-%d")
-
-                    response = requests.get(base_url, headers=headers, params=params)
-                    self.current_status_code = response.status_code
-                    
+                    params = self._order_params(current_token, created_after, created_before)
+
+                    http_client = await get_http_client()
+                    response = await http_client.get(base_url, headers=headers, params=params)
+                    last_status_code = response.status_code
+
                     if response.status_code == 200:
+                        bucket.update(response.headers.get(RATE_LIMIT_HEADER))
                         result = response.json()
                         orders_data = result.get("payload", {}).get("Orders", [])
-                        master_orders.extend(orders_data)
-                        
                         current_token = result.get("payload", {}).get("NextToken")
-                        if current_token:
-                            print(f"Fetched {len(orders_data)} orders. Getting next page...")
-                        else:
-                            print("No more pages to fetch")
-                            break
                         break  # Success, exit retry loop
-                    
+
+                    elif response.status_code == 400 and current_token is not None and current_token == nextToken:
+                        # The checkpointed token expired before the retry, start the window over
+                        logging.warning("Resume token rejected - fetching the window from the start...")
+                        current_token = nextToken = None
+                        continue
+
                     elif response.status_code in [429, 403, 500, 502, 503, 504]:
-                        print(f"Received status code {response.status_code}, attempt {retry_count + 1} of {max_retries}")
+                        logging.warning(f"Received status code {response.status_code}, attempt {retry_count + 1} of {max_retries}")
                         retry_count += 1
-                        if retry_count == max_retries:
-                            raise Exception(f"Max retries reached. Last status code: {response.status_code}")
+                        if retry_count < max_retries:
+                            await self._handle_throttle(bucket, response, retry_count, headers)
                         continue
-                    
+
                     else:
                         raise Exception(f"Unexpected status code: {response.status_code}")
 
                 except Exception as e:
-                    print(f"Error fetching orders: {e}")
+                    logging.warning(f"Error fetching orders: {e}")
                     retry_count += 1
                     if retry_count == max_retries:
                         raise
                     await asyncio.sleep(5 * retry_count)  # Progressive backoff
-            
+            else:
+                # Raised outside the try so running out of retries never falls through to the yield
+                raise Exception(f"Max retries reached. Last status code: {last_status_code}")
+
+            if current_token:
+                logging.info(f"Fetched {len(orders_data)} orders. Getting next page...")
+            else:
+                logging.info("No more pages to fetch")
+            nextToken = None
+            yield orders_data, {"NextToken": current_token}
             if not current_token:
-                break
+                return
 
-        print(f"Total orders fetched: {len(master_orders)}")
+    async def get_orders(
+        self,
+        nextToken: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None
+    ):
+        """Fetch every page of orders into one list. Prefer iter_order_pages for large windows."""
+        master_orders = []
+        async for orders_data, _ in self.iter_order_pages(nextToken=nextToken, created_after=created_after, created_before=created_before):
+            master_orders.extend(orders_data)
+        logging.info(f"Total orders fetched: {len(master_orders)}")
         return master_orders
 
+    async def get_order_items(self, order_id: str) -> List[Dict[str, Any]]:
+        """
+        Fetch every item of one order, following the operation's own NextToken pages.
+
+        Args:
+            order_id: AmazonOrderId of the order
+
+        Returns:
+            List of the order's items
+        """
+        order_items = []
+        current_token = None
+        max_retries = 3
+
+        while True:
+            retry_count = 0
+            last_status_code = None
+            while retry_count < max_retries:
+                try:
+                    bucket, headers = await self._enforce_rate_limit("getOrderItems", restricted=True)
+                    base_url = f"{self._get_base_url_orders(self.region)}/{order_id}/orderItems"
+                    params = {"NextToken": current_token} if current_token else None
+
+                    http_client = await get_http_client()
+                    response = await http_client.get(base_url, headers=headers, params=params)
+                    last_status_code = response.status_code
+
+                    if response.status_code == 200:
+                        bucket.update(response.headers.get(RATE_LIMIT_HEADER))
+                        result = response.json()
+                        order_items.extend(result.get("payload", {}).get("OrderItems", []))
+                        current_token = result.get("payload", {}).get("NextToken")
+                        break  # Success, exit retry loop
+
+                    elif response.status_code in [429, 403, 500, 502, 503, 504]:
+                        logging.warning(f"Received status code {response.status_code} for order items, attempt {retry_count + 1} of {max_retries}")
+                        retry_count += 1
+                        if retry_count < max_retries:
+                            await self._handle_throttle(bucket, response, retry_count, headers)
+                        continue
+
+                    else:
+                        raise Exception(f"Unexpected status code: {response.status_code}")
+
+                except Exception as e:
+                    logging.warning(f"Error fetching order items: {e}")
+                    retry_count += 1
+                    if retry_count == max_retries:
+                        raise
+                    await asyncio.sleep(5 * retry_count)  # Progressive backoff
+            else:
+                # Never return partial items, enrich_orders would cache them as the order's items
+                raise Exception(f"Max retries reached. Last status code: {last_status_code}")
+
+            if not current_token:
+                return order_items
+
+    async def iter_sliced_order_pages(
+        self,
+        slices: int,
+        end_time: Optional[datetime] = None,
+        slice_tokens: Optional[Dict[str, str]] = None,
+        completed_slices: Optional[List[str]] = None
+    ) -> AsyncGenerator[Tuple[List[Dict[str, Any]], Dict[str, Any]], None]:
+        """
+        Split the backfill window into non-overlapping CreatedAfter/CreatedBefore slices
+        and page through them concurrently.
+
+        Args:
+            slices: Number of time slices to fetch at once
+            end_time: End of the window, defaults to now
+            slice_tokens: NextToken to resume each slice from, keyed by slice index
+            completed_slices: Slice indexes that were already fully fetched
 
+        Yields:
+            Tuple of (orders, page_info) where page_info also carries the "slice" key.
+            Orders already yielded by another slice are dropped.
+        """
+        # CreatedBefore must be at least two minutes in the past
+        end_time = end_time or datetime.now(timezone.utc) - timedelta(minutes=3)
+        slice_tokens = slice_tokens or {}
+        completed_slices = set(completed_slices or [])
+        windows = split_time_window(self.CreatedAfter, end_time, slices)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=len(windows) * 2)
+        done = object()
 
+        async def fetch_slice(key: str, slice_start: datetime, slice_end: datetime):
+            try:
+                async for orders, page_info in self.iter_order_pages(nextToken=slice_tokens.get(key), created_after=slice_start, created_before=slice_end):
+                    await queue.put((orders, {**page_info, "slice": key}))
+                await queue.put(done)
+            except Exception as e:
+                await queue.put(e)
+
+        tasks = [
+            asyncio.create_task(fetch_slice(str(i), slice_start, slice_end))
+            for i, (slice_start, slice_end) in enumerate(windows)
+            if str(i) not in completed_slices
+        ]
+        seen_ids = set()
+        remaining = len(tasks)
+        try:
+            while remaining:
+                item = await queue.get()
+                if item is done:
+                    remaining -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                orders, page_info = item
+                unique_orders = [order for order in orders if order.get("AmazonOrderId") not in seen_ids]
+                seen_ids.update(order.get("AmazonOrderId") for order in unique_orders)
+                yield unique_orders, page_info
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_orders_sliced(self, slices: int, end_time: Optional[datetime] = None):
+        """
+        Fetch the sliced backfill window into one list. Prefer iter_sliced_order_pages.
+
+        Returns:
+            List of all orders in the window, deduplicated by AmazonOrderId
+        """
+        master_orders = []
+        async for orders, _ in self.iter_sliced_order_pages(slices, end_time=end_time):
+            master_orders.extend(orders)
+        logging.info(f"Total orders fetched across {slices} slices: {len(master_orders)}")
+        return master_orders
@@ -0,0 +1,94 @@
+from typing import Dict, Optional, Tuple
+import asyncio
+import time
+from temporal.activities.common.metrics import observe_rate_limit_sleep
+
+'''
+@docs
+Selling Partner API rate limits - https://developer-docs.amazon.com/sp-api/docs/usage-plans-and-rate-limits
+
+Every operation has its own token bucket per selling partner and region: a burst of requests
+and a restore rate in requests per second. Responses carry the current rate in the
+x-amzn-RateLimit-Limit header. The buckets below mirror them locally, shared by every coroutine
+in the worker, so each request is sent at the earliest time the bucket allows. A 429 means the
+bucket is empty server side (e.g. another worker spent it), so it is drained here too, and the
+next request waits one restore interval of its operation instead of a fixed minute.
+'''
+
+# Default (rate per second, burst) usage plans, replaced by x-amzn-RateLimit-Limit when present
+DEFAULT_RATES: Dict[str, Tuple[float, float]] = {
+    "getOrders": (0.0167, 20),
+    "getOrder": (0.5, 30),
+    "getOrderItems": (0.5, 30),
+    "getOrderAddress": (0.5, 30),
+    "getOrderBuyerInfo": (0.5, 30),
+    "getOrderMetrics": (0.5, 15),
+    "createRestrictedDataToken": (1.0, 10),
+}
+DEFAULT_RATE = (0.5, 10)
+RATE_LIMIT_HEADER = "x-amzn-RateLimit-Limit"
+
+
+class SPAPITokenBucket:
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self) -> float:
+        """
+        Take a token for the next request, sleeping until the bucket restores one. Callers
+        are served in order, so concurrent requests never overdraw the bucket together.
+
+        Returns:
+            Seconds spent waiting
+        """
+        start = time.monotonic()
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+        # Includes waiting behind other requests for the same operation that were sleeping
+        waited = time.monotonic() - start
+        observe_rate_limit_sleep(waited)
+        return waited
+
+    def update(self, rate_limit: Optional[str]):
+        """Adopt the restore rate from a response's x-amzn-RateLimit-Limit header."""
+        if not rate_limit:
+            return
+        try:
+            rate = float(rate_limit)
+        except ValueError:
+            return
+        if rate > 0:
+            self._refill()
+            self.rate = rate
+
+    def throttled(self):
+        """The server rejected a request with 429, so its bucket is empty."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+_buckets: Dict[Tuple[str, str, str], SPAPITokenBucket] = {}
+
+
+def get_bucket(seller: str, region: str, operation: str) -> SPAPITokenBucket:
+    """Return the bucket shared by every request for this seller, region and operation in the worker process."""
+    key = (seller, region, operation)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = SPAPITokenBucket(*DEFAULT_RATES.get(operation, DEFAULT_RATE))
+        _buckets[key] = bucket
+    return bucket
@@ -22,20 +22,52 @@ def parse_datetime(dt_str, with_microseconds=False):
                 dt_str = dt_str.replace('Z', '+00:00')
             return datetime.fromisoformat(dt_str)
 
-def transform_amazon_for_clickhouse(orders_data, connection_id):
+# Column order matching the table schema
+AMAZON_COLUMN_NAMES = [
+    "AmazonOrderId", "connected_id", "PurchaseDate", "LastUpdateDate", 
+    "OrderStatus", "OrderType", "FulfillmentChannel", "SalesChannel", 
+    "ShipServiceLevel", "ShipmentServiceLevelCategory", "EarliestShipDate", 
+    "LatestShipDate", "NumberOfItemsShipped", "NumberOfItemsUnshipped", 
+    "PaymentMethod", "PaymentMethodDetails", "MarketplaceId", "SellerOrderId", 
+    "IsPremiumOrder", "IsPrime", "IsBusinessOrder", "IsReplacementOrder", 
+    "IsGlobalExpressEnabled", "HasRegulatedItems", "IsISPU", "IsAccessPointOrder", 
+    "IsSoldByAB", "OrderTotal", "OrderTotalCurrencyCode", "BuyerEmail", 
+    "ShippingAddress", "OrderItems", "batchedAt"
+]
+
+def to_uint8(value):
+    """Format boolean fields (convert to 0/1)."""
+    if isinstance(value, bool):
+        return 1 if value else 0
+    if isinstance(value, str):
+        return 1 if value.lower() == 'true' else 0
+    return 0
+
+def _order_total(order):
+    """Extract OrderTotal amount and currency or set defaults."""
+    if 'OrderTotal' in order and order['OrderTotal']:
+        try:
+            return Decimal(order['OrderTotal'].get('Amount', '0.00')), order['OrderTotal'].get('CurrencyCode', '')
+        except (TypeError, ValueError, ArithmeticError):
+            return None, ""
+    return None, ""
+
+def transform_amazon_for_clickhouse(orders_data, connection_id, batchedAt=None):
     """
     Transform Amazon Orders data for ClickHouse insertion.
     
     Args:
         orders_data: List of Amazon order dictionaries
         connection_id: The unique identifier for the connection
+        batchedAt: Batch timestamp shared by every batch of one run, defaults to now
         
     Returns:
         Tuple of (ordered_data, column_names, batchedAt)
     """
     prepared_data = []
     # Make it UTC time
-    batchedAt = datetime.now(timezone.utc).isoformat()
+    if batchedAt is None:
+        batchedAt = datetime.now(timezone.utc).isoformat()
     
     for order in orders_data:
         # Extract OrderTotal data or set defaults
@@ -63,14 +95,6 @@ def transform_amazon_for_clickhouse(orders_data, connection_id):
         if 'OrderItems' in order and order['OrderItems']:
             order_items = json.dumps(order['OrderItems'])
         
-        # Format boolean fields (convert to 0/1)
-        def to_uint8(value):
-            if isinstance(value, bool):
-                return 1 if value else 0
-            if isinstance(value, str):
-                return 1 if value.lower() == 'true' else 0
-            return 0
-        
         # Format the row according to the table schema
         row = {
             'AmazonOrderId': order.get('AmazonOrderId', ''),
@@ -110,17 +134,7 @@ def transform_amazon_for_clickhouse(orders_data, connection_id):
         prepared_data.append(row)
     
     # Define column order matching the table schema
-    column_names = [
-        "AmazonOrderId", "connected_id", "PurchaseDate", "LastUpdateDate", 
-        "OrderStatus", "OrderType", "FulfillmentChannel", "SalesChannel", 
-        "ShipServiceLevel", "ShipmentServiceLevelCategory", "EarliestShipDate", 
-        "LatestShipDate", "NumberOfItemsShipped", "NumberOfItemsUnshipped", 
-        "PaymentMethod", "PaymentMethodDetails", "MarketplaceId", "SellerOrderId", 
-        "IsPremiumOrder", "IsPrime", "IsBusinessOrder", "IsReplacementOrder", 
-        "IsGlobalExpressEnabled", "HasRegulatedItems", "IsISPU", "IsAccessPointOrder", 
-        "IsSoldByAB", "OrderTotal", "OrderTotalCurrencyCode", "BuyerEmail", 
-        "ShippingAddress", "OrderItems", "batchedAt"
-    ]
+    column_names = AMAZON_COLUMN_NAMES
     
     # Order the data according to column names
     ordered_data = []
@@ -130,6 +144,65 @@ def transform_amazon_for_clickhouse(orders_data, connection_id):
     
     return ordered_data, column_names, batchedAt
 
+def transform_amazon_for_clickhouse_columnar(orders_data, connection_id, batchedAt=None):
+    """
+    Column-oriented variant of transform_amazon_for_clickhouse. Builds one list per
+    column instead of a dict and a list per order, so the result can be inserted with
+    column_oriented=True and clickhouse_connect does not pivot rows back into columns.
+
+    Args:
+        orders_data: List of Amazon order dictionaries
+        connection_id: The unique identifier for the connection
+        batchedAt: Batch timestamp shared by every batch of one run, defaults to now
+
+    Returns:
+        Tuple of (columns, column_names, batchedAt) where columns[i] holds every value of column_names[i]
+    """
+    if batchedAt is None:
+        batchedAt = datetime.now(timezone.utc).isoformat()
+    row_count = len(orders_data)
+
+    def text(field, default=''):
+        return [order.get(field, default) for order in orders_data]
+
+    def flag(field):
+        return [to_uint8(order.get(field)) for order in orders_data]
+
+    def timestamp(field):
+        return [parse_datetime(order.get(field), with_microseconds=True) for order in orders_data]
+
+    totals = [_order_total(order) for order in orders_data]
+    columns = {
+        'AmazonOrderId': text('AmazonOrderId'),
+        'connected_id': [connection_id] * row_count,
+        'PurchaseDate': timestamp('PurchaseDate'),
+        'LastUpdateDate': timestamp('LastUpdateDate'),
+        'OrderStatus': text('OrderStatus'),
+        'OrderType': text('OrderType'),
+        'FulfillmentChannel': text('FulfillmentChannel'),
+        'SalesChannel': text('SalesChannel'),
+        'ShipServiceLevel': text('ShipServiceLevel'),
+        'ShipmentServiceLevelCategory': text('ShipmentServiceLevelCategory'),
+        'EarliestShipDate': timestamp('EarliestShipDate'),
+        'LatestShipDate': timestamp('LatestShipDate'),
+        'NumberOfItemsShipped': [int(order.get('NumberOfItemsShipped', 0)) for order in orders_data],
+        'NumberOfItemsUnshipped': [int(order.get('NumberOfItemsUnshipped', 0)) for order in orders_data],
+        'PaymentMethod': text('PaymentMethod'),
+        'PaymentMethodDetails': text('PaymentMethodDetails', []),
+        'MarketplaceId': text('MarketplaceId'),
+        'SellerOrderId': text('SellerOrderId'),
+        'OrderTotal': [total for total, _ in totals],
+        'OrderTotalCurrencyCode': [currency for _, currency in totals],
+        'BuyerEmail': [(order.get('BuyerInfo') or {}).get('BuyerEmail') for order in orders_data],
+        'ShippingAddress': [json.dumps(order['ShippingAddress']) if order.get('ShippingAddress') else '{}' for order in orders_data],
+        'OrderItems': [json.dumps(order['OrderItems']) if order.get('OrderItems') else '[]' for order in orders_data],
+        'batchedAt': [parse_datetime(batchedAt, with_microseconds=True)] * row_count,
+    }
+    for field in ['IsPremiumOrder', 'IsPrime', 'IsBusinessOrder', 'IsReplacementOrder', 'IsGlobalExpressEnabled',
+                  'HasRegulatedItems', 'IsISPU', 'IsAccessPointOrder', 'IsSoldByAB']:
+        columns[field] = flag(field)
+    return [columns[col] for col in AMAZON_COLUMN_NAMES], AMAZON_COLUMN_NAMES, batchedAt
+
 def process_amazon_orders(raw_data, connection_id):
     """
     Process raw Amazon Orders API response and transform for ClickHouse.
@@ -12,3 +12,6 @@ class AmazonOrderRequest(BaseModel):
     CreatedAfter:Optional[datetime] = None
     LastUpdatedAfter:Optional[datetime] = None
     MaxResultsPerPage:Optional[int] = 100
+    # Overrides for the SP-API and LWA hosts, e.g. to run against a stand-in server
+    endpoint:Optional[str] = None
+    token_url:Optional[str] = None
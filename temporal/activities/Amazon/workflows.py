@@ -1,8 +1,21 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from temporalio import workflow
-from .activities import amazon, AccountPayload
+from .activities import amazon, amazon_chunk, amazon_reconcile, AccountPayload, ChunkPayload, ReconcilePayload
+from temporal.activities.common.windows import split_time_window
+from temporal.activities.common.task_queues import BACKFILL_TASK_QUEUE, activity_task_queue
+from temporal.activities.common.receipts import LoadReceipt
+from temporal.activities.common.sync_plan import plan_sync, SyncPlanRequest
 from temporalio.common import RetryPolicy
+import dataclasses
 import logging
+import asyncio
+import math
+# getOrderItems runs at 0.5 requests per second, one call per enriched order. Activities that may
+# enrich get room for ENRICHED_ORDERS_BUDGET of them on top of paging getOrders; heartbeats still
+# catch an attempt that stalls.
+ORDER_ITEMS_PER_SECOND = 0.5
+ENRICHED_ORDERS_BUDGET = 10000
+ENRICHMENT_TIME = timedelta(seconds=ENRICHED_ORDERS_BUDGET / ORDER_ITEMS_PER_SECOND)
 # Always coordinate stuff between the workflows and activities
 
 # Think about what data formats are best for the workflow and activities
@@ -14,9 +27,22 @@ class AmazonETLWorkflow:
         logger = workflow.logger
         logger.info(f"AmazonETLWorkflow started for account: {request.connected_id}")
         try:
+            plan = None
+            if workflow.patched("plan-sync"):
+                # The committed watermark decides the fill type, and with it where the sync runs
+                plan = await workflow.execute_activity(
+                    plan_sync, SyncPlanRequest(connected_id=request.connected_id, last_run_ts=request.last_run_ts),
+                    retry_policy=RetryPolicy(maximum_attempts=3),start_to_close_timeout=timedelta(minutes=1)
+                )
+                request = dataclasses.replace(request, fill_type=plan.fill_type, start_time=plan.start_time)
+                is_backfill = plan.is_backfill
+            else:
+                # Started before plan_sync, route on the payload and let the activity resolve its window
+                is_backfill = request.last_run_ts is None
             logger.info("Executing amazon activity")
+            # Backfills run on their own queue so they cannot starve incremental syncs
             val = await workflow.execute_activity(
-                amazon, request, retry_policy=RetryPolicy(maximum_attempts=2),schedule_to_close_timeout=timedelta(hours=3)
+                amazon, request, task_queue=activity_task_queue(is_backfill), retry_policy=RetryPolicy(maximum_attempts=2),schedule_to_close_timeout=timedelta(hours=3) + ENRICHMENT_TIME,heartbeat_timeout=timedelta(minutes=5)
             )
             logger.info(f"Amazon activity completed successfully with result: {val}")
             return {"status": "success", "code": 200, "message": "ETL workflow completed successfully"}
@@ -24,3 +50,74 @@ class AmazonETLWorkflow:
             logger.error(f"Amazon activity failed: {str(e)}")
             return {"status": "failure", "code": 500, "message": f"ETL workflow failed: {str(e)}"}
         
+
+@workflow.defn
+class AmazonFanOutWorkflow:
+    """
+    Coordinator for large backfills. The backfill window is planned as date chunks that
+    run as separate activities, so any worker polling etl-backfill-queue can pick them up,
+    followed by a single reconciliation step that advances the watermark.
+    """
+    chunk_days = 7
+
+    @workflow.run
+    async def run(self, request: AccountPayload):
+        logger = workflow.logger
+        logger.info(f"AmazonFanOutWorkflow started for account: {request.connected_id}")
+        try:
+            plan = None
+            if workflow.patched("plan-sync"):
+                # The committed watermark decides the fill type, and with it where the sync runs
+                plan = await workflow.execute_activity(
+                    plan_sync, SyncPlanRequest(connected_id=request.connected_id, last_run_ts=request.last_run_ts),
+                    retry_policy=RetryPolicy(maximum_attempts=3),start_to_close_timeout=timedelta(minutes=1)
+                )
+                request = dataclasses.replace(request, fill_type=plan.fill_type, start_time=plan.start_time)
+                is_backfill = plan.is_backfill
+            else:
+                # Started before plan_sync, route on the payload and let the activity resolve its window
+                is_backfill = request.last_run_ts is None
+            if not is_backfill:
+                # Incremental syncs are small enough for the single activity
+                val = await workflow.execute_activity(
+                    amazon, request, retry_policy=RetryPolicy(maximum_attempts=2),schedule_to_close_timeout=timedelta(hours=3) + ENRICHMENT_TIME,heartbeat_timeout=timedelta(minutes=5)
+                )
+                logger.info(f"Amazon activity completed successfully with result: {val}")
+                return {"status": "success", "code": 200, "message": "ETL workflow completed successfully"}
+
+            # Backfill from the planned start.
+            # SP-API requires CreatedBefore to be at least two minutes in the past.
+            now = workflow.now().astimezone(timezone.utc).replace(microsecond=0) - timedelta(minutes=3)
+            if plan is not None:
+                start_time = datetime.fromisoformat(plan.start_time)
+            else:
+                start_time = (now.replace(day=1) - timedelta(days=1)).replace(day=1, hour=0, minute=0, second=0)
+            chunk_count = math.ceil((now - start_time) / timedelta(days=self.chunk_days))
+            batchedAt = workflow.now().isoformat()
+            chunks = [
+                ChunkPayload(account=request, start_time=chunk_start.isoformat(), end_time=chunk_end.isoformat(), batchedAt=batchedAt)
+                for chunk_start, chunk_end in split_time_window(start_time, now, chunk_count)
+            ]
+            logger.info(f"Planned {len(chunks)} chunks for account: {request.connected_id}")
+
+            semaphore = asyncio.Semaphore(max(1, request.max_parallel_chunks))
+
+            async def run_chunk(chunk: ChunkPayload) -> dict:
+                async with semaphore:
+                    return await workflow.execute_activity(
+                        amazon_chunk, chunk, task_queue=BACKFILL_TASK_QUEUE, retry_policy=RetryPolicy(maximum_attempts=3),start_to_close_timeout=timedelta(hours=1) + ENRICHMENT_TIME,heartbeat_timeout=timedelta(minutes=5)
+                    )
+
+            # The chunks' receipts confirm the backfill without reading the table back
+            receipt = LoadReceipt.merge(await asyncio.gather(*[run_chunk(chunk) for chunk in chunks]))
+            rows = receipt.rows
+            if rows > 0:
+                val = await workflow.execute_activity(
+                    amazon_reconcile, ReconcilePayload(connected_id=request.connected_id, batchedAt=batchedAt, rows=rows, receipt=receipt.to_dict()),
+                    retry_policy=RetryPolicy(maximum_attempts=3),start_to_close_timeout=timedelta(minutes=10)
+                )
+                logger.info(f"Amazon reconcile completed successfully with result: {val}")
+            return {"status": "success", "code": 200, "message": f"ETL workflow completed successfully with {rows} rows in {len(chunks)} chunks"}
+        except Exception as e:
+            logger.error(f"Amazon fan-out failed: {str(e)}")
+            return {"status": "failure", "code": 500, "message": f"ETL workflow failed: {str(e)}"}
@@ -2,7 +2,7 @@ from temporalio import activity
 import asyncio
 import random
 import asyncio
-from datetime import datetime
+from datetime import datetime, timezone
 from dataclasses import dataclass
 from typing import Union, List, Optional, Any
 import logging
@@ -29,6 +29,65 @@ class AccountPayload:
     clerk_org_slug: Union[str, List[str], Any]
     status: Union[str, List[str], Any]
     last_run_ts: Union[datetime, List[datetime], Any]
+    # Set by the workflow from plan_sync, so the activity extracts the window the sync was routed for
+    fill_type: Optional[str] = None
+    start_time: Optional[str] = None
+    # Backfill chunks the fan-out runs at once. Keep it within the workers' TENANT_MAX_CONCURRENT_ACTIVITIES,
+    # chunks over the tenant cap would wait while holding backfill slots
+    max_parallel_chunks: int = 2
+
+@dataclass
+class ChunkPayload:
+    account: AccountPayload
+    start_time: str
+    end_time: str
+    batchedAt: str
+
+@dataclass
+class ReconcilePayload:
+    connected_id: str
+    batchedAt: str
+    rows: int
+    # Merged LoadReceipt of the chunks, None for fan-outs started before receipts
+    receipt: Optional[dict] = None
+
+SHOPIFY_ORDERS_TABLE = "aa_master_shopify_orders"
+
+async def _load_order_pages(pages, advance, committed, heartbeat_details, shop_name, clickhouse_client, receipt=None, digests=None):
+    """
+    Load order pages into the Shopify orders table with the shared page loader, in batches of
+    SHOPIFY_LOAD_BATCH_ROWS orders.
+
+    Args:
+        pages: Async iterator of (orders, page_info) tuples
+        advance: Callback that moves a position dict past the given page_info
+        committed: Position the pages start from
+        heartbeat_details: Extra values to include in every heartbeat
+        shop_name: Connection id the rows are loaded for
+        clickhouse_client: Client used for the inserts
+        receipt: Receipt of the batches loaded by previous attempts, as a dict
+        digests: DigestIndex whose unchanged orders are skipped before the transform
+
+    Returns:
+        LoadReceipt of every batch loaded for the sync
+    """
+    # Import non-deterministic libraries only within the activity
+    from .src.transformation import transform_orders_page
+    from .src.loading import insert_batch, resolve_table, batch_dedup_token
+    from temporal.activities.common.page_loading import load_order_pages
+    import os
+
+    return await load_order_pages(
+        pages, advance, committed, heartbeat_details, shop_name, clickhouse_client,
+        table_name=await resolve_table(clickhouse_client, SHOPIFY_ORDERS_TABLE),
+        transform=transform_orders_page,
+        insert_batch=insert_batch,
+        batch_dedup_token=batch_dedup_token,
+        batch_rows=int(os.environ.get("SHOPIFY_LOAD_BATCH_ROWS", "250")),
+        receipt=receipt,
+        digests=digests,
+    )
+
 
 @activity.defn
 async def shopify(request: AccountPayload):
@@ -49,39 +108,90 @@ async def shopify(request: AccountPayload):
         '''
         # Import non-deterministic libraries only within the activity
         from .src.extraction import ShopifyClient
-        from .src.transformation import coerce_order_data, transform_for_clickhouse
-        from .src.loading import main
+        from .src.loading import get_client, confirm_load, resolve_table
+        from temporal.activities.common.watermarks import parse_watermark, resolve_start
+        from temporal.activities.common.digests import DigestIndex, change_detection_enabled
         import json
+        import os
 
-        last_run_ts = request.last_run_ts
-        fill_type = None
-        if last_run_ts is None:
-            fill_type = "backfill"
-            last_run_ts = datetime(datetime.now().year, datetime.now().month - 1, 1)
-        else:
-            fill_type = "incremental"
-            last_run_ts = last_run_ts
-            print(last_run_ts)
-            # Convert last_run_ts to datetime object - 2025-04-06 18:27:10
-            last_run_ts = datetime.strptime(last_run_ts, "%Y-%m-%d %H:%M:%S")
         shop_name = request.connected_id
         access_token = request.access_token
-        start_time = last_run_ts
+        # A retried attempt resumes after the last page that was committed to ClickHouse
+        checkpoint = activity.info().heartbeat_details
+        checkpoint = checkpoint[0] if checkpoint else {}
+        if checkpoint.get("start_time"):
+            # Cursors are only valid for the filter they were issued for, so keep the original window
+            fill_type, start_time = checkpoint["fill_type"], parse_watermark(checkpoint["start_time"])
+        elif request.fill_type:
+            # The workflow chose the task queue from this plan, so extract exactly that window
+            fill_type, start_time = request.fill_type, parse_watermark(request.start_time)
+        else:
+            # The committed watermark decides between a backfill and an overlapping incremental fetch
+            fill_type, start_time = await resolve_start(shop_name, request.last_run_ts)
+        # Backfills can be exported server side with a bulk operation instead of paging
+        use_bulk = fill_type == "backfill" and os.environ.get("SHOPIFY_BULK_BACKFILL", "false").lower() == "true"
+        # Otherwise backfills are split into this many created_at slices fetched concurrently
+        slices = int(os.environ.get("SHOPIFY_BACKFILL_SLICES", "1"))
+        use_slices = fill_type == "backfill" and not use_bulk and slices > 1
+        committed = {
+            "cursor": checkpoint.get("cursor"),
+            "bulk_operation_id": checkpoint.get("bulk_operation_id"),
+            "orders_read": checkpoint.get("orders_read", 0),
+            "slice_cursors": checkpoint.get("slice_cursors", {}),
+            "completed_slices": checkpoint.get("completed_slices", []),
+        }
+        # Slices are planned from a fixed window end so a retry reuses the same slices and cursors
+        window_end = checkpoint.get("window_end") or datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+        batchedAt = checkpoint.get("batchedAt") or datetime.now(timezone.utc).isoformat()
+        if checkpoint:
+            activity.logger.info(f"Resuming account {shop_name} from {committed} with {checkpoint.get('receipt')} already loaded")
         # Extraction.py utilization
         activity.logger.info(f"Data extracted for account {shop_name} with fill type {fill_type} and start time {start_time}")
         client = ShopifyClient(shop_name=shop_name,access_token=access_token,fill_type=fill_type,start_time=start_time)
-        orders = await client.get_orders() 
-        activity.logger.info(f"Orders extracted for account {shop_name}")
-        activity.logger.info(f"Orders: {len(orders)}")
-        # Transformation Utilization
-        master_orders = []
-        for order in orders:
-            master_orders.append(coerce_order_data(order))
-        activity.logger.info(f"Master orders: {len(master_orders)}")
-        if len(master_orders) > 0:
-            ordered_data, column_names, batchedAt = transform_for_clickhouse(master_orders, shop_name)
-        # Loading.py utilization
-            result = await main(table_name="aa_master_shopify_orders", data=ordered_data, column_names=column_names, connection_id=shop_name, batchedAt=batchedAt)
+        clickhouse_client = await get_client()
+        # Incremental syncs mostly re-read orders the previous sync already loaded unchanged
+        digests = None
+        if fill_type == "incremental" and change_detection_enabled():
+            digests = await DigestIndex.load(shop_name, id_key="id", version_key="updatedAt")
+        if use_bulk:
+            pages = client.iter_bulk_order_pages(bulk_operation_id=committed["bulk_operation_id"], skip=committed["orders_read"])
+        elif use_slices:
+            pages = client.iter_sliced_order_pages(
+                slices=slices,
+                end_time=parse_watermark(window_end),
+                slice_cursors=committed["slice_cursors"],
+                completed_slices=committed["completed_slices"],
+            )
+        else:
+            pages = client.iter_order_pages(cursor=committed["cursor"])
+
+        def advance(position, page_info):
+            if use_bulk:
+                position["bulk_operation_id"] = page_info["bulkOperationId"]
+                position["orders_read"] = page_info["ordersRead"]
+            elif use_slices:
+                if page_info.get("hasNextPage"):
+                    position["slice_cursors"][page_info["slice"]] = page_info["endCursor"]
+                else:
+                    position["completed_slices"].append(page_info["slice"])
+            else:
+                position["cursor"] = page_info.get("endCursor") or position["cursor"]
+
+        receipt = await _load_order_pages(
+            pages, advance, committed,
+            heartbeat_details={"batchedAt": batchedAt, "window_end": window_end, "fill_type": fill_type, "start_time": start_time.isoformat()},
+            shop_name=shop_name,
+            clickhouse_client=clickhouse_client,
+            receipt=checkpoint.get("receipt"),
+            digests=digests,
+        )
+
+        activity.logger.info(f"Master orders: {receipt.rows}")
+        if receipt.rows > 0:
+            result = await confirm_load(clickhouse_client, await resolve_table(clickhouse_client, SHOPIFY_ORDERS_TABLE), shop_name, batchedAt, receipt=receipt)
+            # Only orders confirmed in ClickHouse may be skipped by the next sync
+            if result and digests is not None:
+                await digests.commit()
             activity.logger.info(f"Data loaded for account {shop_name}")
             return result
         else:
@@ -90,5 +200,60 @@ async def shopify(request: AccountPayload):
             return None
     except Exception as e:
         activity.logger.error(f"Error in activities.py: {e}")
-        return None
-    
+        # Re-raise so Temporal retries the activity from the last heartbeated cursor
+        raise
+
+@activity.defn
+async def shopify_chunk(request: ChunkPayload) -> dict:
+    """
+    Extract and load the orders created in one [start_time, end_time) chunk of a fanned-out backfill.
+    Returns the chunk's load receipt as a dict.
+    """
+    try:
+        # Import non-deterministic libraries only within the activity
+        from .src.extraction import ShopifyClient
+        from .src.loading import get_client
+
+        shop_name = request.account.connected_id
+        checkpoint = activity.info().heartbeat_details
+        checkpoint = checkpoint[0] if checkpoint else {}
+        activity.logger.info(f"Chunk {request.start_time} - {request.end_time} started for account {shop_name}")
+        client = ShopifyClient(
+            shop_name=shop_name,
+            access_token=request.account.access_token,
+            fill_type="window",
+            start_time=datetime.fromisoformat(request.start_time),
+            end_time=datetime.fromisoformat(request.end_time),
+        )
+        clickhouse_client = await get_client()
+
+        def advance(position, page_info):
+            position["cursor"] = page_info.get("endCursor") or position["cursor"]
+
+        committed = {"cursor": checkpoint.get("cursor")}
+        receipt = await _load_order_pages(
+            client.iter_order_pages(cursor=committed["cursor"]), advance, committed,
+            heartbeat_details={"batchedAt": request.batchedAt},
+            shop_name=shop_name,
+            clickhouse_client=clickhouse_client,
+            receipt=checkpoint.get("receipt"),
+        )
+        activity.logger.info(f"Chunk {request.start_time} - {request.end_time} loaded {receipt.rows} rows for account {shop_name}")
+        return receipt.to_dict()
+    except Exception as e:
+        activity.logger.error(f"Error in activities.py: {e}")
+        raise
+
+@activity.defn
+async def shopify_reconcile(request: ReconcilePayload):
+    """Confirm a fanned-out backfill landed in ClickHouse and advance the connection's watermark."""
+    # Import non-deterministic libraries only within the activity
+    from .src.loading import get_client, confirm_load, resolve_table
+    from temporal.activities.common.receipts import LoadReceipt
+
+    clickhouse_client = await get_client()
+    table_name = await resolve_table(clickhouse_client, SHOPIFY_ORDERS_TABLE)
+    receipt = LoadReceipt.from_dict(request.receipt) if request.receipt else None
+    result = await confirm_load(clickhouse_client, table_name, request.connected_id, request.batchedAt, receipt=receipt)
+    activity.logger.info(f"Reconciled {request.rows} rows for account {request.connected_id}: {result}")
+    return result
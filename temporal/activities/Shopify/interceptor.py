@@ -13,6 +13,8 @@ from temporalio.worker import (
 
 with workflow.unsafe.imports_passed_through():
     from sentry_sdk import Hub, capture_exception, set_context, set_tag
+    from temporal.activities.common.metrics import activity_metrics
+    from temporal.activities.common.concurrency import tenant_slot
 
 
 def _set_common_workflow_tags(info: Union[workflow.Info, activity.Info]):
@@ -87,4 +89,50 @@ class SentryInterceptor(Interceptor):
     def workflow_interceptor_class(
         self, input: WorkflowInterceptorClassInput
     ) -> Optional[Type[WorkflowInboundInterceptor]]:
-        return _SentryWorkflowInterceptor
\ No newline at end of file
+        return _SentryWorkflowInterceptor
+
+
+def _activity_tenant(args) -> Optional[str]:
+    """Find the connected_id in an activity's payload, directly or on its account."""
+    if len(args) != 1:
+        return None
+    payload = args[0]
+    return getattr(payload, "connected_id", None) or getattr(getattr(payload, "account", None), "connected_id", None)
+
+
+class _MetricsActivityInboundInterceptor(ActivityInboundInterceptor):
+    async def execute_activity(self, input: ExecuteActivityInput) -> Any:
+        # Activities live in temporal.activities.<Platform>.activities
+        platform = input.fn.__module__.split(".")[-2].lower()
+        with activity_metrics(platform, activity.info().activity_type, _activity_tenant(input.args)):
+            return await super().execute_activity(input)
+
+
+class MetricsInterceptor(Interceptor):
+    """Temporal Interceptor class which times activities and labels their stage metrics with the platform and tenant"""
+
+    def intercept_activity(
+        self, next: ActivityInboundInterceptor
+    ) -> ActivityInboundInterceptor:
+        """Implementation of
+        :py:meth:`temporalio.worker.Interceptor.intercept_activity`.
+        """
+        return _MetricsActivityInboundInterceptor(super().intercept_activity(next))
+
+
+class _TenantConcurrencyActivityInboundInterceptor(ActivityInboundInterceptor):
+    async def execute_activity(self, input: ExecuteActivityInput) -> Any:
+        async with tenant_slot(_activity_tenant(input.args), activity.info().activity_type):
+            return await super().execute_activity(input)
+
+
+class TenantConcurrencyInterceptor(Interceptor):
+    """Temporal Interceptor class which caps how many extract and load activities of one tenant run at once in this worker"""
+
+    def intercept_activity(
+        self, next: ActivityInboundInterceptor
+    ) -> ActivityInboundInterceptor:
+        """Implementation of
+        :py:meth:`temporalio.worker.Interceptor.intercept_activity`.
+        """
+        return _TenantConcurrencyActivityInboundInterceptor(super().intercept_activity(next))
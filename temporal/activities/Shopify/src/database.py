@@ -1,13 +1,21 @@
 import json
+from datetime import datetime
 from typing import Optional
 import pandas as pd
-import psycopg2
+import psycopg
 import os
 import logging
 import sentry_sdk
+from temporal.activities.common.postgres import get_postgres_pool, submit_watermark
+from temporal.activities.common.watermarks import remember_watermark
 
 
 class SupabaseDatabase:
+    """
+    Supabase access through the worker's shared async connection pool. Queries take their
+    values as params and are never built by string interpolation.
+    """
+
     def __init__(self) -> None:
         self.host = os.environ.get("SUPABASE_HOST")
         self.dbname = os.environ.get("SUPABASE_DBNAME")
@@ -22,55 +30,44 @@ class SupabaseDatabase:
                 "Missing environment variables for Supabase database connection"
             )
 
-    def get_data(self, query, params=None) -> pd.DataFrame:
+    async def get_data(self, query, params=None) -> pd.DataFrame:
         try:
-            with psycopg2.connect(
-                dbname=self.dbname,
-                user=self.user,
-                password=self.password,
-                host=self.host,
-                port=self.port,
-            ) as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(query, params)
+            pool = await get_postgres_pool()
+            async with pool.connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(query, params)
                     columns = [desc[0] for desc in cursor.description]
-                    df = pd.DataFrame(cursor.fetchall(), columns=columns)
+                    df = pd.DataFrame(await cursor.fetchall(), columns=columns)
             if df.empty:
                 return None
             else:
                 return df
         except Exception as e:
-            # TODO: Add logging
             # TODO: Add error handling in more fine detail
+            logging.error(f"An unexpected error occurred: {e}")
             return None
 
-    def execute_query(self, query, params=None) -> bool:
+    async def execute_query(self, query, params=None) -> bool:
         """
         Execute a non-query SQL command (e.g., INSERT, UPDATE, DELETE) and return True
         only if rows were affected.
         """
         try:
-            with psycopg2.connect(
-                dbname=self.dbname,
-                user=self.user,
-                password=self.password,
-                host=self.host,
-                port=self.port,
-            ) as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(query, params)
+            pool = await get_postgres_pool()
+            # The pooled connection commits when the block exits without an error
+            async with pool.connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(query, params)
 
                     # Check if any rows were affected
                     rows_affected = cursor.rowcount
-                    conn.commit()
 
             logging.info(f"Query executed successfully. Rows affected: {rows_affected}")
 
-            # Return True only if rows were actually deleted
+            # Return True only if rows were actually affected
             return rows_affected > 0
-        except psycopg2.Error as e:
-            logging.error(f"Database error: {str(e)}", e)
-            logging.error(f"Database error: {e.pgcode} - {e.pgerror}")
+        except psycopg.Error as e:
+            logging.error(f"Database error: {str(e)}")
             logging.error(
                 f"Details: {e.diag.message_detail if e.diag else 'No additional details'}"
             )
@@ -79,4 +76,22 @@ class SupabaseDatabase:
             logging.error(f"An unexpected error occurred: {e}")
         return False
 
+    async def update_watermark(self, connected_id: str, last_successful_extraction_ts: datetime, metainfo_updated_ts: datetime) -> bool:
+        """
+        Mark a connection healthy and advance its last_successful_extraction_ts. Updates from
+        concurrently finishing syncs are written together in one statement.
 
+        Returns:
+            True if the connection's row was updated
+        """
+        try:
+            updated = await submit_watermark(connected_id, last_successful_extraction_ts, metainfo_updated_ts)
+            if updated:
+                remember_watermark(connected_id, last_successful_extraction_ts)
+            return updated
+        except psycopg.Error as e:
+            logging.error(f"Database error: {str(e)}")
+            sentry_sdk.capture_exception(e)
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+        return False
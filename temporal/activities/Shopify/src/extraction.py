@@ -1,10 +1,11 @@
-import requests
-from typing import Optional, Dict, Any, List, Generator
-from datetime import datetime
-import re
+from typing import Optional, Dict, Any, List, AsyncGenerator, Tuple
+from datetime import datetime, timezone
 import json
 import asyncio
-import time
+import logging
+from temporal.activities.common.http_client import get_http_client
+from .rate_limit import get_bucket
+from temporal.activities.common.windows import split_time_window
 
 class ShopifyClient:
 
@@ -14,16 +15,26 @@ class ShopifyClient:
         access_token: str,
         fill_type: str,
         start_time: datetime,
-        end_time: Optional[datetime] = None
+        end_time: Optional[datetime] = None,
+        base_url: Optional[str] = None
     ):
         self.api_version = "2025-01"
-        self.base_url = f"https://{shop_name}/admin/api/{self.api_version}/graphql.json"
+        # base_url points the client at a stand-in server, e.g. for offline benchmarks
+        self.base_url = base_url or f"https://{shop_name}/admin/api/{self.api_version}/graphql.json"
         self.access_token = access_token
-        self._last_request_times = []
+        self.start_time = start_time
+        self.end_time = end_time
+        # Shared with every other request to this shop in the worker process
+        self.rate_limiter = get_bucket(shop_name)
+        self.max_throttle_retries = 5
+        self.bulk_poll_interval = 10
         if fill_type == "backfill":
             self.filter_query = self._build_date_query_backfill(start_time, end_time)
         elif fill_type == "incremental":
             self.filter_query = self._build_date_query_new_fetch(start_time, end_time)
+        elif fill_type == "window":
+            # A fixed [start_time, end_time) chunk planned by the fan-out workflow
+            self.filter_query = self._build_date_query_slice(start_time, end_time)
         else:
             raise ValueError(f"Invalid fill type: {fill_type}")
 
@@ -33,24 +44,34 @@ class ShopifyClient:
             "Content-Type": "application/json",
             "X-Shopify-Access-Token": self.access_token
         }
-    # TODO: Change to async io to make data pull cleaner and avoid thread blocking
-    async def _enforce_rate_limit(self, current_credits: int):
-        """Implement rate limiting based on Shopify's throttling information"""
-        try:
-            if current_credits < 250:
-                #print(f"Available points low ({current_credits}), waiting 5 seconds")
-                await asyncio.sleep(5)
-        # TODO: Fix this because its not the right thing to have here        
-        except (KeyError, TypeError) as e:
-            #print(f"Could not parse throttle status from response: {e}")
-            # If we can't get the throttle status, wait 1 second to be safe
-            await asyncio.sleep(1)
+    async def _enforce_rate_limit(self) -> float:
+        """Wait until the shop's bucket can pay for the next query and reserve its cost"""
+        return await self.rate_limiter.acquire()
+
+    def _is_throttled(self, result: Dict[str, Any]) -> bool:
+        errors = result.get("errors") or []
+        return any((error.get("extensions") or {}).get("code") == "THROTTLED" for error in errors)
+
+    async def _post_graphql(self, query: str) -> Dict[str, Any]:
+        """Send a GraphQL document within the shop's rate limit, retrying THROTTLED responses."""
+        http_client = await get_http_client()
+        for attempt in range(self.max_throttle_retries + 1):
+            reserved = await self._enforce_rate_limit()
+            response = await http_client.post(self.base_url, headers=self._get_headers(), json={"query": query})
+            response.raise_for_status()
+            result = response.json()
+            self.rate_limiter.update(result.get("extensions", {}).get("cost", {}), reserved)
+            if not self._is_throttled(result):
+                return result
+        raise Exception(f"Shopify request still throttled after {self.max_throttle_retries + 1} attempts")
 
     def _format_datetime(self, dt: datetime, is_end_time: bool = False) -> str:
         """
         Format datetime to Shopify's expected format.
         If only date is provided (time is midnight), format accordingly.
+        Naive datetimes are taken to be UTC.
         """
+        dt = dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
         if dt.hour == 0 and dt.minute == 0 and dt.second == 0 and dt.microsecond == 0:
             # Only date was provided
             if is_end_time:
@@ -59,8 +80,7 @@ class ShopifyClient:
             # else keep start of day: 00:00:00.000Z
         
         # Convert to UTC format with 'Z' suffix
-        #print(dt.astimezone().strftime('%Y-%m-%dT%H:%M:%S')[:-3] + 'Z')
-        return dt.astimezone().strftime('%Y-%m-%dT%H:%M:%S')[:-3] + 'Z'
+        return dt.strftime('%Y-%m-%dT%H:%M:%S')[:-3] + 'Z'
 
     def _build_date_query_backfill(
         self, 
@@ -73,6 +93,14 @@ class ShopifyClient:
             query_parts += f" AND created_at:<=\'{self._format_datetime(end_time, is_end_time=True)}\')"
         return query_parts
     
+    def _build_date_query_slice(
+        self,
+        start_time: datetime,
+        end_time: datetime
+    ) -> str:
+        # Half-open range so adjacent slices never share an order
+        return f"(created_at:>=\'{self._format_datetime(start_time)}\' AND created_at:<\'{self._format_datetime(end_time)}\')"
+
     def _build_date_query_new_fetch(
         self, 
         start_time: datetime, 
@@ -86,7 +114,16 @@ class ShopifyClient:
         return query_parts
     def _return_data_points(self) -> str:
         return """
-                nodes {
+                nodes {""" + self._return_order_fields() + """}
+                pageInfo {
+                hasPreviousPage
+                hasNextPage
+                startCursor
+                endCursor
+                }
+        """
+    def _return_order_fields(self) -> str:
+        return """
                 id
                 name
                 createdAt
@@ -221,70 +258,227 @@ class ShopifyClient:
                 taxExempt
                 unpaid
                 test
-                }
-                pageInfo {
-                hasPreviousPage
-                hasNextPage
-                startCursor
-                endCursor
-                }
         """
-    async def get_orders(
+    def _build_query(self, cursor: Optional[str] = None, first: int = 250, filter_query: Optional[str] = None) -> str:
+        filter_query = filter_query or self.filter_query
+        if cursor is not None:
+            start_payload = f"""query {{ orders(after: "{cursor}", first: {first}, query: "{filter_query}") {{"""
+        else:
+            start_payload = f"""query {{ orders(first: {first}, query: "{filter_query}") {{"""
+        return start_payload + self._return_data_points() + "}}"
+
+    async def _fetch_page(
         self,
         cursor: Optional[str] = None,
-        credits: Optional[int] = None
+        first: int = 250,
+        filter_query: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Fetch a single page of orders and return the raw GraphQL response."""
+        return await self._post_graphql(self._build_query(cursor=cursor, first=first, filter_query=filter_query))
+
+    async def iter_order_pages(
+        self,
+        cursor: Optional[str] = None,
+        first: int = 250,
+        filter_query: Optional[str] = None
+    ) -> AsyncGenerator[Tuple[List[Dict[str, Any]], Dict[str, Any]], None]:
+        """
+        Yield orders one page at a time so callers can process and load each page
+        before the next one is requested.
+
+        Args:
+            cursor: Pagination cursor to start after
+            first: Number of orders per page (Shopify allows at most 250)
+            filter_query: Search filter to use instead of the client's date range
+
+        Yields:
+            Tuple of (orders, page_info) for every page within the date range
+        """
+        while True:
+            try:
+                result = await self._fetch_page(cursor=cursor, first=first, filter_query=filter_query)
+            except Exception as e:
+                logging.error(f"Error fetching orders: {str(e)}")
+                raise
+            orders_data = result.get("data", {}).get("orders", {}).get("nodes", [])
+            page_info = result.get("data", {}).get("orders", {}).get("pageInfo", {})
+            yield orders_data, page_info
+
+            if not page_info.get("hasNextPage"):
+                return
+            cursor = page_info["endCursor"]
+
+    async def get_orders(
+        self,
+        cursor: Optional[str] = None
     ):
         """
         Fetch all orders within the given date range, handling pagination automatically.
         
         Args:
-            cursor: Pagination cursor for fetching next page
-            credits: Available API credits for rate limiting
+            cursor: Pagination cursor to start after
             
         Returns:
             List of all orders within the specified date range
         """
-        first = 250
-        mid_payload = self._return_data_points()
-        end_payload = "}}"
-        if cursor is not None:
-            query_text = f"""query {{ orders(after: "{cursor}", first: {first}, query: "{self.filter_query}") {{ nodes {{ id name createdAt updatedAt cancelledAt cancelReason currencyCode currentCartDiscountAmountSet {{shopMoney {{amount currencyCode}}}} currentShippingPriceSet {{shopMoney {{amount currencyCode}}}} currentSubtotalLineItemsQuantity currentSubtotalPriceSet {{shopMoney {{amount currencyCode}}}} currentTotalAdditionalFeesSet {{shopMoney {{amount currencyCode}}}} currentTotalDiscountsSet {{shopMoney {{amount currencyCode}}}} currentTotalDutiesSet {{shopMoney {{amount currencyCode}}}} currentTotalTaxSet {{shopMoney {{amount currencyCode}}}} currentTotalPriceSet {{shopMoney {{amount currencyCode}}}} netPaymentSet {{shopMoney {{amount currencyCode}}}} discountCode displayFinancialStatus displayFulfillmentStatus dutiesIncluded fullyPaid lineItems(first: 10) {{edges {{node {{id name sku title quantity discountedUnitPriceSet{{shopMoney{{amount}}}} }}}}}} note paymentGatewayNames processedAt tags taxesIncluded taxExempt unpaid test }} pageInfo {{ hasPreviousPage hasNextPage startCursor endCursor }} }} }}"""
-            start_payload = f"""query {{ orders(after: "{cursor}", first: {first}, query: "{self.filter_query}") {{"""
-        else:
-            query_text = f"""query {{ orders(first: {first}, query: "{self.filter_query}") {{ nodes {{ id name createdAt updatedAt cancelledAt cancelReason currencyCode currentCartDiscountAmountSet {{shopMoney {{amount currencyCode}}}} currentShippingPriceSet {{shopMoney {{amount currencyCode}}}} currentSubtotalLineItemsQuantity currentSubtotalPriceSet {{shopMoney {{amount currencyCode}}}} currentTotalAdditionalFeesSet {{shopMoney {{amount currencyCode}}}} currentTotalDiscountsSet {{shopMoney {{amount currencyCode}}}} currentTotalDutiesSet {{shopMoney {{amount currencyCode}}}} currentTotalTaxSet {{shopMoney {{amount currencyCode}}}} currentTotalPriceSet {{shopMoney {{amount currencyCode}}}} netPaymentSet {{shopMoney {{amount currencyCode}}}} discountCode displayFinancialStatus displayFulfillmentStatus dutiesIncluded fullyPaid lineItems(first: 10) {{edges {{node {{id name sku title quantity discountedUnitPriceSet{{shopMoney{{amount}}}} }}}}}} note paymentGatewayNames processedAt tags taxesIncluded taxExempt unpaid test }} pageInfo {{ hasPreviousPage hasNextPage startCursor endCursor }} }} }}"""
-            start_payload = f"""query {{ orders(first: {first}, query: "{self.filter_query}") {{"""
-        final_payload = start_payload + mid_payload + end_payload
+        master_orders = []
+        async for orders_data, _ in self.iter_order_pages(cursor=cursor):
+            master_orders.extend(orders_data)
+        return master_orders
+
+    async def iter_sliced_order_pages(
+        self,
+        slices: int,
+        end_time: Optional[datetime] = None,
+        slice_cursors: Optional[Dict[str, str]] = None,
+        completed_slices: Optional[List[str]] = None,
+        first: int = 250
+    ) -> AsyncGenerator[Tuple[List[Dict[str, Any]], Dict[str, Any]], None]:
+        """
+        Split the backfill window into time slices and page through them concurrently.
+        All slices share the shop's rate limit bucket, so concurrency is bounded by the
+        API budget rather than by the number of slices.
+
+        Args:
+            slices: Number of non-overlapping created_at slices to fetch at once
+            end_time: End of the window, defaults to the client's end time or now
+            slice_cursors: Cursor to resume each slice from, keyed by slice index
+            completed_slices: Slice indexes that were already fully fetched
+            first: Number of orders per page
+
+        Yields:
+            Tuple of (orders, page_info) where page_info also carries the "slice" key.
+            Orders already yielded by another slice are dropped.
+        """
+        end_time = end_time or self.end_time or datetime.now(timezone.utc)
+        slice_cursors = slice_cursors or {}
+        completed_slices = set(completed_slices or [])
+        windows = split_time_window(self.start_time, end_time, slices)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=len(windows) * 2)
+        done = object()
+
+        async def fetch_slice(key: str, slice_start: datetime, slice_end: datetime):
+            try:
+                filter_query = self._build_date_query_slice(slice_start, slice_end)
+                async for orders, page_info in self.iter_order_pages(cursor=slice_cursors.get(key), first=first, filter_query=filter_query):
+                    await queue.put((orders, {**page_info, "slice": key}))
+                await queue.put(done)
+            except Exception as e:
+                await queue.put(e)
+
+        tasks = [
+            asyncio.create_task(fetch_slice(str(i), slice_start, slice_end))
+            for i, (slice_start, slice_end) in enumerate(windows)
+            if str(i) not in completed_slices
+        ]
+        seen_ids = set()
+        remaining = len(tasks)
         try:
-            if credits is not None:
-                await self._enforce_rate_limit(credits)
-            
-            #print(f"Fetching orders{' after ' + cursor if cursor else ''}")
-            base_url = self.base_url
-            headers = self._get_headers()
-            payload = {
-                "query": final_payload
-            }
-            response = requests.post(base_url, headers=headers, json=payload)
-            #print(response.json())
+            while remaining:
+                item = await queue.get()
+                if item is done:
+                    remaining -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                orders, page_info = item
+                unique_orders = [order for order in orders if order.get("id") not in seen_ids]
+                seen_ids.update(order.get("id") for order in unique_orders)
+                yield unique_orders, page_info
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _build_bulk_query(self) -> str:
+        # Bulk operations require edges/node connections and paginate server side
+        return f"""mutation {{ bulkOperationRunQuery(query: \"\"\"{{ orders(query: "{self.filter_query}") {{ edges {{ node {{{self._return_order_fields()}}} }} }} }}\"\"\") {{ bulkOperation {{ id status }} userErrors {{ field message }} }} }}"""
+
+    async def start_bulk_operation(self) -> str:
+        """Submit the orders export as a bulk operation and return its id."""
+        result = await self._post_graphql(self._build_bulk_query())
+        run_query = result.get("data", {}).get("bulkOperationRunQuery") or {}
+        user_errors = run_query.get("userErrors") or result.get("errors")
+        if user_errors:
+            raise Exception(f"Failed to start bulk operation: {user_errors}")
+        return run_query["bulkOperation"]["id"]
+
+    async def get_bulk_operation(self, bulk_operation_id: str) -> Dict[str, Any]:
+        query = f"""query {{ node(id: "{bulk_operation_id}") {{ ... on BulkOperation {{ id status errorCode objectCount url partialDataUrl }} }} }}"""
+        result = await self._post_graphql(query)
+        return result.get("data", {}).get("node") or {}
+
+    async def _iter_bulk_orders(self, url: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Stream the bulk operation's JSONL file and rebuild each order with its line items.
+
+        Nested connections are written as separate lines carrying __parentId, after the
+        order they belong to, so an order is complete once the next order line arrives.
+        """
+        http_client = await get_http_client()
+        current = None
+        async with http_client.stream("GET", url) as response:
             response.raise_for_status()
-            result = response.json()                   
-            orders_data = result.get("data", {}).get("orders", {}).get("nodes", [])
-            page_info = result.get("data", {}).get("orders", {}).get("pageInfo", {})
-            master_orders = []
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                obj = json.loads(line)
+                parent_id = obj.pop("__parentId", None)
+                if parent_id is None:
+                    if current is not None:
+                        yield current
+                    obj["lineItems"] = {"edges": []}
+                    current = obj
+                elif current is not None and parent_id == current.get("id"):
+                    current["lineItems"]["edges"].append({"node": obj})
+        if current is not None:
+            yield current
 
-            # Add current page of orders
-            master_orders.extend(orders_data)
+    async def iter_bulk_order_pages(
+        self,
+        bulk_operation_id: Optional[str] = None,
+        skip: int = 0,
+        first: int = 250
+    ) -> AsyncGenerator[Tuple[List[Dict[str, Any]], Dict[str, Any]], None]:
+        """
+        Export all orders in the date range with one bulk operation and yield them in pages,
+        in the same shape as iter_order_pages so the transformation stage is unchanged.
 
-            # If there are more pages, fetch them recursively
-            if page_info.get("hasNextPage"):
-                cursor = page_info["endCursor"]
-                credits = result.get("extensions", {}).get("cost", {}).get("throttleStatus", {}).get("currentlyAvailable", 0)
-                next_page_orders = await self.get_orders(cursor=cursor, credits=credits)
-                master_orders.extend(next_page_orders)
-            
-            return master_orders
-        # TODO: Add error handling
-        except Exception as e:
-            print(f"Error fetching orders: {str(e)}")
-            raise
+        Args:
+            bulk_operation_id: Attach to an existing bulk operation instead of submitting one
+            skip: Number of orders at the start of the file that were already processed
+            first: Number of orders per yielded page
+
+        Yields:
+            Tuple of (orders, progress). While the operation runs, orders is empty and progress
+            only reports its status, so callers can heartbeat the bulk operation id.
+        """
+        if bulk_operation_id is None:
+            bulk_operation_id = await self.start_bulk_operation()
+        while True:
+            operation = await self.get_bulk_operation(bulk_operation_id)
+            status = operation.get("status")
+            progress = {"bulkOperationId": bulk_operation_id, "status": status, "ordersRead": skip}
+            if status == "COMPLETED":
+                break
+            if status in ("FAILED", "CANCELED", "CANCELING", "EXPIRED") or status is None:
+                raise Exception(f"Bulk operation {bulk_operation_id} ended with status {status}: {operation.get('errorCode')}")
+            yield [], progress
+            await asyncio.sleep(self.bulk_poll_interval)
+
+        url = operation.get("url")
+        if not url:
+            # Completed without matching any orders
+            return
+        orders_read = 0
+        page = []
+        async for order in self._iter_bulk_orders(url):
+            orders_read += 1
+            if orders_read <= skip:
+                continue
+            page.append(order)
+            if len(page) >= first:
+                yield page, {"bulkOperationId": bulk_operation_id, "status": status, "ordersRead": orders_read}
+                page = []
+        if page:
+            yield page, {"bulkOperationId": bulk_operation_id, "status": status, "ordersRead": orders_read}
 
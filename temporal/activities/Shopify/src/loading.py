@@ -3,28 +3,99 @@ import clickhouse_connect
 import asyncio
 from datetime import datetime
 from temporal.activities.Shopify.src.database import SupabaseDatabase
+from temporal.activities.common.clickhouse import get_clickhouse_client, ensure_replacing_table, insert_dedup_token
+from temporal.activities.common.metrics import stage_timer
+from temporal.activities.common.receipts import LoadReceipt
 import os
 import logging
-async def main(table_name,data,column_names,connection_id,batchedAt):
-    clickhouse_host = os.environ.get("CLICKHOUSE_HOST")
-    clickhouse_user = os.environ.get("CLICKHOUSE_USER")
-    clickhouse_password = os.environ.get("CLICKHOUSE_PASSWORD")
-    client_1 = await clickhouse_connect.get_async_client(
-        host=clickhouse_host,
-        user=clickhouse_user,
-        password=clickhouse_password,
-        secure=True,
-    )
-    result = await client_1.insert(
-        table=table_name,
-        data=data,
-        column_names=column_names
-    )
-    logging.info("Completed")
-    data_check = await client_1.query(
-        f"SELECT MAX(updatedAt),MAX(createdAt),MAX(batchedAt) FROM {table_name} where connection_id = '{connection_id}';"
-    )
-    await client_1.close()
+
+# Last update time of an order, the watermark of a sync and the ReplacingMergeTree version
+VERSION_COLUMN = "updatedAt"
+# ReplacingMergeTree layout used when CLICKHOUSE_LOAD_MODE=replacing
+REPLACING_ORDER_BY = "(connection_id, id)"
+REPLACING_PARTITION_BY = "toYYYYMM(createdAt)"
+# Columns that identify one version of an order, hashed into each batch's dedup token
+DEDUP_KEY_COLUMNS = ["id", "updatedAt"]
+
+async def get_client():
+    """Return the worker's shared ClickHouse client. Callers must not close it."""
+    return await get_clickhouse_client()
+
+def load_mode():
+    return os.environ.get("CLICKHOUSE_LOAD_MODE", "append")
+
+def replacing_table_name(table_name):
+    return table_name + os.environ.get("CLICKHOUSE_REPLACING_TABLE_SUFFIX", "_replacing")
+
+async def resolve_table(client,table_name):
+    """
+    Return the table loads should write to. In replacing mode that is a ReplacingMergeTree
+    copy of table_name, created on first use, so reads need neither FINAL nor GROUP BY dedup
+    once its partitions are merged.
+    """
+    if load_mode() != "replacing":
+        return table_name
+    target = replacing_table_name(table_name)
+    await ensure_replacing_table(client, table_name, target, VERSION_COLUMN, REPLACING_ORDER_BY, REPLACING_PARTITION_BY)
+    return target
+
+def batch_dedup_token(connection_id,columns,column_names):
+    """Deterministic insert_deduplication_token for a column-oriented batch."""
+    return insert_dedup_token(connection_id, *[columns[column_names.index(column)] for column in DEDUP_KEY_COLUMNS])
+
+async def insert_batch(client,table_name,data,column_names,column_oriented=False,dedup_token=None,receipt=None):
+    """
+    Insert one batch without running the post-load checks. With column_oriented=True,
+    data holds one list per column, as returned by the *_columnar transforms. A dedup_token
+    makes ClickHouse ignore the insert if a block with the same token was already written.
+    A column-oriented batch is recorded in receipt, if given, for confirm_load.
+    """
+    row_count = len(data[0]) if column_oriented and data else len(data)
+    settings = {"insert_deduplication_token": dedup_token} if dedup_token else None
+    with stage_timer("load", rows=row_count):
+        result = await client.insert(
+            table=table_name,
+            data=data,
+            column_names=column_names,
+            column_oriented=column_oriented,
+            settings=settings
+        )
+    if receipt is not None and column_oriented:
+        receipt.add_batch(row_count, result.written_rows, data[column_names.index(VERSION_COLUMN)], dedup_token)
+    logging.info(f"Inserted {row_count} rows into {table_name}")
+    return result
+
+async def confirm_load(client,table_name,connection_id,batchedAt,receipt=None):
+    """
+    Confirm the sync landed in ClickHouse and record the run in postgres.
+
+    With a receipt the load is confirmed from the inserts' own summaries and the watermark is
+    the newest version among the inserted rows, so the check costs O(batch). Without one,
+    e.g. for a fan-out whose chunks predate receipts, the connection's rows are read back.
+    """
+    if receipt is None:
+        return await _confirm_from_table(client, table_name, connection_id, batchedAt)
+    result = False
+    with stage_timer("confirm"):
+        if not receipt.confirmed:
+            logging.info(f"Data check failed: {receipt}")
+            return result
+        logging.info("Data check passed")
+        db = SupabaseDatabase()
+        result = await db.update_watermark(
+            connected_id=connection_id,
+            last_successful_extraction_ts=receipt.watermark,
+            metainfo_updated_ts=datetime.fromisoformat(batchedAt).replace(tzinfo=None, microsecond=0)
+        )
+    logging.info(result)
+    return result
+
+async def _confirm_from_table(client,table_name,connection_id,batchedAt):
+    result = False
+    with stage_timer("confirm"):
+        data_check = await client.query(
+            f"SELECT MAX(updatedAt),MAX(createdAt),MAX(batchedAt) FROM {table_name} where connection_id = '{connection_id}';"
+        )
     logging.info("Data check")
     c_updatedAt = data_check.result_rows[0][0]
     c_createdAt = data_check.result_rows[0][1]
@@ -33,21 +104,26 @@ async def main(table_name,data,column_names,connection_id,batchedAt):
     logging.info(c_batchedAt,b_batchedAt)
     if c_batchedAt == b_batchedAt:
         logging.info("Data check passed")
-        logging.info("Need to add postgres update here")   
         db = SupabaseDatabase()
-        query = f'''UPDATE "etl-highlevel-log" 
-        SET last_successful_extraction_ts = '{c_updatedAt}',
-            is_active = true,  -- Replace with your desired boolean value
-            health_status = 'healthy',  -- Replace with your desired status value
-            last_error = null,  -- Replace with error details if needed, or null to clear it
-            metainfo_updated_ts = '{b_batchedAt}'  -- Uses current timestamp, or specify a value
-        WHERE connected_id = '{connection_id}' '''
-        result = db.execute_query(query)
+        result = await db.update_watermark(
+            connected_id=connection_id,
+            last_successful_extraction_ts=c_updatedAt,
+            metainfo_updated_ts=datetime.fromisoformat(batchedAt).replace(tzinfo=None, microsecond=0)
+        )
         logging.info(result)
     else:
         logging.info("Data check failed")
     return result
 
+async def main(table_name,data,column_names,connection_id,batchedAt,column_oriented=False):
+    client_1 = await get_client()
+    table_name = await resolve_table(client_1, table_name)
+    dedup_token = batch_dedup_token(connection_id, data, column_names) if column_oriented else None
+    receipt = LoadReceipt() if column_oriented else None
+    await insert_batch(client_1, table_name, data, column_names, column_oriented=column_oriented, dedup_token=dedup_token, receipt=receipt)
+    logging.info("Completed")
+    return await confirm_load(client_1, table_name, connection_id, batchedAt, receipt=receipt)
+
 if __name__ == "__main__":
     logging.info("Imports Worked??")
-    
+
@@ -0,0 +1,105 @@
+from typing import Optional, Dict, Any
+import asyncio
+import time
+from temporal.activities.common.metrics import observe_rate_limit_sleep
+
+'''
+@docs
+Shopify GraphQL Admin API rate limits - https://shopify.dev/docs/api/usage/rate-limits#graphql-admin-api-rate-limits
+
+Every response carries extensions.cost.throttleStatus, which describes the shop's leaky bucket
+(maximumAvailable, currentlyAvailable, restoreRate). The bucket below mirrors it locally so each
+request waits exactly as long as the bucket needs to restore the query's cost.
+'''
+
+# Standard plan defaults, replaced by the real values after the first response
+DEFAULT_MAXIMUM_AVAILABLE = 1000.0
+DEFAULT_RESTORE_RATE = 50.0
+DEFAULT_QUERY_COST = 100.0
+
+
+class ShopifyCostBucket:
+
+    def __init__(
+        self,
+        maximum_available: float = DEFAULT_MAXIMUM_AVAILABLE,
+        restore_rate: float = DEFAULT_RESTORE_RATE
+    ):
+        self.maximum_available = maximum_available
+        self.restore_rate = restore_rate
+        self.currently_available = maximum_available
+        self.query_cost = DEFAULT_QUERY_COST
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self.currently_available = min(
+            self.maximum_available,
+            self.currently_available + elapsed * self.restore_rate
+        )
+        self._updated_at = now
+
+    async def acquire(self, cost: Optional[float] = None) -> float:
+        """
+        Reserve points for the next query, sleeping only as long as the bucket
+        needs to restore them. Callers are served in order, so concurrent
+        requests for one shop never overdraw the bucket together.
+
+        Args:
+            cost: Expected cost of the query, defaults to the last requestedQueryCost
+
+        Returns:
+            The number of points reserved
+        """
+        cost = min(cost if cost is not None else self.query_cost, self.maximum_available)
+        start = time.monotonic()
+        async with self._lock:
+            self._refill()
+            if self.currently_available < cost:
+                await asyncio.sleep((cost - self.currently_available) / self.restore_rate)
+                self._refill()
+            self.currently_available -= cost
+        # Includes waiting behind other requests to the shop that were sleeping
+        observe_rate_limit_sleep(time.monotonic() - start)
+        return cost
+
+    def update(self, cost: Dict[str, Any], reserved: float = 0.0):
+        """
+        Reconcile the local bucket with extensions.cost from a response.
+
+        Args:
+            cost: The extensions.cost object returned by Shopify
+            reserved: Points reserved by acquire() for the request that produced it
+        """
+        if not cost:
+            return
+        throttle_status = cost.get("throttleStatus") or {}
+        self._refill()
+        if throttle_status.get("maximumAvailable"):
+            self.maximum_available = float(throttle_status["maximumAvailable"])
+        if throttle_status.get("restoreRate"):
+            self.restore_rate = float(throttle_status["restoreRate"])
+        if cost.get("requestedQueryCost") is not None:
+            self.query_cost = float(cost["requestedQueryCost"])
+        # Refund the part of the reservation the query did not use
+        actual_cost = cost.get("actualQueryCost")
+        if actual_cost is not None:
+            self.currently_available += max(0.0, reserved - float(actual_cost))
+        # The server's figure does not include requests still in flight, so it only ever lowers ours
+        if throttle_status.get("currentlyAvailable") is not None:
+            self.currently_available = min(self.currently_available, float(throttle_status["currentlyAvailable"]))
+        self.currently_available = min(self.currently_available, self.maximum_available)
+
+
+_buckets: Dict[str, ShopifyCostBucket] = {}
+
+
+def get_bucket(shop_name: str) -> ShopifyCostBucket:
+    """Return the bucket shared by every request to this shop in the worker process."""
+    bucket = _buckets.get(shop_name)
+    if bucket is None:
+        bucket = ShopifyCostBucket()
+        _buckets[shop_name] = bucket
+    return bucket
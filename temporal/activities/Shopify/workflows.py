@@ -1,8 +1,15 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from temporalio import workflow
-from .activities import shopify, AccountPayload
+from .activities import shopify, shopify_chunk, shopify_reconcile, AccountPayload, ChunkPayload, ReconcilePayload
+from temporal.activities.common.windows import split_time_window
+from temporal.activities.common.task_queues import BACKFILL_TASK_QUEUE, activity_task_queue
+from temporal.activities.common.receipts import LoadReceipt
+from temporal.activities.common.sync_plan import plan_sync, SyncPlanRequest
 from temporalio.common import RetryPolicy
+import dataclasses
 import logging
+import asyncio
+import math
 # Always coordinate stuff between the workflows and activities
 # Think about what data formats are best for the workflow and activities
 
@@ -13,9 +20,22 @@ class ShopifyETLWorkflow:
         logger = workflow.logger
         logger.info(f"ShopifyETLWorkflow started for account: {request.connected_id}")
         try:
+            plan = None
+            if workflow.patched("plan-sync"):
+                # The committed watermark decides the fill type, and with it where the sync runs
+                plan = await workflow.execute_activity(
+                    plan_sync, SyncPlanRequest(connected_id=request.connected_id, last_run_ts=request.last_run_ts),
+                    retry_policy=RetryPolicy(maximum_attempts=3),start_to_close_timeout=timedelta(minutes=1)
+                )
+                request = dataclasses.replace(request, fill_type=plan.fill_type, start_time=plan.start_time)
+                is_backfill = plan.is_backfill
+            else:
+                # Started before plan_sync, route on the payload and let the activity resolve its window
+                is_backfill = request.last_run_ts is None
             logger.info("Executing shopify activity")
+            # Backfills run on their own queue so they cannot starve incremental syncs
             val = await workflow.execute_activity(
-                shopify, request, retry_policy=RetryPolicy(maximum_attempts=2),schedule_to_close_timeout=timedelta(hours=3)
+                shopify, request, task_queue=activity_task_queue(is_backfill), retry_policy=RetryPolicy(maximum_attempts=2),schedule_to_close_timeout=timedelta(hours=3),heartbeat_timeout=timedelta(minutes=5)
             )
             logger.info(f"Shopify activity completed successfully with result: {val}")
             return {"status": "success", "code": 200, "message": "ETL workflow completed successfully"}
@@ -23,3 +43,73 @@ class ShopifyETLWorkflow:
             logger.error(f"Shopify activity failed: {str(e)}")
             return {"status": "failure", "code": 500, "message": f"ETL workflow failed: {str(e)}"}
         
+
+@workflow.defn
+class ShopifyFanOutWorkflow:
+    """
+    Coordinator for large backfills. The backfill window is planned as date chunks that
+    run as separate activities, so any worker polling etl-backfill-queue can pick them up,
+    followed by a single reconciliation step that advances the watermark.
+    """
+    chunk_days = 7
+
+    @workflow.run
+    async def run(self, request: AccountPayload):
+        logger = workflow.logger
+        logger.info(f"ShopifyFanOutWorkflow started for account: {request.connected_id}")
+        try:
+            plan = None
+            if workflow.patched("plan-sync"):
+                # The committed watermark decides the fill type, and with it where the sync runs
+                plan = await workflow.execute_activity(
+                    plan_sync, SyncPlanRequest(connected_id=request.connected_id, last_run_ts=request.last_run_ts),
+                    retry_policy=RetryPolicy(maximum_attempts=3),start_to_close_timeout=timedelta(minutes=1)
+                )
+                request = dataclasses.replace(request, fill_type=plan.fill_type, start_time=plan.start_time)
+                is_backfill = plan.is_backfill
+            else:
+                # Started before plan_sync, route on the payload and let the activity resolve its window
+                is_backfill = request.last_run_ts is None
+            if not is_backfill:
+                # Incremental syncs are small enough for the single activity
+                val = await workflow.execute_activity(
+                    shopify, request, retry_policy=RetryPolicy(maximum_attempts=2),schedule_to_close_timeout=timedelta(hours=3),heartbeat_timeout=timedelta(minutes=5)
+                )
+                logger.info(f"Shopify activity completed successfully with result: {val}")
+                return {"status": "success", "code": 200, "message": "ETL workflow completed successfully"}
+
+            # Backfill from the planned start up to now
+            now = workflow.now().astimezone(timezone.utc).replace(microsecond=0)
+            if plan is not None:
+                start_time = datetime.fromisoformat(plan.start_time)
+            else:
+                start_time = (now.replace(day=1) - timedelta(days=1)).replace(day=1, hour=0, minute=0, second=0)
+            chunk_count = math.ceil((now - start_time) / timedelta(days=self.chunk_days))
+            batchedAt = workflow.now().isoformat()
+            chunks = [
+                ChunkPayload(account=request, start_time=chunk_start.isoformat(), end_time=chunk_end.isoformat(), batchedAt=batchedAt)
+                for chunk_start, chunk_end in split_time_window(start_time, now, chunk_count)
+            ]
+            logger.info(f"Planned {len(chunks)} chunks for account: {request.connected_id}")
+
+            semaphore = asyncio.Semaphore(max(1, request.max_parallel_chunks))
+
+            async def run_chunk(chunk: ChunkPayload) -> dict:
+                async with semaphore:
+                    return await workflow.execute_activity(
+                        shopify_chunk, chunk, task_queue=BACKFILL_TASK_QUEUE, retry_policy=RetryPolicy(maximum_attempts=3),start_to_close_timeout=timedelta(hours=1),heartbeat_timeout=timedelta(minutes=5)
+                    )
+
+            # The chunks' receipts confirm the backfill without reading the table back
+            receipt = LoadReceipt.merge(await asyncio.gather(*[run_chunk(chunk) for chunk in chunks]))
+            rows = receipt.rows
+            if rows > 0:
+                val = await workflow.execute_activity(
+                    shopify_reconcile, ReconcilePayload(connected_id=request.connected_id, batchedAt=batchedAt, rows=rows, receipt=receipt.to_dict()),
+                    retry_policy=RetryPolicy(maximum_attempts=3),start_to_close_timeout=timedelta(minutes=10)
+                )
+                logger.info(f"Shopify reconcile completed successfully with result: {val}")
+            return {"status": "success", "code": 200, "message": f"ETL workflow completed successfully with {rows} rows in {len(chunks)} chunks"}
+        except Exception as e:
+            logger.error(f"Shopify fan-out failed: {str(e)}")
+            return {"status": "failure", "code": 500, "message": f"ETL workflow failed: {str(e)}"}
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, Optional, Sequence, Set
+import clickhouse_connect
+from clickhouse_connect.driver import httputil
+from clickhouse_connect.driver.asyncclient import AsyncClient
+
+'''
+@docs
+Process-wide ClickHouse client shared by every load in the worker. The worker opens it once at
+startup so activities skip the TLS handshake and settings negotiation, and concurrent activities
+share one urllib3 connection pool. Session ids are disabled because a ClickHouse session only
+allows one query at a time.
+
+With CLICKHOUSE_LOAD_MODE=replacing, orders are loaded into a ReplacingMergeTree copy of each
+orders table. Re-fetched orders then replace their older versions instead of piling up as
+duplicates, and every batch carries an insert_deduplication_token so retried inserts are dropped.
+Loads create the copy if it is missing, empty. The original table is left as it is, and its
+history is copied over once by the migrate_replacing_tables command.
+'''
+
+
+class ClickHousePool:
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        health_check_interval: Optional[float] = None
+    ):
+        self.maxsize = maxsize or int(os.environ.get("CLICKHOUSE_POOL_SIZE", "16"))
+        self.health_check_interval = health_check_interval or float(os.environ.get("CLICKHOUSE_HEALTH_CHECK_SECONDS", "30"))
+        # Activities keep the client they were given for their whole load, so a replaced client
+        # is only closed after this long
+        self.retire_grace = float(os.environ.get("CLICKHOUSE_RETIRE_GRACE_SECONDS", "600"))
+        self._client: Optional[AsyncClient] = None
+        self._retiring: Dict[asyncio.Task, AsyncClient] = {}
+        self._last_checked = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> AsyncClient:
+        client = await clickhouse_connect.get_async_client(
+            host=os.environ.get("CLICKHOUSE_HOST"),
+            user=os.environ.get("CLICKHOUSE_USER"),
+            password=os.environ.get("CLICKHOUSE_PASSWORD"),
+            secure=True,
+            autogenerate_session_id=False,
+            pool_mgr=httputil.get_pool_manager(maxsize=self.maxsize, num_pools=1),
+        )
+        self._last_checked = time.monotonic()
+        logging.info("ClickHouse client connected")
+        return client
+
+    async def open(self) -> AsyncClient:
+        """Connect eagerly, e.g. at worker startup."""
+        return await self.acquire()
+
+    async def acquire(self) -> AsyncClient:
+        """Return the shared client, reconnecting if the last health check is stale and fails."""
+        async with self._lock:
+            if self._client is None:
+                self._client = await self._connect()
+            elif time.monotonic() - self._last_checked > self.health_check_interval:
+                healthy = False
+                try:
+                    healthy = await self._client.ping()
+                except Exception as e:
+                    logging.warning(f"ClickHouse health check failed: {e}")
+                if healthy:
+                    self._last_checked = time.monotonic()
+                else:
+                    # Other activities may still be using the old client, so swap before closing it
+                    stale, self._client = self._client, await self._connect()
+                    self._retire(stale)
+            return self._client
+
+    def _retire(self, client: AsyncClient):
+        task = asyncio.create_task(self._close_later(client))
+        self._retiring[task] = client
+        task.add_done_callback(lambda done: self._retiring.pop(done, None))
+
+    async def _close_later(self, client: AsyncClient):
+        await asyncio.sleep(self.retire_grace)
+        await self._close(client)
+
+    async def _close(self, client: AsyncClient):
+        try:
+            await client.close()
+        except Exception as e:
+            logging.warning(f"Error closing ClickHouse client: {e}")
+
+    async def close(self):
+        async with self._lock:
+            # Closes the retired clients right away too, e.g. when the worker shuts down
+            retiring, self._retiring = self._retiring, {}
+            for task, client in retiring.items():
+                task.cancel()
+                await self._close(client)
+            if self._client is not None:
+                await self._close(self._client)
+            self._client = None
+
+
+_pool = ClickHousePool()
+
+
+async def get_clickhouse_client() -> AsyncClient:
+    """Return the process-wide ClickHouse client, connecting lazily on first use."""
+    return await _pool.acquire()
+
+
+async def open_clickhouse_pool() -> AsyncClient:
+    return await _pool.open()
+
+
+async def close_clickhouse_pool() -> None:
+    await _pool.close()
+
+
+_replacing_tables: Set[str] = set()
+_replacing_lock = asyncio.Lock()
+
+
+def insert_dedup_token(connection_id: str, *key_columns: Sequence) -> str:
+    """
+    Build a deterministic insert_deduplication_token for one batch from its rows' keys, e.g. the
+    id and updatedAt columns. A retried attempt that re-inserts the same batch gets the same token,
+    so ClickHouse drops the repeat instead of writing the rows twice.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row in zip(*key_columns):
+        digest.update(("\x1f".join(str(value) for value in row) + "\x1e").encode())
+    return f"{connection_id}:{digest.hexdigest()}"
+
+
+async def ensure_replacing_table(
+    client: AsyncClient,
+    source_table: str,
+    table: str,
+    version_column: str,
+    order_by: str,
+    partition_by: str
+) -> None:
+    """
+    Create `table` with the columns of `source_table` as a ReplacingMergeTree versioned by
+    `version_column`, so rows sharing an ORDER BY key collapse to their newest version on merge.
+    The table is created empty, see migrate_replacing_tables for copying the rows over.
+    The sorting, partition and version columns must not be Nullable.
+    """
+    if table in _replacing_tables:
+        return
+    async with _replacing_lock:
+        if table in _replacing_tables:
+            return
+        await client.command(
+            f"CREATE TABLE IF NOT EXISTS {table} AS {source_table} "
+            f"ENGINE = ReplacingMergeTree({version_column}) "
+            f"PARTITION BY {partition_by} ORDER BY {order_by} "
+            # Lets insert_deduplication_token work on non-replicated tables too
+            f"SETTINGS non_replicated_deduplication_window = 1000"
+        )
+        _replacing_tables.add(table)
+    logging.info(f"Using ReplacingMergeTree table {table}")
+
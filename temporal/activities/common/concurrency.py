@@ -0,0 +1,63 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from temporalio import activity
+
+'''
+@docs
+Per-tenant concurrency cap for activities in one worker process. Without it, a shop with a
+fanned-out backfill and a retried sync can hold most of the worker's activity slots. A capped
+activity waits for its tenant's slot and keeps heartbeating the previous attempt's checkpoint,
+so it neither times out nor loses the position it resumes from. A waiting activity still holds
+a worker slot, so the fan-out workflows never run more chunks of one tenant than the cap.
+
+Only the long-running extract and load activities in CAPPED_ACTIVITY_TYPES are capped. Short
+steps such as plan_sync and reconcile run straight away, so they neither time out behind a
+tenant's syncs nor take a slot from the chunks of their own fan-out.
+'''
+
+HEARTBEAT_INTERVAL_SECONDS = 30
+CAPPED_ACTIVITY_TYPES = frozenset({"shopify", "shopify_chunk", "amazon", "amazon_chunk"})
+
+
+class TenantLimiter:
+
+    def __init__(self, max_concurrent: Optional[int] = None):
+        self.max_concurrent = max_concurrent if max_concurrent is not None else int(os.environ.get("TENANT_MAX_CONCURRENT_ACTIVITIES", "2"))
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, tenant: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(tenant)
+        if semaphore is None:
+            semaphore = self._semaphores[tenant] = asyncio.Semaphore(self.max_concurrent)
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self, tenant: Optional[str]):
+        """Hold one of the tenant's slots for the duration of the block. 0 disables the cap."""
+        if not tenant or self.max_concurrent <= 0:
+            yield
+            return
+        semaphore = self._semaphore(tenant)
+        while True:
+            try:
+                # Unlike wait_for, timeout() cannot drop a permit acquired just as the timer fires
+                async with asyncio.timeout(HEARTBEAT_INTERVAL_SECONDS):
+                    await semaphore.acquire()
+                break
+            except TimeoutError:
+                activity.logger.info(f"Waiting for a free slot for tenant {tenant}")
+                activity.heartbeat(*activity.info().heartbeat_details)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+_limiter = TenantLimiter()
+
+
+def tenant_slot(tenant: Optional[str], activity_type: str):
+    """Return the process-wide slot context manager for a tenant's activity, a no-op unless the activity type is capped."""
+    return _limiter.slot(tenant if activity_type in CAPPED_ACTIVITY_TYPES else None)
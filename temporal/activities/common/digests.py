@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import os
+import struct
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from psycopg import sql
+from temporal.activities.common.postgres import get_postgres_pool
+
+'''
+@docs
+Change detection for incremental syncs. An incremental sync re-reads every order updated since
+the watermark minus the overlap, and most of those were already loaded unchanged by the
+previous sync. DigestIndex remembers a 64-bit digest of (order id, version) for every order a
+connection recently loaded. Orders whose digest is known are dropped before they are
+transformed, so they cost neither transform CPU nor ClickHouse writes and merges.
+
+The index of a connection is one bytea row in the etl-order-digests Postgres table, packed as
+(digest, recorded epoch second) pairs of 12 bytes. Digests older than ORDER_DIGEST_RETENTION_HOURS
+are pruned on write, which keeps the row to the orders an overlapping sync can see again. Writes
+merge into the stored row under SELECT ... FOR UPDATE rather than replacing it, so syncs of one
+connection that finish at the same time do not drop each other's digests.
+New digests are only written after the load they belong to is confirmed, so an order is never
+skipped unless it is in ClickHouse. Set ETL_CHANGE_DETECTION=false to disable the index.
+'''
+
+DIGEST_TABLE = "etl-order-digests"
+
+_ENTRY = struct.Struct("<QI")
+_table_ready = False
+
+
+def change_detection_enabled() -> bool:
+    return os.environ.get("ETL_CHANGE_DETECTION", "true").lower() == "true"
+
+
+def _retention_seconds() -> float:
+    return float(os.environ.get("ORDER_DIGEST_RETENTION_HOURS", "72")) * 3600
+
+
+def order_digest(order_id: Any, version: Any) -> int:
+    digest = hashlib.blake2b(f"{order_id}\x1f{version}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+async def _ensure_table(conn):
+    global _table_ready
+    if _table_ready:
+        return
+    await conn.execute(sql.SQL('''CREATE TABLE IF NOT EXISTS {table} (
+        connected_id text PRIMARY KEY,
+        digests bytea NOT NULL,
+        updated_ts timestamp NOT NULL DEFAULT now()
+    )''').format(table=sql.Identifier(DIGEST_TABLE)))
+    _table_ready = True
+
+
+class DigestIndex:
+    """
+    The (order id, version) digests recently loaded for one connection.
+
+    Args:
+        connected_id: The connection the index belongs to
+        id_key: Key of the order id in the raw API orders
+        version_key: Key of the last update time in the raw API orders
+    """
+
+    def __init__(self, connected_id: str, id_key: str, version_key: str, known: Optional[Dict[int, int]] = None):
+        self.connected_id = connected_id
+        self.id_key = id_key
+        self.version_key = version_key
+        self.known: Dict[int, int] = known or {}
+        self.pending: Dict[int, int] = {}
+
+    @classmethod
+    async def load(cls, connected_id: str, id_key: str, version_key: str) -> "DigestIndex":
+        """Read the connection's index. An unreadable index is treated as empty."""
+        known: Dict[int, int] = {}
+        try:
+            pool = await get_postgres_pool()
+            async with pool.connection() as conn:
+                await _ensure_table(conn)
+                cursor = await conn.execute(
+                    sql.SQL("SELECT digests FROM {table} WHERE connected_id = %s").format(table=sql.Identifier(DIGEST_TABLE)),
+                    (connected_id,),
+                )
+                row = await cursor.fetchone()
+            if row:
+                known = dict(_ENTRY.iter_unpack(bytes(row[0])))
+        except Exception as e:
+            logging.warning(f"Could not read the order digests of {connected_id}, loading every order: {e}")
+        return cls(connected_id, id_key, version_key, known)
+
+    def filter(self, orders: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Return the orders that are new or changed since they were last loaded, and stage their
+        digests for commit().
+        """
+        now = int(time.time())
+        changed = []
+        for order in orders:
+            digest = order_digest(order.get(self.id_key), order.get(self.version_key))
+            if digest in self.known or digest in self.pending:
+                continue
+            self.pending[digest] = now
+            changed.append(order)
+        return changed
+
+    async def commit(self) -> bool:
+        """
+        Persist the staged digests once their load is confirmed, pruning expired ones.
+        The stored row is read back under a row lock and merged with them, so concurrent
+        syncs of one connection, e.g. the chunks of a backfill, keep each other's digests.
+
+        Returns:
+            True if the index was written
+        """
+        if not self.pending:
+            return True
+        cutoff = time.time() - _retention_seconds()
+        table = sql.Identifier(DIGEST_TABLE)
+        try:
+            pool = await get_postgres_pool()
+            async with pool.connection() as conn:
+                await _ensure_table(conn)
+                async with conn.transaction():
+                    # Create the row first, so writers of a new connection also queue on its lock
+                    await conn.execute(
+                        sql.SQL("INSERT INTO {table} (connected_id, digests) VALUES (%s, %s) ON CONFLICT (connected_id) DO NOTHING").format(table=table),
+                        (self.connected_id, b""),
+                    )
+                    cursor = await conn.execute(
+                        sql.SQL("SELECT digests FROM {table} WHERE connected_id = %s FOR UPDATE").format(table=table),
+                        (self.connected_id,),
+                    )
+                    row = await cursor.fetchone()
+                    entries = {digest: recorded for digest, recorded in _ENTRY.iter_unpack(bytes(row[0])) if recorded >= cutoff}
+                    for digest, recorded in self.pending.items():
+                        entries[digest] = max(recorded, entries.get(digest, 0))
+                    blob = b"".join(_ENTRY.pack(digest, recorded) for digest, recorded in entries.items())
+                    await conn.execute(
+                        sql.SQL("UPDATE {table} SET digests = %s, updated_ts = now() WHERE connected_id = %s").format(table=table),
+                        (blob, self.connected_id),
+                    )
+        except Exception as e:
+            # Only costs the skipping on the next sync, the load itself is already confirmed
+            logging.warning(f"Could not write the order digests of {self.connected_id}: {e}")
+            return False
+        self.known, self.pending = entries, {}
+        logging.info(f"Stored {len(entries)} order digests for {self.connected_id}")
+        return True
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+'''
+@docs
+Process pool for the CPU-bound transforms. A large page of orders takes the transform seconds,
+and run inline it blocks the worker's event loop, so heartbeats and every other activity's I/O
+stall with it. Transforms sent here run in worker processes while the loop keeps serving.
+
+The functions must be module-level columnar transforms with the signature
+fn(orders, connection_id, batchedAt) -> (columns, column_names, batchedAt), e.g.
+transform_orders_page or transform_amazon_for_clickhouse_columnar. They return one list per
+column, which pickles far more compactly than a list of row lists.
+
+ETL_TRANSFORM_PROCESSES sets the pool size. 0 (the default) runs transforms inline on the event
+loop. The syncs load batches of 250 to 500 orders, a single shard each, and for those the pickling
+costs more than the transform. `python -m benchmarks --stage '*pool_per_page'` measured 4,400
+Shopify and 10,200 Amazon orders/sec through the pool against 11,900 and 27,600 inline. Use the
+pool with SHOPIFY_LOAD_BATCH_ROWS/AMAZON_LOAD_BATCH_ROWS of several thousand orders, where
+inline transforms would stall heartbeats for seconds. "auto" divides the cores between the worker
+processes of run_worker, and runs transforms inline when that leaves a worker fewer than two
+cores, since a pool process would then only compete with its own event loop.
+'''
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _pool_size() -> int:
+    processes = os.environ.get("ETL_TRANSFORM_PROCESSES", "0")
+    if processes != "auto":
+        return max(0, int(processes))
+    worker_processes = os.environ.get("ETL_WORKER_PROCESSES", "1")
+    cores = os.cpu_count() or 1
+    workers = cores if worker_processes == "auto" else max(1, int(worker_processes))
+    cores_per_worker = cores // workers
+    return cores_per_worker if cores_per_worker >= 2 else 0
+
+
+def get_transform_executor() -> Optional[ProcessPoolExecutor]:
+    """Return the process-wide transform pool, creating it on first use, or None if disabled."""
+    global _executor
+    if _executor is None:
+        size = _pool_size()
+        if size == 0:
+            return None
+        # Spawned so the workers never inherit the event loop, sockets or pool locks of the parent
+        _executor = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context("spawn"))
+        logging.info(f"Started transform pool with {size} processes")
+    return _executor
+
+
+def shutdown_transform_executor(wait: bool = True) -> None:
+    """Stop the transform pool. Pass wait=False on the event loop, where joining the processes would block it."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+    _executor = None
+
+
+def _merge_columns(results: List[Tuple[List[list], List[str], str]]) -> Tuple[List[list], List[str], str]:
+    columns, column_names, batchedAt = results[0]
+    for shard_columns, _, _ in results[1:]:
+        for column, shard_column in zip(columns, shard_columns):
+            column.extend(shard_column)
+    return columns, column_names, batchedAt
+
+
+async def run_transform(
+    fn: Callable,
+    orders: Sequence[Any],
+    connection_id: str,
+    batchedAt: Optional[str] = None,
+    shard_rows: Optional[int] = None
+) -> Tuple[List[list], List[str], str]:
+    """
+    Run a columnar transform off the event loop, split into shards that run on separate cores.
+
+    Args:
+        fn: Module-level columnar transform
+        orders: Orders to transform
+        connection_id: The unique identifier for the connection
+        batchedAt: Batch timestamp, defaults to now. Fixed here so every shard shares it
+        shard_rows: Orders per shard, defaults to ETL_TRANSFORM_SHARD_ROWS (5000)
+
+    Returns:
+        Tuple of (columns, column_names, batchedAt) for all orders, in input order
+    """
+    if batchedAt is None:
+        batchedAt = datetime.now(timezone.utc).isoformat()
+    executor = get_transform_executor()
+    if executor is None:
+        return fn(orders, connection_id, batchedAt)
+    shard_rows = shard_rows or int(os.environ.get("ETL_TRANSFORM_SHARD_ROWS", "5000"))
+    loop = asyncio.get_running_loop()
+    shards = [orders[i:i + shard_rows] for i in range(0, len(orders), shard_rows)] or [orders]
+    try:
+        results = await asyncio.gather(*[
+            loop.run_in_executor(executor, partial(fn, shard, connection_id, batchedAt))
+            for shard in shards
+        ])
+    except BrokenProcessPool:
+        # A pool process died (e.g. OOM killed), start a fresh pool for the retried attempt
+        logging.error("Transform pool is broken, restarting it")
+        shutdown_transform_executor(wait=False)
+        raise
+    return _merge_columns(list(results))
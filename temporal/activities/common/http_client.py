@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+from typing import Optional
+import httpx
+from temporal.activities.common.metrics import observe_api_request
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+'''
+@docs
+Shared async HTTP layer for the extractors. One pooled httpx client per worker process keeps
+connections to Shopify, SP-API and LWA alive between requests and activities, so many accounts
+can be extracted concurrently without blocking the event loop. Every request is counted in the
+API metrics for the activity that made it, including the bytes of streamed bodies.
+'''
+
+_client: Optional[httpx.AsyncClient] = None
+_client_lock = asyncio.Lock()
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    """Counts the raw body bytes as they are read and records the request once it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, status: int, start: float):
+        self._stream = stream
+        self._status = status
+        self._start = start
+        self._bytes = 0
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._bytes += len(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            observe_api_request(str(self._status), time.perf_counter() - self._start, self._bytes)
+
+
+class _MeteredTransport(httpx.AsyncHTTPTransport):
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            observe_api_request("error", time.perf_counter() - start, 0)
+            raise
+        response.stream = _MeteredStream(response.stream, response.status_code, start)
+        return response
+
+
+def _build_client() -> httpx.AsyncClient:
+    timeout = httpx.Timeout(
+        float(os.environ.get("HTTP_TIMEOUT_SECONDS", "60")),
+        connect=float(os.environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", "10")),
+    )
+    limits = httpx.Limits(
+        max_connections=int(os.environ.get("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30")),
+    )
+    return httpx.AsyncClient(
+        transport=_MeteredTransport(http2=HTTP2_AVAILABLE, limits=limits),
+        timeout=timeout,
+        headers={"Accept-Encoding": "gzip"},
+    )
+
+
+async def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        async with _client_lock:
+            if _client is None or _client.is_closed:
+                _client = _build_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the process-wide HTTP client, e.g. when the worker shuts down."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -0,0 +1,67 @@
+from temporalio import activity
+import asyncio
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+'''
+@docs
+ClickHouse table maintenance. ReplacingMergeTree only collapses duplicate order versions when
+parts merge, which happens eventually and never across partitions still being written.
+OPTIMIZE ... FINAL forces the merge for the partitions with the most parts, so reads can skip
+FINAL and GROUP BY dedup. ClickHouseOptimizeWorkflow runs it on a Temporal schedule.
+'''
+
+HEARTBEAT_INTERVAL_SECONDS = 30
+
+@dataclass
+class OptimizePayload:
+    table: str
+    max_partitions: int = 10
+    min_parts: int = 2
+
+@dataclass
+class OptimizeRequest:
+    tables: List[str] = field(default_factory=list)
+    max_partitions: int = 10
+    min_parts: int = 2
+
+
+async def _heartbeat_until_done(awaitable, details):
+    """Await a long ClickHouse command while heartbeating so the activity is not timed out."""
+    task = asyncio.ensure_future(awaitable)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=HEARTBEAT_INTERVAL_SECONDS)
+        if done:
+            return task.result()
+        activity.heartbeat(details)
+
+
+@activity.defn
+async def optimize_partitions(request: OptimizePayload) -> int:
+    """Run OPTIMIZE ... FINAL on the table's partitions with the most active parts."""
+    # Import non-deterministic libraries only within the activity
+    from temporal.activities.common.clickhouse import get_clickhouse_client
+
+    if not re.fullmatch(r"\w+", request.table):
+        raise ValueError(f"Invalid table name: {request.table}")
+    client = await get_clickhouse_client()
+    result = await client.query(
+        "SELECT partition_id, count() AS parts FROM system.parts "
+        "WHERE database = currentDatabase() AND table = {table:String} AND active "
+        "GROUP BY partition_id HAVING parts >= {min_parts:UInt32} "
+        "ORDER BY parts DESC LIMIT {max_partitions:UInt32}",
+        parameters={"table": request.table, "min_parts": request.min_parts, "max_partitions": request.max_partitions},
+    )
+    optimized = 0
+    for partition_id, parts in result.result_rows:
+        if not re.fullmatch(r"[\w-]+", partition_id):
+            raise ValueError(f"Unexpected partition id: {partition_id}")
+        activity.logger.info(f"Optimizing partition {partition_id} of {request.table} with {parts} parts")
+        await _heartbeat_until_done(
+            client.command(f"OPTIMIZE TABLE {request.table} PARTITION ID '{partition_id}' FINAL"),
+            {"table": request.table, "partition_id": partition_id},
+        )
+        optimized += 1
+    activity.logger.info(f"Optimized {optimized} partitions of {request.table}")
+    return optimized
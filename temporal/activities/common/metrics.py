@@ -0,0 +1,158 @@
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Optional
+
+try:
+    from prometheus_client import Counter, Histogram, start_http_server
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+'''
+@docs
+Prometheus metrics for the ETL hot path. MetricsInterceptor binds the platform and tenant
+(connected_id) of every activity to context variables, so the extractors, transforms and loaders
+can record against them without threading labels through every call:
+
+    etl_activity_duration_seconds{platform, activity, tenant, outcome}
+    etl_stage_duration_seconds{platform, stage, tenant}    stage = extract | transform | load | confirm
+    etl_rows_total{platform, stage, tenant}                rows/sec = rate(rows) / rate(stage seconds)
+                                                           stage = unchanged counts orders skipped by change detection
+    etl_api_requests_total{platform, tenant, status}
+    etl_api_request_duration_seconds{platform, tenant}     until the body is fully read
+    etl_api_downloaded_bytes_total{platform, tenant}       bytes on the wire, before decompression
+    etl_rate_limit_sleep_seconds_total{platform, tenant}
+
+The worker serves them on METRICS_PORT next to prometheus_client's default process metrics
+(RSS, CPU, open fds). Set METRICS_TENANT_LABELS=false to drop the tenant label on large fleets.
+Without prometheus_client installed every call is a no-op.
+'''
+
+_platform: contextvars.ContextVar[str] = contextvars.ContextVar("etl_platform", default="unknown")
+_tenant: contextvars.ContextVar[str] = contextvars.ContextVar("etl_tenant", default="")
+
+TENANT_LABELS = os.environ.get("METRICS_TENANT_LABELS", "true").lower() == "true"
+
+
+class _NoopMetric:
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def observe(self, amount: float):
+        pass
+
+
+if PROMETHEUS_AVAILABLE:
+    ACTIVITY_SECONDS = Histogram(
+        "etl_activity_duration_seconds", "Wall time of one activity attempt",
+        ["platform", "activity", "tenant", "outcome"],
+        buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200),
+    )
+    STAGE_SECONDS = Histogram(
+        "etl_stage_duration_seconds", "Wall time spent in one pipeline stage call",
+        ["platform", "stage", "tenant"],
+    )
+    ROWS = Counter("etl_rows", "Orders processed by a pipeline stage", ["platform", "stage", "tenant"])
+    API_REQUESTS = Counter("etl_api_requests", "HTTP requests made to platform APIs", ["platform", "tenant", "status"])
+    API_SECONDS = Histogram(
+        "etl_api_request_duration_seconds", "HTTP request time including the response body",
+        ["platform", "tenant"],
+    )
+    API_BYTES = Counter("etl_api_downloaded_bytes", "Response bytes downloaded from platform APIs", ["platform", "tenant"])
+    RATE_LIMIT_SLEEP = Counter("etl_rate_limit_sleep_seconds", "Time spent waiting for API rate limits", ["platform", "tenant"])
+else:
+    ACTIVITY_SECONDS = STAGE_SECONDS = ROWS = API_REQUESTS = API_SECONDS = API_BYTES = RATE_LIMIT_SLEEP = _NoopMetric()
+
+
+def _labels():
+    return _platform.get(), _tenant.get() if TENANT_LABELS else ""
+
+
+@contextmanager
+def activity_metrics(platform: str, activity_type: str, tenant: Optional[str]):
+    """Bind platform and tenant for everything the activity calls and time the attempt."""
+    platform_token = _platform.set(platform)
+    tenant_token = _tenant.set(tenant or "")
+    _, tenant_label = _labels()
+    start = time.perf_counter()
+    outcome = "failure"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        ACTIVITY_SECONDS.labels(platform, activity_type, tenant_label, outcome).observe(time.perf_counter() - start)
+        _tenant.reset(tenant_token)
+        _platform.reset(platform_token)
+
+
+@contextmanager
+def stage_timer(stage: str, rows: int = 0):
+    """
+    Time one call of a pipeline stage for the current tenant.
+
+    Args:
+        stage: One of extract, transform, load, confirm
+        rows: Orders the call handles, counted towards etl_rows_total
+    """
+    platform, tenant = _labels()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(platform, stage, tenant).observe(time.perf_counter() - start)
+        if rows:
+            ROWS.labels(platform, stage, tenant).inc(rows)
+
+
+def record_rows(stage: str, rows: int):
+    """Count rows for a stage whose size is only known after it was timed."""
+    if rows:
+        platform, tenant = _labels()
+        ROWS.labels(platform, stage, tenant).inc(rows)
+
+
+async def metered_pages(pages: AsyncIterator[Any], stage: str = "extract") -> AsyncIterator[Any]:
+    """Re-yield an extractor's pages, timing how long each one took to arrive."""
+    iterator = pages.__aiter__()
+    while True:
+        platform, tenant = _labels()
+        start = time.perf_counter()
+        try:
+            page = await iterator.__anext__()
+        except StopAsyncIteration:
+            return
+        STAGE_SECONDS.labels(platform, stage, tenant).observe(time.perf_counter() - start)
+        orders = page[0] if isinstance(page, tuple) else page
+        ROWS.labels(platform, stage, tenant).inc(len(orders))
+        yield page
+
+
+def observe_api_request(status: str, seconds: float, downloaded_bytes: int):
+    platform, tenant = _labels()
+    API_REQUESTS.labels(platform, tenant, status).inc()
+    API_SECONDS.labels(platform, tenant).observe(seconds)
+    if downloaded_bytes:
+        API_BYTES.labels(platform, tenant).inc(downloaded_bytes)
+
+
+def observe_rate_limit_sleep(seconds: float):
+    if seconds > 0:
+        platform, tenant = _labels()
+        RATE_LIMIT_SLEEP.labels(platform, tenant).inc(seconds)
+
+
+def start_metrics_server(port: Optional[int] = None):
+    """Serve /metrics from the worker process on METRICS_PORT (default 9464)."""
+    if not PROMETHEUS_AVAILABLE:
+        logging.warning("prometheus_client is not installed, metrics are disabled")
+        return
+    port = port or int(os.environ.get("METRICS_PORT", "9464"))
+    start_http_server(port)
+    logging.info(f"Serving metrics on port {port}")
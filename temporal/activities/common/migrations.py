@@ -0,0 +1,63 @@
+import logging
+from typing import Awaitable, Callable
+from psycopg import sql
+from temporal.activities.common.postgres import get_postgres_pool
+
+'''
+@docs
+One-off data migrations, run by hand and never on the worker startup path. Each migration is
+recorded in the etl-migrations Postgres table once it completes, so running the command again
+skips it. A migration that was interrupted is not recorded and runs again from the start, so
+migrations must tolerate a partial earlier run.
+'''
+
+MIGRATION_TABLE = "etl-migrations"
+
+
+async def _ensure_table(conn):
+    await conn.execute(sql.SQL('''CREATE TABLE IF NOT EXISTS {table} (
+        name text PRIMARY KEY,
+        completed_ts timestamp NOT NULL DEFAULT now()
+    )''').format(table=sql.Identifier(MIGRATION_TABLE)))
+
+
+async def migration_completed(name: str) -> bool:
+    pool = await get_postgres_pool()
+    async with pool.connection() as conn:
+        await _ensure_table(conn)
+        cursor = await conn.execute(
+            sql.SQL("SELECT 1 FROM {table} WHERE name = %s").format(table=sql.Identifier(MIGRATION_TABLE)),
+            (name,),
+        )
+        return await cursor.fetchone() is not None
+
+
+async def record_migration(name: str) -> None:
+    pool = await get_postgres_pool()
+    async with pool.connection() as conn:
+        await _ensure_table(conn)
+        await conn.execute(
+            sql.SQL("INSERT INTO {table} (name) VALUES (%s) ON CONFLICT (name) DO NOTHING").format(table=sql.Identifier(MIGRATION_TABLE)),
+            (name,),
+        )
+
+
+async def run_migration(name: str, migrate: Callable[[], Awaitable[None]]) -> bool:
+    """
+    Run a migration unless it already completed.
+
+    Args:
+        name: Unique name the completion is recorded under
+        migrate: Coroutine function doing the migration
+
+    Returns:
+        True if the migration ran
+    """
+    if await migration_completed(name):
+        logging.info(f"Migration {name} already completed, skipping")
+        return False
+    logging.info(f"Running migration {name}")
+    await migrate()
+    await record_migration(name)
+    logging.info(f"Migration {name} completed")
+    return True
@@ -0,0 +1,117 @@
+import asyncio
+import copy
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from temporalio import activity
+from temporal.activities.common.executor import run_transform
+from temporal.activities.common.metrics import metered_pages, record_rows, stage_timer
+from temporal.activities.common.receipts import LoadReceipt
+
+'''
+@docs
+Streaming load of order pages, shared by the platform activities. Pages are transformed and
+inserted in batches as they arrive, so worker memory is bounded by the batch size rather than
+the store's order count. After every page the position of the last committed batch is
+heartbeated with the load receipt so far, so a retried attempt resumes from it instead of
+paging the window again. While the next page is pending the same details are heartbeated every
+HEARTBEAT_INTERVAL_SECONDS, since rate limited APIs can take minutes per page.
+'''
+
+HEARTBEAT_INTERVAL_SECONDS = 30
+
+
+async def heartbeat_while_waiting(pages, details: Callable[[], Dict[str, Any]]):
+    """Re-yield pages, heartbeating details() every HEARTBEAT_INTERVAL_SECONDS while the next one is pending."""
+    iterator = pages.__aiter__()
+    while True:
+        next_page = asyncio.ensure_future(iterator.__anext__())
+        try:
+            while not next_page.done():
+                await asyncio.wait({next_page}, timeout=HEARTBEAT_INTERVAL_SECONDS)
+                if not next_page.done():
+                    activity.heartbeat(details())
+            page = next_page.result()
+        except StopAsyncIteration:
+            return
+        finally:
+            next_page.cancel()
+        yield page
+
+
+async def load_order_pages(
+    pages: AsyncIterator,
+    advance: Callable[[Dict[str, Any], Dict[str, Any]], None],
+    committed: Dict[str, Any],
+    heartbeat_details: Dict[str, Any],
+    connection_id: str,
+    clickhouse_client,
+    table_name: str,
+    transform: Callable,
+    insert_batch: Callable,
+    batch_dedup_token: Callable,
+    batch_rows: int,
+    receipt: Optional[Dict[str, Any]] = None,
+    digests=None,
+    enrich: Optional[Callable[[AsyncIterator], AsyncIterator]] = None
+) -> LoadReceipt:
+    """
+    Transform and insert order pages in batches, heartbeating the committed position.
+
+    Args:
+        pages: Async iterator of (orders, page_info) tuples
+        advance: Callback that moves a position dict past the given page_info
+        committed: Position the pages start from
+        heartbeat_details: Extra values to include in every heartbeat, with at least batchedAt
+        connection_id: Connection id the rows are loaded for
+        clickhouse_client: Client used for the inserts
+        table_name: Table the batches are inserted into
+        transform: Module-level columnar transform, run through run_transform
+        insert_batch: The platform's loading.insert_batch
+        batch_dedup_token: The platform's loading.batch_dedup_token
+        batch_rows: Orders per insert
+        receipt: Receipt of the batches loaded by previous attempts, as a dict
+        digests: DigestIndex whose unchanged orders are skipped before enrichment and the transform
+        enrich: Wraps the changed pages, e.g. to fetch more fields for their orders
+
+    Returns:
+        LoadReceipt of every batch loaded for the sync
+    """
+    receipt = LoadReceipt.from_dict(receipt)
+    pending = copy.deepcopy(committed)
+    master_orders = []
+
+    async def load_batch(batch):
+        # Inline by default, in the transform pool if ETL_TRANSFORM_PROCESSES enables it
+        with stage_timer("transform", rows=len(batch)):
+            columns, column_names, _ = await run_transform(transform, batch, connection_id, heartbeat_details["batchedAt"])
+        # The token makes a retried attempt's re-insert of an identical batch a no-op
+        dedup_token = batch_dedup_token(connection_id, columns, column_names)
+        await insert_batch(clickhouse_client, table_name, columns, column_names, column_oriented=True, dedup_token=dedup_token, receipt=receipt)
+
+    async def changed_pages(pages):
+        async for orders, page_info in pages:
+            activity.logger.info(f"Orders extracted for account {connection_id}: {len(orders)}")
+            if digests is not None:
+                changed = digests.filter(orders)
+                record_rows("unchanged", len(orders) - len(changed))
+                orders = changed
+            yield orders, page_info
+
+    pages = changed_pages(metered_pages(pages))
+    if enrich is not None:
+        pages = enrich(pages)
+    pages = heartbeat_while_waiting(pages, lambda: {**committed, **heartbeat_details, "receipt": receipt.to_dict()})
+    async for orders, page_info in pages:
+        master_orders.extend(orders)
+        advance(pending, page_info)
+        if len(master_orders) >= batch_rows:
+            await load_batch(master_orders)
+            master_orders = []
+        if len(master_orders) == 0:
+            committed = copy.deepcopy(pending)
+        activity.heartbeat({**committed, **heartbeat_details, "receipt": receipt.to_dict()})
+    if len(master_orders) > 0:
+        await load_batch(master_orders)
+        master_orders = []
+        committed = pending
+        activity.heartbeat({**committed, **heartbeat_details, "receipt": receipt.to_dict()})
+    return receipt
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from psycopg import sql
+from psycopg_pool import AsyncConnectionPool
+
+'''
+@docs
+Process-wide async Postgres pool for the Supabase database, shared by every activity in the
+worker. Connections are opened once and health checked when borrowed, instead of paying a TLS
+and auth round trip per statement. Statements are always parameterized; psycopg prepares them
+server side once they have run POSTGRES_PREPARE_THRESHOLD times on a connection. Set it to
+"none" when connecting through a transaction-mode pooler that cannot keep prepared statements.
+
+WatermarkBatcher coalesces the etl-highlevel-log watermark updates of concurrently finishing
+syncs into one UPDATE ... FROM unnest(...) round trip.
+'''
+
+WATERMARK_TABLE = "etl-highlevel-log"
+
+_pool: Optional[AsyncConnectionPool] = None
+_pool_lock = asyncio.Lock()
+
+
+def _conninfo() -> str:
+    host = os.environ.get("SUPABASE_HOST")
+    dbname = os.environ.get("SUPABASE_DBNAME")
+    user = os.environ.get("SUPABASE_USER")
+    password = os.environ.get("SUPABASE_PASSWORD")
+    port = os.environ.get("SUPABASE_PORT")
+    if not (host and dbname and user and password and port):
+        raise RuntimeError("Missing environment variables for Supabase database connection")
+    return f"host={host} port={port} dbname={dbname} user={user} password={password}"
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # The log's columns are timestamps without a zone that hold UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _prepare_threshold() -> Optional[int]:
+    threshold = os.environ.get("POSTGRES_PREPARE_THRESHOLD", "5")
+    return None if threshold.lower() == "none" else int(threshold)
+
+
+async def get_postgres_pool() -> AsyncConnectionPool:
+    """Return the process-wide pool, opening it on first use."""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                pool = AsyncConnectionPool(
+                    _conninfo(),
+                    min_size=int(os.environ.get("POSTGRES_POOL_MIN_SIZE", "1")),
+                    max_size=int(os.environ.get("POSTGRES_POOL_MAX_SIZE", "10")),
+                    kwargs={"prepare_threshold": _prepare_threshold()},
+                    check=AsyncConnectionPool.check_connection,
+                    open=False,
+                )
+                await pool.open()
+                logging.info("Postgres pool opened")
+                _pool = pool
+    return _pool
+
+
+async def close_postgres_pool() -> None:
+    """Flush pending watermark updates and close the pool, e.g. when the worker shuts down."""
+    global _pool
+    await _watermarks.flush()
+    if _pool is not None:
+        await _pool.close()
+    _pool = None
+
+
+class WatermarkBatcher:
+    """
+    Collects watermark updates for a short window and writes them with a single statement.
+    Every caller still learns whether its own row was updated.
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None, max_batch: Optional[int] = None):
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.environ.get("POSTGRES_WATERMARK_FLUSH_MS", "50")) / 1000
+        self.max_batch = max_batch or int(os.environ.get("POSTGRES_WATERMARK_MAX_BATCH", "500"))
+        self._pending: List[Tuple[str, datetime, datetime, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def submit(self, connected_id: str, last_successful_extraction_ts: datetime, metainfo_updated_ts: datetime) -> bool:
+        """
+        Queue one watermark update and wait until its batch is written.
+
+        Returns:
+            True if the connection's row was updated
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((connected_id, _naive_utc(last_successful_extraction_ts), _naive_utc(metainfo_updated_ts), future))
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        # Updates submitted while a flush was writing would otherwise wait for an unrelated submit
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if not self._pending:
+                return
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        # One row per connection, keeping the newest watermark if a connection appears twice
+        latest: Dict[str, Tuple[datetime, datetime]] = {}
+        for connected_id, extraction_ts, updated_ts, _ in batch:
+            if connected_id not in latest or extraction_ts > latest[connected_id][0]:
+                latest[connected_id] = (extraction_ts, updated_ts)
+        try:
+            updated = await update_watermarks(latest)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for connected_id, *_, future in batch:
+            if not future.done():
+                future.set_result(connected_id in updated)
+
+
+async def update_watermarks(watermarks: Dict[str, Tuple[datetime, datetime]]) -> set:
+    """
+    Mark many connections healthy and advance their watermarks in one round trip. A watermark
+    never moves backwards, e.g. when a sync only re-loaded orders from its overlap window.
+
+    Args:
+        watermarks: (last_successful_extraction_ts, metainfo_updated_ts) keyed by connected_id
+
+    Returns:
+        The connected_ids whose row was updated
+    """
+    if not watermarks:
+        return set()
+    query = sql.SQL('''UPDATE {table} AS log
+        SET last_successful_extraction_ts = GREATEST(log.last_successful_extraction_ts, batch.last_successful_extraction_ts),
+            is_active = true,
+            health_status = 'healthy',
+            last_error = null,
+            metainfo_updated_ts = batch.metainfo_updated_ts
+        FROM unnest(%s::text[], %s::timestamp[], %s::timestamp[])
+            AS batch(connected_id, last_successful_extraction_ts, metainfo_updated_ts)
+        WHERE log.connected_id = batch.connected_id
+        RETURNING log.connected_id''').format(table=sql.Identifier(WATERMARK_TABLE))
+    connected_ids = list(watermarks)
+    params = (
+        connected_ids,
+        [watermarks[connected_id][0] for connected_id in connected_ids],
+        [watermarks[connected_id][1] for connected_id in connected_ids],
+    )
+    pool = await get_postgres_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, params)
+            updated = {row[0] for row in await cursor.fetchall()}
+    logging.info(f"Updated watermarks for {len(updated)} of {len(connected_ids)} connections")
+    return updated
+
+
+_watermarks = WatermarkBatcher()
+
+
+async def submit_watermark(connected_id: str, last_successful_extraction_ts: datetime, metainfo_updated_ts: datetime) -> bool:
+    """Advance one connection's watermark through the process-wide batcher."""
+    return await _watermarks.submit(connected_id, last_successful_extraction_ts, metainfo_updated_ts)
@@ -0,0 +1,94 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Union
+
+'''
+@docs
+Load confirmation without reading the table back. Each insert returns a QuerySummary whose
+written_rows says what ClickHouse committed. LoadReceipt adds that up batch by batch together
+with the newest order version seen in the batch's columns. A sync is confirmed once every
+batch was written in full, or was dropped as a duplicate of an already written block with the
+same insert_deduplication_token, and the watermark is the receipt's newest version. That
+replaces a MAX() scan over the connection's whole history after every load.
+
+Receipts travel in heartbeats and activity results as plain dicts, so this module only
+uses the standard library and is safe to import in workflows.
+'''
+
+
+def _utc(value: Union[datetime, str]) -> datetime:
+    # Naive versions, e.g. from receipts written before they carried a zone, are UTC
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+@dataclass
+class LoadReceipt:
+    rows: int = 0
+    written_rows: int = 0
+    deduplicated_batches: int = 0
+    incomplete_batches: int = 0
+    max_updated_at: Optional[str] = None
+
+    def add_batch(self, row_count: int, written_rows: int, versions: Iterable[Any] = (), dedup_token: Optional[str] = None):
+        """
+        Record one insert.
+
+        Args:
+            row_count: Rows sent in the insert
+            written_rows: written_rows of the insert's QuerySummary
+            versions: The batch's updatedAt column
+            dedup_token: The insert_deduplication_token the batch was sent with, if any
+        """
+        self.rows += row_count
+        self.written_rows += written_rows
+        if written_rows >= row_count:
+            pass
+        elif written_rows == 0 and dedup_token:
+            # A retried batch that ClickHouse had already written
+            self.deduplicated_batches += 1
+        else:
+            self.incomplete_batches += 1
+        self.advance(max((_utc(version) for version in versions if version), default=None))
+
+    def advance(self, version: Optional[Union[datetime, str]]):
+        if not version:
+            return
+        version = _utc(version)
+        if self.max_updated_at is None or version > _utc(self.max_updated_at):
+            self.max_updated_at = version.isoformat()
+
+    @property
+    def confirmed(self) -> bool:
+        return self.rows > 0 and self.incomplete_batches == 0 and self.max_updated_at is not None
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        return _utc(self.max_updated_at) if self.max_updated_at else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, value: Optional[Dict[str, Any]]) -> "LoadReceipt":
+        return cls(**value) if value else cls()
+
+    @classmethod
+    def merge(cls, results: Iterable[Union[int, Dict[str, Any]]]) -> "LoadReceipt":
+        """Combine the results of fanned-out chunks. Bare row counts carry no versions."""
+        merged = cls()
+        for result in results:
+            if isinstance(result, int):
+                merged.rows += result
+                merged.written_rows += result
+                continue
+            receipt = cls.from_dict(result)
+            merged.rows += receipt.rows
+            merged.written_rows += receipt.written_rows
+            merged.deduplicated_batches += receipt.deduplicated_batches
+            merged.incomplete_batches += receipt.incomplete_batches
+            merged.advance(receipt.max_updated_at)
+        return merged
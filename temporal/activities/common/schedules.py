@@ -0,0 +1,47 @@
+import logging
+import os
+from temporalio.client import Client, Schedule, ScheduleActionStartWorkflow, ScheduleAlreadyRunningError, ScheduleSpec
+from temporal.activities.common.maintenance import OptimizeRequest
+from temporal.activities.common.task_queues import ETL_TASK_QUEUE
+from temporal.activities.common.workflows import ClickHouseOptimizeWorkflow
+
+'''
+@docs
+Temporal schedules the workers register on startup. Creating a schedule that already exists is
+a no-op, so every worker process can call this. Each table gets its own schedule, so adding a
+table later only adds its schedule instead of changing a shared one.
+'''
+
+OPTIMIZE_SCHEDULE_ID_PREFIX = "clickhouse-optimize-"
+
+
+def optimize_schedule_id(table: str) -> str:
+    return f"{OPTIMIZE_SCHEDULE_ID_PREFIX}{table}"
+
+
+async def ensure_optimize_schedule(client: Client, tables):
+    """
+    Schedule ClickHouseOptimizeWorkflow for each of the given tables on CLICKHOUSE_OPTIMIZE_CRON,
+    e.g. "0 3 * * *". Nothing is scheduled while the variable is unset.
+    """
+    cron = os.environ.get("CLICKHOUSE_OPTIMIZE_CRON")
+    if not cron:
+        return
+    for table in tables:
+        schedule_id = optimize_schedule_id(table)
+        try:
+            await client.create_schedule(
+                schedule_id,
+                Schedule(
+                    action=ScheduleActionStartWorkflow(
+                        ClickHouseOptimizeWorkflow.run,
+                        OptimizeRequest(tables=[table]),
+                        id=schedule_id,
+                        task_queue=ETL_TASK_QUEUE,
+                    ),
+                    spec=ScheduleSpec(cron_expressions=[cron]),
+                ),
+            )
+            logging.info(f"Created schedule {schedule_id} with cron {cron}")
+        except ScheduleAlreadyRunningError:
+            pass
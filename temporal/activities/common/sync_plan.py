@@ -0,0 +1,36 @@
+from temporalio import activity
+from dataclasses import dataclass
+from typing import Any, Optional
+
+'''
+@docs
+The fill type of a sync decides its task queue and whether it fans out, so the workflows ask
+the watermark store before scheduling anything instead of guessing from the last_run_ts in
+their payload. plan_sync runs resolve_start once and the workflow hands the plan to the sync
+activity, so routing and extraction always agree on the window.
+'''
+
+@dataclass
+class SyncPlanRequest:
+    connected_id: str
+    last_run_ts: Optional[Any] = None
+
+@dataclass
+class SyncPlan:
+    fill_type: str
+    start_time: str
+
+    @property
+    def is_backfill(self) -> bool:
+        return self.fill_type == "backfill"
+
+
+@activity.defn
+async def plan_sync(request: SyncPlanRequest) -> SyncPlan:
+    """Resolve the fill type and start time of a connection's next sync from its committed watermark."""
+    # Import non-deterministic libraries only within the activity
+    from temporal.activities.common.watermarks import resolve_start
+
+    fill_type, start_time = await resolve_start(request.connected_id, request.last_run_ts)
+    activity.logger.info(f"Planned a {fill_type} sync from {start_time} for account {request.connected_id}")
+    return SyncPlan(fill_type=fill_type, start_time=start_time.isoformat())
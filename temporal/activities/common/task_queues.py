@@ -0,0 +1,16 @@
+'''
+@docs
+Task queues shared by the workflows and workers. Workflows and the short activities (incremental
+syncs, reconciliation) run on ETL_TASK_QUEUE. Backfill activities are scheduled on
+BACKFILL_TASK_QUEUE, which run_worker polls with its own, smaller pool of activity slots, so a
+large backfill can never occupy the slots incremental syncs are waiting for.
+
+Kept free of I/O and environment lookups so workflows can import it inside the sandbox.
+'''
+
+ETL_TASK_QUEUE = "etl-workflow-queue"
+BACKFILL_TASK_QUEUE = "etl-backfill-queue"
+
+
+def activity_task_queue(is_backfill: bool) -> str:
+    return BACKFILL_TASK_QUEUE if is_backfill else ETL_TASK_QUEUE
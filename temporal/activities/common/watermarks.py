@@ -0,0 +1,116 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from psycopg import sql
+from temporal.activities.common.postgres import WATERMARK_TABLE, get_postgres_pool
+
+'''
+@docs
+Per-connection high-water marks. The watermark of a connection is the max updatedAt committed to
+ClickHouse by its last confirmed load (last_successful_extraction_ts in etl-highlevel-log).
+Activities resolve their start time from it when they begin, instead of trusting the
+last_run_ts captured in the workflow payload, which can be stale by the time a retry runs.
+
+Watermarks are handled as timezone-aware UTC datetimes. The log stores them as UTC timestamps
+without a zone, so naive values read from it or from payloads are taken to be UTC.
+
+Reads go through a small per-process cache (WATERMARK_CACHE_SECONDS) that confirmed loads
+write through, so a worker does not query Postgres for a watermark it just wrote.
+
+Incremental syncs start WATERMARK_OVERLAP_MINUTES before the watermark. That covers orders
+updated while the previous sync was running and the minute precision of the API filters. It
+replaces re-pulling whole days.
+'''
+
+_cache: Dict[str, Tuple[float, Optional[datetime]]] = {}
+
+
+def _cache_ttl() -> float:
+    return float(os.environ.get("WATERMARK_CACHE_SECONDS", "60"))
+
+
+def _overlap() -> timedelta:
+    return timedelta(minutes=float(os.environ.get("WATERMARK_OVERLAP_MINUTES", "10")))
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def parse_watermark(value: Any) -> Optional[datetime]:
+    """Accept the datetimes and strings ("2025-04-06 18:27:10", ISO 8601) payloads carry."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return _utc(value)
+    return _utc(datetime.fromisoformat(str(value).replace("Z", "+00:00")))
+
+
+def remember_watermark(connected_id: str, watermark: datetime) -> None:
+    """Write a freshly confirmed watermark through to the local cache, never moving it backwards."""
+    watermark = parse_watermark(watermark)
+    cached = _cache.get(connected_id)
+    if cached is not None and cached[1] is not None and watermark is not None and cached[1] > watermark:
+        watermark = cached[1]
+    _cache[connected_id] = (time.monotonic(), watermark)
+
+
+async def get_watermark(connected_id: str) -> Optional[datetime]:
+    """
+    Return the connection's committed high-water mark, or None if it has never loaded.
+
+    Args:
+        connected_id: The connection to look up
+
+    Returns:
+        UTC datetime of the newest updatedAt committed for the connection
+    """
+    cached = _cache.get(connected_id)
+    if cached is not None and time.monotonic() - cached[0] < _cache_ttl():
+        return cached[1]
+    query = sql.SQL("SELECT last_successful_extraction_ts FROM {table} WHERE connected_id = %s").format(
+        table=sql.Identifier(WATERMARK_TABLE)
+    )
+    pool = await get_postgres_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, (connected_id,))
+            row = await cursor.fetchone()
+    watermark = parse_watermark(row[0]) if row else None
+    _cache[connected_id] = (time.monotonic(), watermark)
+    return watermark
+
+
+def backfill_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the previous month, the window a first sync backfills."""
+    now = parse_watermark(now) if now else datetime.now(timezone.utc)
+    return (now.replace(day=1) - timedelta(days=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+async def resolve_start(connected_id: str, last_run_ts: Any = None) -> Tuple[str, datetime]:
+    """
+    Decide the fill type and start time of a sync.
+
+    The committed watermark in Postgres wins. If Postgres cannot be read, the payload's
+    last_run_ts is used instead, and with neither the connection is backfilled.
+
+    Args:
+        connected_id: The connection being synced
+        last_run_ts: The watermark the workflow was started with, if any
+
+    Returns:
+        Tuple of (fill_type, start_time) where fill_type is "backfill" or "incremental"
+    """
+    try:
+        watermark = await get_watermark(connected_id)
+    except Exception as e:
+        logging.warning(f"Could not read the watermark for {connected_id}, using the workflow payload: {e}")
+        watermark = None
+    watermark = watermark or parse_watermark(last_run_ts)
+    if watermark is None:
+        return "backfill", backfill_start()
+    return "incremental", watermark - _overlap()
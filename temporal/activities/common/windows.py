@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+
+def split_time_window(
+    start_time: datetime,
+    end_time: datetime,
+    slices: int,
+    resolution: timedelta = timedelta(minutes=1)
+) -> List[Tuple[datetime, datetime]]:
+    """
+    Split [start_time, end_time) into contiguous, non-overlapping slices.
+
+    Boundaries are rounded down to `resolution` so they survive APIs that only
+    filter at that precision (Shopify's search syntax is minute precision here).
+
+    Args:
+        start_time: Inclusive start of the window
+        end_time: Exclusive end of the window
+        slices: Maximum number of slices to return
+        resolution: Granularity the slice boundaries are aligned to
+
+    Returns:
+        List of (slice_start, slice_end) tuples covering the whole window in order
+    """
+    if slices <= 1 or end_time <= start_time:
+        return [(start_time, end_time)]
+    step = (end_time - start_time) / slices
+    boundaries = [start_time]
+    for i in range(1, slices):
+        boundary = start_time + step * i
+        boundary = boundary - (boundary - datetime.min.replace(tzinfo=boundary.tzinfo)) % resolution
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    boundaries.append(end_time)
+    return list(zip(boundaries[:-1], boundaries[1:]))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+from temporalio import workflow
+from temporalio.common import RetryPolicy
+from temporal.activities.common.maintenance import optimize_partitions, OptimizePayload, OptimizeRequest
+
+@workflow.defn
+class ClickHouseOptimizeWorkflow:
+    """Merges the busiest partitions of each ReplacingMergeTree orders table, one table at a time."""
+
+    @workflow.run
+    async def run(self, request: OptimizeRequest):
+        logger = workflow.logger
+        optimized = 0
+        for table in request.tables:
+            try:
+                optimized += await workflow.execute_activity(
+                    optimize_partitions, OptimizePayload(table=table, max_partitions=request.max_partitions, min_parts=request.min_parts),
+                    retry_policy=RetryPolicy(maximum_attempts=3),start_to_close_timeout=timedelta(hours=2),heartbeat_timeout=timedelta(minutes=2)
+                )
+            except Exception as e:
+                logger.error(f"Optimize failed for table {table}: {str(e)}")
+        return {"status": "success", "code": 200, "message": f"Optimized {optimized} partitions"}
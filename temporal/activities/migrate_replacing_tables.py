@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import sys
+from temporal.activities.common.clickhouse import open_clickhouse_pool, close_clickhouse_pool
+from temporal.activities.common.migrations import run_migration
+from temporal.activities.common.postgres import close_postgres_pool
+from temporal.activities.Shopify.activities import SHOPIFY_ORDERS_TABLE
+from temporal.activities.Shopify.src.loading import load_mode, resolve_table as resolve_shopify_table
+from temporal.activities.Amazon.activities import AMAZON_ORDERS_TABLE
+from temporal.activities.Amazon.src.loading import resolve_table as resolve_amazon_table
+
+'''
+@docs
+Fills the ReplacingMergeTree orders tables with the history of the original tables, once.
+
+    CLICKHOUSE_LOAD_MODE=replacing python -m temporal.activities.migrate_replacing_tables
+
+Workers in replacing mode only create the tables, so they start polling right away and load
+new syncs into them. Run this once per environment, before reads move to the new tables. The
+copy of each table is recorded in etl-migrations and skipped by later runs. An interrupted
+copy runs again in full; the rows it copies twice, like rows a sync loaded meanwhile, collapse
+to one version when the partitions merge.
+'''
+
+TABLES = [(SHOPIFY_ORDERS_TABLE, resolve_shopify_table), (AMAZON_ORDERS_TABLE, resolve_amazon_table)]
+
+
+async def main():
+    if load_mode() != "replacing":
+        sys.exit("Set CLICKHOUSE_LOAD_MODE=replacing to migrate into the ReplacingMergeTree tables")
+    clickhouse_client = await open_clickhouse_pool()
+    try:
+        for source_table, resolve_table in TABLES:
+            table = await resolve_table(clickhouse_client, source_table)
+
+            async def copy(source_table=source_table, table=table):
+                logging.info(f"Copying {source_table} into ReplacingMergeTree table {table}")
+                await clickhouse_client.command(f"INSERT INTO {table} SELECT * FROM {source_table}")
+
+            await run_migration(f"replacing-copy:{table}", copy)
+    finally:
+        await close_clickhouse_pool()
+        await close_postgres_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+from temporalio.client import Client
+from temporalio.worker import Worker
+import asyncio
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import sentry_sdk
+import logging
+from temporal.activities.Shopify.workflows import ShopifyETLWorkflow, ShopifyFanOutWorkflow
+from temporal.activities.Shopify.activities import shopify, shopify_chunk, shopify_reconcile
+from temporal.activities.Amazon.workflows import AmazonETLWorkflow, AmazonFanOutWorkflow
+from temporal.activities.Amazon.activities import amazon, amazon_chunk, amazon_reconcile
+# The interceptors are platform agnostic, the platform is read from each activity's module
+from temporal.activities.Shopify.interceptor import MetricsInterceptor, SentryInterceptor, TenantConcurrencyInterceptor
+from temporal.activities.common.http_client import close_http_client
+from temporal.activities.common.clickhouse import open_clickhouse_pool, close_clickhouse_pool
+from temporal.activities.common.postgres import close_postgres_pool
+from temporal.activities.common.metrics import start_metrics_server
+from temporal.activities.common.executor import shutdown_transform_executor
+from temporal.activities.common.task_queues import BACKFILL_TASK_QUEUE, ETL_TASK_QUEUE
+from temporal.activities.common.workflows import ClickHouseOptimizeWorkflow
+from temporal.activities.common.maintenance import optimize_partitions
+from temporal.activities.common.sync_plan import plan_sync
+from temporal.activities.common.schedules import ensure_optimize_schedule
+from temporal.activities.Shopify.activities import SHOPIFY_ORDERS_TABLE
+from temporal.activities.Shopify.src.loading import load_mode, replacing_table_name
+from temporal.activities.Amazon.activities import AMAZON_ORDERS_TABLE
+
+'''
+@docs
+Single worker for every platform. One process registers the Shopify and Amazon workflows and
+activities and shares one Temporal connection, HTTP pool, ClickHouse pool and Postgres pool between them,
+instead of one process per platform each holding its own. It is the only worker entry point:
+every worker polling the shared task queues must know every workflow and activity, or a task
+picked up by a worker of the other platform fails as not registered.
+
+    python -m temporal.activities.run_worker
+
+ETL_WORKER_PROCESSES=N (or "auto" for one per core) starts N independent event loops on the host
+so CPU-heavy transformation is not limited to one core. Each process polls the same task queues
+with its own slots and pools, and serves metrics on METRICS_PORT + its index.
+
+Sentry Interceptor Implementation - https://github.com/temporalio/samples-python/blob/2cb0fdde7ede72edf4b40cf8b5440158d9d2234e/sentry/worker.py
+'''
+
+WORKFLOWS = [ShopifyETLWorkflow, ShopifyFanOutWorkflow, AmazonETLWorkflow, AmazonFanOutWorkflow, ClickHouseOptimizeWorkflow]
+ACTIVITIES = [shopify, shopify_chunk, shopify_reconcile, amazon, amazon_chunk, amazon_reconcile, optimize_partitions, plan_sync]
+
+
+async def main(process_index: int = 0):
+    sentry_sdk.init(
+    dsn="https://d481b0142ed67da2de56d4b6dde84833@o4507200177307648.ingest.us.sentry.io/4509149419995136",
+    # Add data like request headers and IP for users,
+    # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
+    send_default_pii=True,
+    )
+    api_key = os.environ.get("TEMPORAL_API_KEY")
+    logging.info(f"Starting worker process {process_index}")
+    client = await Client.connect(
+    "us-west1.gcp.api.temporal.io:7233",
+    namespace="grippi-etl.bnvm9",
+    rpc_metadata={"temporal-namespace": "grippi-etl.bnvm9"},
+    api_key=api_key,
+    tls=True,
+    )
+    # Expose per-stage and per-tenant metrics for Prometheus to scrape, one port per process
+    start_metrics_server(int(os.environ.get("METRICS_PORT", "9464")) + process_index)
+    # Connect to ClickHouse once, shared by every activity of both platforms
+    await open_clickhouse_pool()
+    # Merge the ReplacingMergeTree tables on CLICKHOUSE_OPTIMIZE_CRON
+    if load_mode() == "replacing":
+        await ensure_optimize_schedule(client, [replacing_table_name(SHOPIFY_ORDERS_TABLE), replacing_table_name(AMAZON_ORDERS_TABLE)])
+    # Incremental syncs and backfills get separate slot pools, and one tenant can only hold a few slots of either
+    max_concurrent_activities = int(os.environ.get("WORKER_MAX_CONCURRENT_ACTIVITIES", "100"))
+    max_concurrent_backfills = int(os.environ.get("WORKER_MAX_CONCURRENT_BACKFILLS", "4"))
+    interceptors = [SentryInterceptor(), TenantConcurrencyInterceptor(), MetricsInterceptor()]
+    workers = [Worker(
+        client, task_queue=ETL_TASK_QUEUE, workflows=WORKFLOWS, activities=ACTIVITIES, interceptors=interceptors,
+        max_concurrent_activities=max_concurrent_activities
+    )]
+    # Set WORKER_MAX_CONCURRENT_BACKFILLS=0 on hosts that should only serve incremental syncs
+    if max_concurrent_backfills > 0:
+        workers.append(Worker(
+            client, task_queue=BACKFILL_TASK_QUEUE, activities=ACTIVITIES, interceptors=interceptors,
+            max_concurrent_activities=max_concurrent_backfills
+        ))
+    logging.info(f"Worker process {process_index} started")
+    try:
+        await asyncio.gather(*[worker.run() for worker in workers])
+    finally:
+        await close_http_client()
+        await close_clickhouse_pool()
+        # Also writes any watermark updates still waiting for their batch
+        await close_postgres_pool()
+        shutdown_transform_executor()
+    logging.info(f"Worker process {process_index} stopped")
+
+
+def _run_process(process_index: int):
+    asyncio.run(main(process_index))
+
+
+def _process_count() -> int:
+    processes = os.environ.get("ETL_WORKER_PROCESSES", "1")
+    if processes == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(processes))
+
+
+def run():
+    processes = _process_count()
+    if processes == 1:
+        _run_process(0)
+        return
+    # Spawned, not forked, so no event loop, client or pool state is inherited from the parent
+    context = multiprocessing.get_context("spawn")
+    children = [context.Process(target=_run_process, args=(i,), name=f"etl-worker-{i}") for i in range(processes)]
+    for child in children:
+        child.start()
+    logging.info(f"Started {processes} worker processes")
+    try:
+        # Stop the whole group as soon as any process exits so the supervisor restarts it cleanly
+        wait([child.sentinel for child in children])
+        for child in children:
+            if child.exitcode not in (None, 0):
+                raise Exception(f"Worker process {child.name} exited with code {child.exitcode}")
+    finally:
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+        for child in children:
+            child.join()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from temporal.activities.Amazon.src import auth, extraction
+from temporal.activities.Amazon.src.auth import TokenCache
+from temporal.activities.Amazon.src.extraction import AmazonClient
+from temporal.activities.Amazon.src.types import AmazonOrderRequest
+
+# The client's backoff sleeps are skipped, the fake server still yields with the real one
+_yield = asyncio.sleep
+
+
+class FakeBucket:
+
+    async def acquire(self):
+        return 0.0
+
+    def update(self, rate_limit):
+        pass
+
+    def throttled(self):
+        pass
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.headers = {}
+        self.body = body or {}
+        self.text = str(self.body)
+
+    def json(self):
+        return self.body
+
+
+class FakeHttpClient:
+    """Answers each GET with the next scripted status code, and 200 once the script runs out."""
+
+    def __init__(self):
+        self.status_codes = []
+        self.tokens = []
+
+    async def get(self, url, headers=None, params=None):
+        self.tokens.append(headers["x-amz-access-token"])
+        status_code = self.status_codes.pop(0) if self.status_codes else 200
+        # Let the other requests go out before this one is answered
+        await _yield(0)
+        if status_code != 200:
+            return FakeResponse(status_code)
+        if url.endswith("/orderItems"):
+            return FakeResponse(200, {"payload": {"OrderItems": [{"OrderItemId": url}]}})
+        return FakeResponse(200, {"payload": {"Orders": [{"AmazonOrderId": "1"}]}})
+
+
+@pytest.fixture
+def http_client(monkeypatch):
+    http_client = FakeHttpClient()
+    access_tokens = []
+
+    async def get_http_client():
+        return http_client
+
+    async def request_access_token(token_url, client_id, client_secret, refresh_token):
+        access_tokens.append(f"access-{len(access_tokens) + 1}")
+        return access_tokens[-1], 3600
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(extraction, "get_http_client", get_http_client)
+    monkeypatch.setattr(extraction, "get_bucket", lambda *key: FakeBucket())
+    monkeypatch.setattr(extraction, "restricted_data_enabled", lambda: False)
+    monkeypatch.setattr(extraction.asyncio, "sleep", no_sleep)
+    monkeypatch.setattr(auth, "_access_tokens", TokenCache())
+    monkeypatch.setattr(auth, "request_access_token", request_access_token)
+    http_client.access_tokens = access_tokens
+    return http_client
+
+
+@pytest.fixture
+def client():
+    return AmazonClient(AmazonOrderRequest(refresh_token="refresh", client_secret="secret", region="US", fill_type="backfill"))
+
+
+def test_order_pages_raise_when_retries_run_out(client, http_client):
+    http_client.status_codes = [429, 429, 429]
+    pages = []
+
+    async def run():
+        async for page in client.iter_order_pages(created_after=extraction.datetime(2025, 1, 1)):
+            pages.append(page)
+
+    with pytest.raises(Exception, match="Last status code: 429"):
+        asyncio.run(run())
+    assert pages == []
+
+
+def test_order_items_raise_when_retries_run_out(client, http_client):
+    http_client.status_codes = [503, 503, 503]
+    with pytest.raises(Exception, match="Last status code: 503"):
+        asyncio.run(client.get_order_items("111-1"))
+
+
+def test_rejected_token_is_refreshed_once_for_concurrent_requests(client, http_client):
+    http_client.status_codes = [403]
+
+    async def run():
+        return await asyncio.gather(*[client.get_order_items(f"111-{i}") for i in range(4)])
+
+    items = asyncio.run(run())
+    assert [len(order_items) for order_items in items] == [1, 1, 1, 1]
+    # Requests that failed with, or still carried, the replaced token do not refresh it again
+    assert http_client.access_tokens == ["access-1", "access-2"]
+    assert http_client.tokens[-1] == "access-2"
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from temporal.activities.Amazon.src import auth
+from temporal.activities.Amazon.src.auth import RestrictedDataTokenError, TokenCache
+
+
+def test_token_cache_shares_one_refresh_between_concurrent_callers():
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        await asyncio.sleep(0.01)
+        return f"token-{len(fetches)}", 3600
+
+    async def run():
+        cache = TokenCache()
+        return await asyncio.gather(*[cache.get("seller", fetch) for _ in range(5)])
+
+    assert asyncio.run(run()) == ["token-1"] * 5
+    assert len(fetches) == 1
+
+
+def test_token_cache_only_drops_the_rejected_token():
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        return f"token-{len(fetches)}", 3600
+
+    async def run():
+        cache = TokenCache()
+        first = await cache.get("seller", fetch)
+        cache.invalidate("seller", first)
+        second = await cache.get("seller", fetch)
+        # A request that failed with the already replaced token must not force another refresh
+        cache.invalidate("seller", first)
+        return first, second, await cache.get("seller", fetch)
+
+    assert asyncio.run(run()) == ("token-1", "token-2", "token-2")
+    assert len(fetches) == 2
+
+
+def test_token_cache_raises_when_there_is_no_token_to_fall_back_on():
+    async def fetch():
+        raise ConnectionError("token endpoint down")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(TokenCache().get("seller", fetch))
+
+
+@pytest.fixture
+def restricted_tokens(monkeypatch):
+    monkeypatch.setattr(auth, "_restricted_tokens", TokenCache())
+    monkeypatch.setattr(auth, "_restricted_unavailable", {})
+    responses = []
+
+    async def request_restricted_data_token(endpoint, access_token):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response, 3600
+
+    monkeypatch.setattr(auth, "request_restricted_data_token", request_restricted_data_token)
+    return responses
+
+
+def get_restricted_data_token():
+    return asyncio.run(auth.get_restricted_data_token("client", "refresh", "https://sellingpartnerapi-na.amazon.com", "access"))
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 403])
+def test_denied_restricted_data_token_falls_back_to_the_access_token(restricted_tokens, status_code):
+    restricted_tokens.append(RestrictedDataTokenError(status_code, "not authorized"))
+    assert get_restricted_data_token() is None
+    # Not requested again until RESTRICTED_DATA_RETRY_SECONDS passed
+    assert get_restricted_data_token() is None
+    assert restricted_tokens == []
+
+
+@pytest.mark.parametrize("status_code", [429, 500, 503])
+def test_throttled_or_failed_restricted_data_token_is_raised(restricted_tokens, status_code):
+    restricted_tokens.extend([RestrictedDataTokenError(status_code, "try again"), "rdt"])
+    with pytest.raises(RestrictedDataTokenError):
+        get_restricted_data_token()
+    # The retried request gets the token instead of going out without it
+    assert get_restricted_data_token() == "rdt"
@@ -0,0 +1,125 @@
+import asyncio
+import contextlib
+import time
+import pytest
+from temporal.activities.common import digests
+from temporal.activities.common.digests import DigestIndex, order_digest
+
+
+class FakeCursor:
+
+    def __init__(self, row=None):
+        self.row = row
+
+    async def fetchone(self):
+        return self.row
+
+
+class FakeConnection:
+    """Serves the etl-order-digests statements from a dict of connected_id -> bytea."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def execute(self, query, params=None):
+        query = query.as_string(None)
+        if query.startswith("INSERT"):
+            self.rows.setdefault(params[0], params[1])
+        elif query.startswith("SELECT"):
+            return FakeCursor((self.rows[params[0]],) if params[0] in self.rows else None)
+        elif query.startswith("UPDATE"):
+            self.rows[params[1]] = params[0]
+        return FakeCursor()
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class FakePool:
+
+    def __init__(self):
+        self.rows = {}
+        self.fail = False
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        if self.fail:
+            raise ConnectionError("postgres unavailable")
+        yield FakeConnection(self.rows)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+
+    async def get_postgres_pool():
+        return pool
+
+    monkeypatch.setattr(digests, "get_postgres_pool", get_postgres_pool)
+    monkeypatch.setattr(digests, "_table_ready", True)
+    return pool
+
+
+def stored(pool, connected_id):
+    return dict(digests._ENTRY.iter_unpack(pool.rows[connected_id]))
+
+
+def load(connected_id="shop"):
+    return asyncio.run(DigestIndex.load(connected_id, "id", "updatedAt"))
+
+
+def test_unchanged_orders_are_skipped_only_after_commit(pool):
+    order = {"id": "1", "updatedAt": "2025-01-01T00:00:00Z"}
+    index = load()
+    assert index.filter([order]) == [order]
+    # Not committed, e.g. the load was never confirmed, so the next sync loads it again
+    assert load().filter([order]) == [order]
+    assert asyncio.run(index.commit())
+    assert load().filter([order]) == []
+    assert load().filter([{**order, "updatedAt": "2025-01-02T00:00:00Z"}]) != []
+
+
+def test_orders_repeated_within_a_sync_are_staged_once(pool):
+    order = {"id": "1", "updatedAt": "2025-01-01T00:00:00Z"}
+    index = load()
+    assert index.filter([order, order]) == [order]
+    assert index.filter([order]) == []
+
+
+def test_commit_prunes_expired_digests(pool, monkeypatch):
+    monkeypatch.setenv("ORDER_DIGEST_RETENTION_HOURS", "1")
+    expired = order_digest("old", "v")
+    pool.rows["shop"] = digests._ENTRY.pack(expired, int(time.time()) - 7200)
+    index = load()
+    assert expired in index.known
+    index.filter([{"id": "new", "updatedAt": "v"}])
+    assert asyncio.run(index.commit())
+    assert list(stored(pool, "shop")) == [order_digest("new", "v")]
+
+
+def test_concurrent_commits_keep_each_others_digests(pool):
+    first, second = load(), load()
+    first.filter([{"id": "1", "updatedAt": "v"}])
+    second.filter([{"id": "2", "updatedAt": "v"}])
+    assert asyncio.run(first.commit())
+    assert asyncio.run(second.commit())
+    assert set(stored(pool, "shop")) == {order_digest("1", "v"), order_digest("2", "v")}
+
+
+def test_failed_commit_keeps_the_staged_digests(pool):
+    index = load()
+    index.filter([{"id": "1", "updatedAt": "v"}])
+    pool.fail = True
+    assert not asyncio.run(index.commit())
+    assert index.pending
+    pool.fail = False
+    assert asyncio.run(index.commit())
+    assert not index.pending
+    assert order_digest("1", "v") in stored(pool, "shop")
+
+
+def test_unreadable_index_loads_every_order(pool):
+    pool.fail = True
+    order = {"id": "1", "updatedAt": "v"}
+    assert load().filter([order]) == [order]
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import types
+import pytest
+from temporal.activities.common import page_loading
+from temporal.activities.common.page_loading import load_order_pages
+
+
+@pytest.fixture
+def heartbeats(monkeypatch):
+    heartbeats = []
+    monkeypatch.setattr(page_loading, "activity", types.SimpleNamespace(heartbeat=heartbeats.append, logger=logging.getLogger(__name__)))
+    monkeypatch.setenv("ETL_TRANSFORM_PROCESSES", "0")
+    return heartbeats
+
+
+def transform(orders, connection_id, batchedAt):
+    return [[o["id"] for o in orders], [o["updatedAt"] for o in orders]], ["id", "updatedAt"], batchedAt
+
+
+def batch_dedup_token(connection_id, columns, column_names):
+    return f"{connection_id}:{','.join(columns[0])}"
+
+
+def advance(position, page_info):
+    position["cursor"] = page_info["endCursor"]
+
+
+async def pages(count, page_size=2):
+    for page in range(count):
+        orders = [{"id": f"{page}-{i}", "updatedAt": f"2025-01-0{page + 1}T00:00:00Z"} for i in range(page_size)]
+        yield orders, {"endCursor": f"c{page}"}
+
+
+def load(inserts, page_count, batch_rows, receipt=None):
+    async def insert_batch(client, table_name, columns, column_names, column_oriented=False, dedup_token=None, receipt=None):
+        inserts.append(list(columns[0]))
+        receipt.add_batch(len(columns[0]), len(columns[0]), columns[1], dedup_token)
+
+    return asyncio.run(load_order_pages(
+        pages(page_count), advance, {"cursor": None}, {"batchedAt": "2025-01-10T00:00:00+00:00"}, "shop",
+        None, "orders", transform, insert_batch, batch_dedup_token, batch_rows, receipt=receipt
+    ))
+
+
+def test_checkpoint_only_advances_once_the_buffer_is_loaded(heartbeats):
+    inserts = []
+    receipt = load(inserts, page_count=3, batch_rows=3)
+    assert [len(batch) for batch in inserts] == [4, 2]
+    # Page c0 is only buffered, so a retried attempt must not resume after it
+    assert [heartbeat["cursor"] for heartbeat in heartbeats] == [None, "c1", "c1", "c2"]
+    assert heartbeats[-1]["batchedAt"] == "2025-01-10T00:00:00+00:00"
+    assert heartbeats[1]["receipt"]["rows"] == 4
+    assert receipt.rows == 6
+    assert receipt.confirmed
+
+
+def test_resumed_load_carries_the_previous_receipt(heartbeats):
+    inserts = []
+    previous = load([], page_count=1, batch_rows=1).to_dict()
+    receipt = load(inserts, page_count=1, batch_rows=1, receipt=previous)
+    assert receipt.rows == 4
+    assert receipt.written_rows == 4
+
+
+def test_empty_extraction_loads_nothing(heartbeats):
+    inserts = []
+    receipt = load(inserts, page_count=0, batch_rows=3)
+    assert inserts == []
+    assert heartbeats == []
+    assert not receipt.confirmed
@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime, timezone
+from temporal.activities.common import postgres
+from temporal.activities.common.postgres import WatermarkBatcher
+
+
+def test_updates_submitted_during_a_flush_are_written_without_another_submit(monkeypatch):
+    batches = []
+
+    async def update_watermarks(watermarks):
+        batches.append(dict(watermarks))
+        if len(batches) == 1:
+            # The first batch is still writing when the second sync finishes
+            await asyncio.sleep(0.05)
+        return set(watermarks)
+
+    monkeypatch.setattr(postgres, "update_watermarks", update_watermarks)
+
+    async def run():
+        batcher = WatermarkBatcher(flush_interval=0.01)
+        now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        first = asyncio.create_task(batcher.submit("a", now, now))
+        await asyncio.sleep(0.03)
+        second = batcher.submit("b", now, now)
+        return await asyncio.wait_for(asyncio.gather(first, second), timeout=1)
+
+    assert asyncio.run(run()) == [True, True]
+    assert [list(batch) for batch in batches] == [["a"], ["b"]]
+
+
+def test_batch_keeps_the_newest_watermark_per_connection(monkeypatch):
+    batches = []
+
+    async def update_watermarks(watermarks):
+        batches.append(dict(watermarks))
+        return {"a"}
+
+    monkeypatch.setattr(postgres, "update_watermarks", update_watermarks)
+
+    async def run():
+        batcher = WatermarkBatcher(flush_interval=0.01)
+        older = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        newer = datetime(2025, 1, 2, tzinfo=timezone.utc)
+        return await asyncio.gather(batcher.submit("a", newer, newer), batcher.submit("a", older, older), batcher.submit("b", older, older))
+
+    assert asyncio.run(run()) == [True, True, False]
+    # Written as naive UTC, the log's column type
+    assert batches == [{"a": (datetime(2025, 1, 2), datetime(2025, 1, 2)), "b": (datetime(2025, 1, 1), datetime(2025, 1, 1))}]
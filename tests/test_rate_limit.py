@@ -0,0 +1,97 @@
+import asyncio
+import types
+import pytest
+from temporal.activities.Amazon.src import rate_limit as spapi
+from temporal.activities.Amazon.src.rate_limit import SPAPITokenBucket
+from temporal.activities.Shopify.src import rate_limit as shopify
+from temporal.activities.Shopify.src.rate_limit import ShopifyCostBucket
+
+
+class FakeClock:
+    """monotonic() that only moves when the buckets sleep, recording every sleep."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    for module in (shopify, spapi):
+        monkeypatch.setattr(module, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+        monkeypatch.setattr(module, "asyncio", types.SimpleNamespace(sleep=clock.sleep, Lock=asyncio.Lock))
+    return clock
+
+
+def test_shopify_bucket_sleeps_only_for_the_missing_points(clock):
+    bucket = ShopifyCostBucket(maximum_available=100, restore_rate=50)
+
+    async def run():
+        assert await bucket.acquire(80) == 80
+        await bucket.acquire(80)
+
+    asyncio.run(run())
+    # 20 points left, 60 more restore at 50 per second
+    assert clock.sleeps == [pytest.approx(1.2)]
+    assert bucket.currently_available == pytest.approx(0, abs=1e-6)
+
+
+def test_shopify_bucket_adopts_the_servers_throttle_status(clock):
+    bucket = ShopifyCostBucket()
+
+    async def run():
+        reserved = await bucket.acquire()
+        bucket.update({
+            "requestedQueryCost": 120,
+            "actualQueryCost": 40,
+            "throttleStatus": {"maximumAvailable": 2000, "currentlyAvailable": 500, "restoreRate": 100},
+        }, reserved)
+
+    asyncio.run(run())
+    assert bucket.maximum_available == 2000
+    assert bucket.restore_rate == 100
+    assert bucket.query_cost == 120
+    # The refund of the unused reservation never lifts the bucket above the server's figure
+    assert bucket.currently_available == 500
+
+
+def test_shopify_bucket_caps_cost_at_the_maximum(clock):
+    bucket = ShopifyCostBucket(maximum_available=100, restore_rate=50)
+    assert asyncio.run(bucket.acquire(500)) == 100
+    assert clock.sleeps == []
+
+
+def test_spapi_bucket_spends_the_burst_then_waits_one_restore_interval(clock):
+    bucket = SPAPITokenBucket(rate=0.5, burst=2)
+
+    async def run():
+        for _ in range(3):
+            await bucket.acquire()
+
+    asyncio.run(run())
+    assert clock.sleeps == [pytest.approx(2.0)]
+
+
+def test_spapi_bucket_drains_on_429_and_adopts_the_rate_header(clock):
+    bucket = SPAPITokenBucket(rate=0.5, burst=30)
+    bucket.throttled()
+    bucket.update("2.0")
+    bucket.update("not a rate")
+    asyncio.run(bucket.acquire())
+    assert bucket.rate == 2.0
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_buckets_are_shared_per_seller_region_and_operation():
+    assert spapi.get_bucket("seller", "US", "getOrders") is spapi.get_bucket("seller", "US", "getOrders")
+    assert spapi.get_bucket("seller", "US", "getOrders") is not spapi.get_bucket("seller", "US", "getOrderItems")
+    assert spapi.get_bucket("seller", "US", "getOrderItems").rate == spapi.DEFAULT_RATES["getOrderItems"][0]
+    assert shopify.get_bucket("a.myshopify.com") is shopify.get_bucket("a.myshopify.com")
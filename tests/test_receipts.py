@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+from temporal.activities.common.receipts import LoadReceipt
+
+
+def test_fully_written_batch_is_confirmed():
+    receipt = LoadReceipt()
+    receipt.add_batch(2, 2, ["2025-01-01T10:00:00Z", "2025-01-02T10:00:00+00:00"], dedup_token="t1")
+    assert receipt.confirmed
+    assert receipt.incomplete_batches == 0
+    assert receipt.watermark == datetime(2025, 1, 2, 10, tzinfo=timezone.utc)
+
+
+def test_zero_row_receipt_is_not_confirmed():
+    receipt = LoadReceipt()
+    assert not receipt.confirmed
+    receipt.add_batch(0, 0, [])
+    assert not receipt.confirmed
+    assert receipt.watermark is None
+
+
+def test_deduplicated_batch_counts_as_written():
+    receipt = LoadReceipt()
+    receipt.add_batch(3, 3, ["2025-01-01T00:00:00Z"], dedup_token="t1")
+    # A retried attempt re-inserts the same block and ClickHouse drops it
+    receipt.add_batch(3, 0, ["2025-01-01T00:00:00Z"], dedup_token="t1")
+    assert receipt.deduplicated_batches == 1
+    assert receipt.incomplete_batches == 0
+    assert receipt.confirmed
+
+
+def test_unwritten_batch_without_token_is_incomplete():
+    receipt = LoadReceipt()
+    receipt.add_batch(3, 0, ["2025-01-01T00:00:00Z"])
+    assert receipt.deduplicated_batches == 0
+    assert receipt.incomplete_batches == 1
+    assert not receipt.confirmed
+
+
+def test_partially_written_batch_is_incomplete():
+    receipt = LoadReceipt()
+    receipt.add_batch(3, 2, ["2025-01-01T00:00:00Z"], dedup_token="t1")
+    assert receipt.incomplete_batches == 1
+    assert not receipt.confirmed
+
+
+def test_naive_versions_are_utc():
+    receipt = LoadReceipt()
+    receipt.add_batch(1, 1, [datetime(2025, 1, 1, 12)])
+    receipt.advance("2025-01-01T13:00:00+02:00")
+    assert receipt.watermark == datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def test_merge_round_trips_chunk_results():
+    first = LoadReceipt()
+    first.add_batch(2, 2, ["2025-01-01T00:00:00Z"])
+    second = LoadReceipt()
+    second.add_batch(1, 0, ["2025-01-03T00:00:00Z"], dedup_token="t2")
+    merged = LoadReceipt.merge([first.to_dict(), second.to_dict(), 4])
+    assert merged.rows == 7
+    assert merged.written_rows == 6
+    assert merged.deduplicated_batches == 1
+    assert merged.watermark == datetime(2025, 1, 3, tzinfo=timezone.utc)
+    assert merged.confirmed
@@ -0,0 +1,91 @@
+import asyncio
+import contextlib
+import json
+from datetime import datetime, timezone
+import pytest
+from temporal.activities.Shopify.src import extraction
+from temporal.activities.Shopify.src.extraction import ShopifyClient
+
+
+def order(number):
+    return {"id": f"gid://shopify/Order/{number}", "name": f"#{number}"}
+
+
+def line_item(number, order_number):
+    return {"id": f"gid://shopify/LineItem/{number}", "__parentId": f"gid://shopify/Order/{order_number}"}
+
+
+class FakeResponse:
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def raise_for_status(self):
+        pass
+
+    async def aiter_lines(self):
+        for line in self.lines:
+            yield line
+
+
+class FakeHttpClient:
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, url):
+        yield FakeResponse(self.lines)
+
+
+@pytest.fixture
+def bulk_file(monkeypatch):
+    lines = []
+
+    async def get_http_client():
+        return FakeHttpClient(lines)
+
+    monkeypatch.setattr(extraction, "get_http_client", get_http_client)
+    return lines
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = ShopifyClient("bench.myshopify.com", "token", "window", datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 2, 1, tzinfo=timezone.utc))
+
+    async def get_bulk_operation(bulk_operation_id):
+        return {"id": bulk_operation_id, "status": "COMPLETED", "url": "https://storage.example/bulk.jsonl"}
+
+    monkeypatch.setattr(client, "get_bulk_operation", get_bulk_operation)
+    return client
+
+
+def collect(iterator):
+    async def run():
+        return [item async for item in iterator]
+    return asyncio.run(run())
+
+
+def test_line_items_are_nested_under_their_parent_order(client, bulk_file):
+    bulk_file.extend(json.dumps(line) for line in [
+        order(1), line_item(11, 1), line_item(12, 1),
+        order(2),
+        order(3), line_item(31, 3),
+    ])
+    bulk_file.insert(3, "")
+    orders = collect(client._iter_bulk_orders("https://storage.example/bulk.jsonl"))
+    assert [o["id"] for o in orders] == [order(n)["id"] for n in (1, 2, 3)]
+    assert [edge["node"]["id"] for edge in orders[0]["lineItems"]["edges"]] == ["gid://shopify/LineItem/11", "gid://shopify/LineItem/12"]
+    assert orders[1]["lineItems"] == {"edges": []}
+    assert "__parentId" not in orders[2]["lineItems"]["edges"][0]["node"]
+
+
+def test_pages_report_orders_read_and_resume_after_skip(client, bulk_file):
+    bulk_file.extend(json.dumps(line) for n in range(1, 6) for line in (order(n), line_item(n * 10, n)))
+    pages = collect(client.iter_bulk_order_pages("gid://shopify/BulkOperation/1", first=2))
+    assert [[o["name"] for o in orders] for orders, _ in pages] == [["#1", "#2"], ["#3", "#4"], ["#5"]]
+    assert [progress["ordersRead"] for _, progress in pages] == [2, 4, 5]
+
+    resumed = collect(client.iter_bulk_order_pages("gid://shopify/BulkOperation/1", skip=pages[0][1]["ordersRead"], first=2))
+    assert [[o["name"] for o in orders] for orders, _ in resumed] == [["#3", "#4"], ["#5"]]
+    assert [progress["ordersRead"] for _, progress in resumed] == [4, 5]
@@ -0,0 +1,36 @@
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from temporalio.testing import ActivityEnvironment
+from temporal.activities.common import watermarks
+from temporal.activities.common.sync_plan import SyncPlan, SyncPlanRequest, plan_sync
+
+
+@pytest.fixture
+def stored_watermark(monkeypatch):
+    stored = {}
+
+    async def get_watermark(connected_id):
+        return stored.get(connected_id)
+
+    monkeypatch.setattr(watermarks, "get_watermark", get_watermark)
+    monkeypatch.setenv("WATERMARK_OVERLAP_MINUTES", "10")
+    return stored
+
+
+def run_plan_sync(request):
+    return asyncio.run(ActivityEnvironment().run(plan_sync, request))
+
+
+def test_committed_watermark_routes_an_incremental_sync(stored_watermark):
+    stored_watermark["shop"] = datetime(2025, 4, 6, 18, 30, tzinfo=timezone.utc)
+    # The payload's last_run_ts is stale, the committed watermark wins
+    plan = run_plan_sync(SyncPlanRequest(connected_id="shop", last_run_ts="2025-01-01 00:00:00"))
+    assert plan == SyncPlan(fill_type="incremental", start_time="2025-04-06T18:20:00+00:00")
+    assert not plan.is_backfill
+
+
+def test_connection_without_watermark_is_backfilled(stored_watermark):
+    plan = run_plan_sync(SyncPlanRequest(connected_id="new-shop"))
+    assert plan.is_backfill
+    assert datetime.fromisoformat(plan.start_time) == watermarks.backfill_start()
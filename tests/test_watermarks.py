@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from temporal.activities.common import watermarks
+
+
+def test_backfill_start_is_the_start_of_the_previous_month():
+    assert watermarks.backfill_start(datetime(2025, 5, 17, 9, 30, tzinfo=timezone.utc)) == datetime(2025, 4, 1, tzinfo=timezone.utc)
+
+
+def test_backfill_start_in_january_is_december_of_the_previous_year():
+    assert watermarks.backfill_start(datetime(2025, 1, 1, 0, 5, tzinfo=timezone.utc)) == datetime(2024, 12, 1, tzinfo=timezone.utc)
+
+
+def test_backfill_start_takes_naive_now_as_utc():
+    assert watermarks.backfill_start(datetime(2025, 3, 1)) == datetime(2025, 2, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def stored_watermark(monkeypatch):
+    stored = {}
+
+    async def get_watermark(connected_id):
+        if "error" in stored:
+            raise stored["error"]
+        return stored.get(connected_id)
+
+    monkeypatch.setattr(watermarks, "get_watermark", get_watermark)
+    return stored
+
+
+def test_resolve_start_overlaps_the_committed_watermark(stored_watermark, monkeypatch):
+    monkeypatch.setenv("WATERMARK_OVERLAP_MINUTES", "15")
+    stored_watermark["shop"] = datetime(2025, 4, 6, 18, 30, tzinfo=timezone.utc)
+    fill_type, start = asyncio.run(watermarks.resolve_start("shop", "2025-01-01 00:00:00"))
+    assert fill_type == "incremental"
+    assert start == datetime(2025, 4, 6, 18, 15, tzinfo=timezone.utc)
+
+
+def test_resolve_start_falls_back_to_the_payload(stored_watermark):
+    stored_watermark["error"] = RuntimeError("postgres unavailable")
+    fill_type, start = asyncio.run(watermarks.resolve_start("shop", "2025-04-06 18:27:10"))
+    assert fill_type == "incremental"
+    assert start == datetime(2025, 4, 6, 18, 17, 10, tzinfo=timezone.utc)
+
+
+def test_resolve_start_backfills_without_a_watermark(stored_watermark, monkeypatch):
+    monkeypatch.setattr(watermarks, "backfill_start", lambda: datetime(2024, 12, 1, tzinfo=timezone.utc))
+    assert asyncio.run(watermarks.resolve_start("shop")) == ("backfill", datetime(2024, 12, 1, tzinfo=timezone.utc))
+
+
+def test_remembered_watermark_never_moves_backwards():
+    watermarks.remember_watermark("remembered", datetime(2025, 4, 6, tzinfo=timezone.utc))
+    watermarks.remember_watermark("remembered", "2025-04-05 00:00:00")
+    assert asyncio.run(watermarks.get_watermark("remembered")) == datetime(2025, 4, 6, tzinfo=timezone.utc)
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+from temporal.activities.common.windows import split_time_window
+
+
+def test_slices_cover_the_window_without_gaps():
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    end = datetime(2025, 1, 29, 7, 13, 42, tzinfo=timezone.utc)
+    slices = split_time_window(start, end, 4)
+    assert len(slices) == 4
+    assert slices[0][0] == start
+    assert slices[-1][1] == end
+    for (_, previous_end), (next_start, _) in zip(slices, slices[1:]):
+        assert previous_end == next_start
+
+
+def test_inner_boundaries_are_aligned_to_the_resolution():
+    start = datetime(2025, 1, 1, 0, 0, 17)
+    end = datetime(2025, 1, 1, 1, 0, 53)
+    for slice_start, _ in split_time_window(start, end, 7)[1:]:
+        assert slice_start.second == 0 and slice_start.microsecond == 0
+
+
+def test_short_windows_collapse_to_fewer_slices():
+    start = datetime(2025, 1, 1, 0, 0)
+    end = start + timedelta(minutes=2)
+    slices = split_time_window(start, end, 10)
+    assert slices == [(start, start + timedelta(minutes=1)), (start + timedelta(minutes=1), end)]
+
+
+def test_single_slice_and_empty_window():
+    start = datetime(2025, 1, 1)
+    end = datetime(2025, 1, 2)
+    assert split_time_window(start, end, 1) == [(start, end)]
+    assert split_time_window(end, start, 5) == [(end, start)]